@@ -0,0 +1,122 @@
+# aggregation.py
+"""
+Motor de agregación vectorizado (NumPy) para series crudas de un sensor.
+
+A partir de arrays de timestamps (epoch UTC, ordenados) y valores calcula en una sola
+pasada, por hora/día/mes/año: media, mínimo, máximo, conteo, desviación y percentiles.
+Sirve para reemplazar o respaldar los endpoints de rollup de OpenAQ
+(/hours, /days, /days/monthly, /days/yearly).
+"""
+import numpy as np
+
+
+PERIODS = ("hour", "day", "month", "year")
+DEFAULT_PERCENTILES = (2, 25, 50, 75, 98)
+
+# agg del frontend / tipo de la ruta de compatibilidad -> periodo
+AGG_PERIODS = {
+    "hours": "hour",
+    "days": "day",
+    "monthly": "month",
+    "months": "month",
+    "yearly": "year",
+    "years": "year",
+}
+
+_UNITS = {"hour": "h", "day": "D", "month": "M", "year": "Y"}
+
+
+def _buckets(ts, period):
+    """Devuelve (clave de bucket por fila, inicio epoch del bucket siguiente a cada clave única)."""
+    if period == "hour":
+        return ts // 3600 * 3600, 3600
+    if period == "day":
+        return ts // 86400 * 86400, 86400
+    # meses/años: calendario real vía datetime64
+    b = ts.astype("datetime64[s]").astype(f"datetime64[{_UNITS[period]}]")
+    return b.astype("datetime64[s]").astype(np.int64), None
+
+
+def aggregate(ts, values, period, percentiles=DEFAULT_PERCENTILES):
+    """
+    ts: array de epoch UTC (segundos), values: array de floats (NaN = sin dato).
+    Devuelve dict de arrays alineados: start, end, count, mean, min, max, sd y p{q} por percentil.
+    """
+    if period not in PERIODS:
+        raise ValueError(f"periodo inválido: {period}")
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    ok = ~np.isnan(values)
+    ts, values = ts[ok], values[ok]
+    out = {k: np.empty(0) for k in ("start", "end", "count", "mean", "min", "max", "sd")}
+    out.update({f"p{q}": np.empty(0) for q in percentiles})
+    if ts.size == 0:
+        return out
+
+    keys, width = _buckets(ts, period)
+    # orden por (bucket, valor): los grupos quedan contiguos y ordenados por dentro para los percentiles
+    order = np.lexsort((values, keys))
+    keys, v = keys[order], values[order]
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    counts = np.diff(np.r_[starts, keys.size])
+    uniq = keys[starts]
+
+    sums = np.add.reduceat(v, starts)
+    mean = sums / counts
+    sq = np.add.reduceat(v * v, starts)
+    out["start"] = uniq
+    if width is not None:
+        out["end"] = uniq + width
+    else:
+        nxt = uniq.astype("datetime64[s]").astype(f"datetime64[{_UNITS[period]}]") + 1
+        out["end"] = nxt.astype("datetime64[s]").astype(np.int64)
+    out["count"] = counts
+    out["mean"] = mean
+    out["min"] = v[starts]
+    out["max"] = v[starts + counts - 1]
+    out["sd"] = np.sqrt(np.maximum(sq / counts - mean * mean, 0.0))
+    for q in percentiles:
+        # interpolación lineal como np.percentile, pero para todos los grupos a la vez
+        pos = starts + (counts - 1) * (q / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, starts + counts - 1)
+        out[f"p{q}"] = v[lo] + (v[hi] - v[lo]) * (pos - lo)
+    return out
+
+
+def drop_periods(agg, gaps):
+    """Quita de la salida de aggregate() los periodos [start, end) que se cruzan con algún hueco [a, b)."""
+    keep = np.ones(len(agg["start"]), dtype=bool)
+    for a, b in gaps:
+        keep &= ~((agg["start"] < b) & (agg["end"] > a))
+    return {k: v[keep] for k, v in agg.items()}
+
+
+def to_rollup_rows(agg, iso, unit=None, parameter=None):
+    """
+    Convierte la salida de aggregate() en filas con la forma de los rollups de OpenAQ
+    (value = media, period.datetimeFrom/To, summary), para reutilizar los formateadores de app.py.
+    iso: función epoch -> 'YYYY-MM-DDTHH:MM:SSZ'.
+    """
+    pct = [k for k in agg if k.startswith("p") and k[1:].isdigit()]
+    rows = []
+    for i in range(len(agg["start"])):
+        summary = {
+            "min": float(agg["min"][i]),
+            "max": float(agg["max"][i]),
+            "avg": float(agg["mean"][i]),
+            "sd": float(agg["sd"][i]),
+        }
+        for k in pct:
+            summary["median" if k == "p50" else "q" + k[1:].zfill(2)] = float(agg[k][i])
+        rows.append({
+            "value": float(agg["mean"][i]),
+            "parameter": {"name": parameter, "units": unit},
+            "period": {
+                "datetimeFrom": {"utc": iso(int(agg["start"][i]))},
+                "datetimeTo": {"utc": iso(int(agg["end"][i]))},
+            },
+            "coverage": {"observedCount": int(agg["count"][i])},
+            "summary": summary,
+        })
+    return rows
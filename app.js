@@ -29,7 +29,7 @@ try {
 // ---------------------
 let currentChart = null;
 let lastSelectedDateMax = null; 
-let currentHistoryData = [];    
+let currentHistoryData = { t: [], v: [], unit: null };
 let stationData = []; 
 let sensorData = []; 
 
@@ -98,6 +98,26 @@ function updatePlaceholderText(message) {
 // Funciones de Lógica y API
 // ---------------------
 
+// Decodifica la respuesta ?format=binary de una serie (ver SERIES_FORMATS en app.py):
+// "OAQ1" | uint32 n | uint32 metaLen | meta JSON | uint32[n] epoch s | float32[n] valores
+function decodeSeries(buffer) {
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'OAQ1') {
+        throw new Error('Formato binario de serie no reconocido');
+    }
+    const n = view.getUint32(4, true);
+    const metaLen = view.getUint32(8, true);
+    const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, metaLen)));
+    const offset = 12 + metaLen;
+    return {
+        ...meta,
+        success: true,
+        t: new Uint32Array(buffer, offset, n),
+        v: new Float32Array(buffer, offset + 4 * n, n)
+    };
+}
+
 async function fetchApi(path) {
     let attempt = 0;
     const maxAttempts = 5;
@@ -105,7 +125,8 @@ async function fetchApi(path) {
     while (attempt < maxAttempts) {
         try {
             const response = await fetch(path);
-            const data = await response.json();
+            const isBinary = (response.headers.get('Content-Type') || '').startsWith('application/octet-stream');
+            const data = isBinary ? decodeSeries(await response.arrayBuffer()) : await response.json();
             
             if (!data.success) {
                 throw new Error(data.message || `Error al obtener datos: ${path}`);
@@ -359,7 +380,8 @@ async function fetchHistory() {
     showLoading(true, 'Cargando datos históricos y generando gráfico...');
     chartPlaceholder.classList.remove('hidden');
 
-    let url = `/api/measurements/${locationId}/${parameterId}?agg=${agg}&date_from=${dateFromUtc}&date_to=${dateToUtc}`;
+    // format=binary: columnas compactas (epoch + float32) en vez de un objeto JSON por fila
+    let url = `/api/measurements/${locationId}/${parameterId}?agg=${agg}&date_from=${dateFromUtc}&date_to=${dateToUtc}&format=binary`;
     if (agg === 'raw' || agg === 'hours') {
          url += '&limit=1000'; // Limitar a 1000 puntos
     }
@@ -373,11 +395,19 @@ async function fetchHistory() {
             return;
         }
 
-        currentHistoryData = data.results.filter(r => r.datetime_utc && r.value !== null).sort((a, b) => {
-            return new Date(a.datetime_utc) - new Date(b.datetime_utc);
-        });
-
-        if (currentHistoryData.length === 0) {
+        // índices válidos (NaN = sin dato) ordenados por fecha
+        const order = [];
+        for (let i = 0; i < data.count; i++) {
+            if (!Number.isNaN(data.v[i])) order.push(i);
+        }
+        order.sort((a, b) => data.t[a] - data.t[b]);
+        currentHistoryData = {
+            t: order.map(i => data.t[i] * 1000),
+            v: order.map(i => data.v[i]),
+            unit: data.unit
+        };
+
+        if (currentHistoryData.t.length === 0) {
             showLoading(false);
             updatePlaceholderText("No se encontraron mediciones válidas para el rango seleccionado.");
             return;
@@ -416,8 +446,8 @@ function renderChart(data, agg) {
     
     document.getElementById('chart-title').textContent = `${parameterName} | ${aggName} (${unit})`;
 
-    const labels = data.map(item => item.datetime_utc);
-    const values = data.map(item => item.value);
+    const labels = data.t;
+    const values = data.v;
 
     let timeUnit;
     switch(agg) {
@@ -517,28 +547,28 @@ function renderTable(data) {
     tbody.innerHTML = '';
     
     const displayLimit = 500;
-    const dataToDisplay = data.slice(0, displayLimit);
+    const total = data.t.length;
     
-    dataToDisplay.forEach(item => {
+    for (let i = 0; i < Math.min(total, displayLimit); i++) {
         const row = tbody.insertRow();
         row.classList.add('hover:bg-gray-50');
 
         // Formatear fecha para la tabla
-        const dt = luxon.DateTime.fromISO(item.datetime_utc, { zone: 'utc' });
+        const dt = luxon.DateTime.fromMillis(data.t[i], { zone: 'utc' });
         const dateCell = row.insertCell();
         dateCell.textContent = dt.toFormat('dd-MM-yyyy HH:mm:ss') + 'Z';
         dateCell.classList.add('px-4', 'py-2', 'whitespace-nowrap', 'text-sm', 'font-medium', 'text-gray-900');
 
         const valueCell = row.insertCell();
-        valueCell.textContent = item.value !== null ? item.value.toFixed(2) : 'N/A';
+        valueCell.textContent = data.v[i] !== null ? data.v[i].toFixed(2) : 'N/A';
         valueCell.classList.add('px-4', 'py-2', 'whitespace-nowrap', 'text-sm', 'text-gray-500');
 
         const unitCell = row.insertCell();
-        unitCell.textContent = item.unit || 'N/A';
+        unitCell.textContent = data.unit || 'N/A';
         unitCell.classList.add('px-4', 'py-2', 'whitespace-nowrap', 'text-sm', 'text-gray-500');
-    });
+    }
     
-    document.getElementById('table-info').classList.toggle('hidden', data.length <= displayLimit);
+    document.getElementById('table-info').classList.toggle('hidden', total <= displayLimit);
 }
 
 // ---------------------
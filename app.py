@@ -1,40 +1,366 @@
 # app.py
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Response, g, jsonify, request, send_file, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from openaq import OpenAQ
 import requests
+from requests.adapters import HTTPAdapter
+import fcntl
+import hashlib
+import json
 import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
-import dateutil.parser as dparser
+from functools import partial
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+import numpy as np
+import aggregation
+import forecast
+import http_cache
+import instrumentation
+import normalize
+import satellite
+from prefetch import HotKeys, Prefetcher
+from rate_governor import RateGovernor
+from latest_snapshot import LatestSnapshot
+from spatial import parse_bbox
+from station_catalog import StationCatalog
+from timeseries_store import TimeSeriesStore, to_epoch, to_iso
 
 
 
 API_KEY = os.getenv("OPENAQ_API_KEY") or "d2a3e44a3f3c5edf8c0a6c01b174dd7c4cdbc3c470d9da78339a5e47383b0f4c"
 HEADERS = {"X-API-Key": API_KEY, "Accept": "application/json"}
-BASE_V3 = "https://api.openaq.org/v3"
+BASE_V3 = os.getenv("OPENAQ_BASE_V3", "https://api.openaq.org/v3")
 
 
-print("Cargando lista de parámetros globales...")
+# -------------------
+# Single-flight: llamadas idénticas en vuelo comparten una sola ejecución
+class SingleFlight:
+    """
+    Si varios hilos piden lo mismo (misma clave) mientras la primera llamada sigue en vuelo,
+    solo esa llamada (el "líder") se ejecuta; el resto espera y recibe su mismo resultado
+    (o su misma excepción). Cuenta por etiqueta cuántas llamadas se ejecutaron y cuántas se unieron.
+    """
+
+    class _Call:
+        __slots__ = ("event", "result", "error")
+
+        def __init__(self):
+            self.event = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _count(self, label, leader):
+        st = self._stats.setdefault(label, {"executed": 0, "coalesced": 0})
+        st["executed" if leader else "coalesced"] += 1
+
+    def record(self, label, leader):
+        """Para llamadores que hacen su propio single-flight (p. ej. asgi.py) y reportan aquí."""
+        with self._lock:
+            self._count(label, leader)
+
+    def do(self, key, fn, label=None):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = self._Call()
+            self._count(label, leader)
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.event.set()
+        return call.result
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": len(self._calls), "by_label": {str(k): dict(v) for k, v in self._stats.items()}}
+
+
+SINGLE_FLIGHT = SingleFlight()
+
+
+class RateLimitTimeout(requests.Timeout):
+    """El gobernador no dio turno dentro del presupuesto de la ruta."""
+
+
+# -------------------
+# Cliente HTTP compartido hacia OpenAQ: pool keep-alive, reintentos y latencia por endpoint
+class UpstreamClient:
+    """
+    Envuelve una requests.Session compartida por todos los hilos del worker.
+    - Pool de conexiones keep-alive (pool_maxsize ~ hilos de gunicorn + workers de paginación).
+    - Reintenta 429/5xx y errores de conexión con backoff exponencial + jitter,
+      respetando Retry-After, sin pasarse del presupuesto de tiempo de la ruta.
+    - Registra latencia por endpoint (plantilla de la URL: /sensors/{id}/days, ...).
+    - GETs idénticos en vuelo (URL + params normalizados) se unen en uno solo (SINGLE_FLIGHT);
+      la Response ya está leída, así que compartirla entre hilos es seguro.
+    - Cada intento pasa antes por el gobernador del rate limit (rate_governor.py) con la prioridad
+      del endpoint (o la del contexto, p. ej. background en el prefetch); si no consigue turno
+      dentro del presupuesto, falla con RateLimitTimeout. Las clases de queued_priorities (bulk y
+      background) no gastan el presupuesto en la cola: esperan hasta queue_timeout y el
+      presupuesto corre desde que tienen turno.
+    Devuelve siempre el último requests.Response para que los llamadores sigan
+    revisando status_code como antes.
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+
+    def __init__(self, headers, pool_size=16, max_retries=3, backoff=0.5, max_backoff=8.0,
+                 budgets=None, default_budget=30.0, governor=None, priorities=None, default_priority="bulk",
+                 queued_priorities=("bulk", "background"), queue_timeout=None):
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0, pool_block=False)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.budgets = budgets or {}
+        self.default_budget = default_budget
+        self.governor = governor
+        self.priorities = priorities or {}
+        self.default_priority = default_priority
+        self.queued_priorities = set(queued_priorities)
+        self.queue_timeout = queue_timeout
+        self._stats = {}
+        self._lock = threading.Lock()
+        self.ratelimit_remaining = None    # último x-ratelimit-remaining visto (None = desconocido)
+        self.observer = None    # observer(endpoint, segundos, status, bytes) por llamada (ver instrumentación)
+
+    @staticmethod
+    def endpoint_of(url):
+        """'https://api.openaq.org/v3/sensors/123/days' -> '/sensors/{id}/days'"""
+        path = urlparse(url).path
+        if "/v3" in path:
+            path = path.split("/v3", 1)[1]
+        return re.sub(r"/\d+(?=/|$)", "/{id}", path) or "/"
+
+    def _retry_after(self, resp):
+        value = resp.headers.get("Retry-After") if resp is not None else None
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            when = parsedate_to_datetime(value)
+            return max(0.0, (when - datetime.now(when.tzinfo)).total_seconds())
+        except Exception:
+            return None
+
+    def priority_of(self, endpoint):
+        default = self.priorities.get(endpoint, self.default_priority)
+        return self.governor.current_priority(default) if self.governor is not None else default
+
+    def queue_timeout_of(self, priority, remaining):
+        """Cuánto puede esperar turno en el gobernador: el resto del presupuesto o, si encola, queue_timeout."""
+        return self.queue_timeout if priority in self.queued_priorities else remaining
+
+    def _record(self, endpoint, elapsed, status, retries, nbytes=None):
+        if self.observer is not None:
+            self.observer(endpoint, elapsed, status, nbytes)
+        with self._lock:
+            st = self._stats.setdefault(endpoint, {"count": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+            st["count"] += 1
+            st["retries"] += retries
+            st["total_ms"] += elapsed * 1000
+            st["max_ms"] = max(st["max_ms"], elapsed * 1000)
+            if status != 200:
+                st["errors"] += 1
+
+    def get(self, url, params=None, timeout=15):
+        key = ("GET", url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+        return SINGLE_FLIGHT.do(key, lambda: self._get(url, params, timeout), label=self.endpoint_of(url))
+
+    def _get(self, url, params, timeout):
+        endpoint = self.endpoint_of(url)
+        budget = self.budgets.get(endpoint, self.default_budget)
+        start = time.monotonic()
+        deadline = start + budget
+        resp = None
+        attempt = 0
+        priority = self.priority_of(endpoint)
+        while True:
+            if self.governor is not None:
+                queued = time.monotonic()
+                if not self.governor.acquire(priority, timeout=self.queue_timeout_of(priority, deadline - queued)):
+                    resp, error = None, RateLimitTimeout(f"sin turno en el rate limit ({priority}) para {endpoint}")
+                    break
+                if priority in self.queued_priorities:
+                    deadline += time.monotonic() - queued
+            remaining = deadline - time.monotonic()
+            try:
+                resp = self.session.get(url, params=params, timeout=max(0.5, min(timeout, remaining)))
+                error = None
+            except (requests.ConnectionError, requests.Timeout) as e:
+                resp, error = None, e
+
+            retryable = error is not None or resp.status_code in self.RETRY_STATUS
+            if not retryable or attempt >= self.max_retries:
+                break
+            wait = self._retry_after(resp)
+            if wait is None:
+                wait = min(self.max_backoff, self.backoff * (2 ** attempt)) + random.uniform(0, self.backoff)
+            if time.monotonic() + wait >= deadline:
+                break
+            time.sleep(wait)
+            attempt += 1
+
+        self._record(endpoint, time.monotonic() - start, resp.status_code if resp is not None else None, attempt,
+                     len(resp.content) if resp is not None else None)
+        if resp is None:
+            raise error
+        remaining = resp.headers.get("x-ratelimit-remaining")
+        if remaining is not None and remaining.isdigit():
+            self.ratelimit_remaining = int(remaining)
+        return resp
+
+    def stats(self):
+        with self._lock:
+            out = {}
+            for endpoint, st in self._stats.items():
+                out[endpoint] = dict(st, avg_ms=round(st["total_ms"] / st["count"], 2) if st["count"] else None)
+                out[endpoint]["total_ms"] = round(st["total_ms"], 2)
+                out[endpoint]["max_ms"] = round(st["max_ms"], 2)
+            return out
+
+
+# Tamaño del pool: hilos de gunicorn (--threads) + workers de paginación concurrente
+GUNICORN_THREADS = int(os.getenv("GUNICORN_THREADS", "8"))
+PAGINATION_WORKERS = int(os.getenv("PAGINATION_WORKERS", "4"))
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE") or GUNICORN_THREADS + PAGINATION_WORKERS)
+DATA_DIR = os.getenv("DATA_DIR") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+# 0 = sin hilos de fondo (refrescos, prefetch, export de métricas): para scripts que importan app
+# solo por sus helpers (p. ej. update_lstm.py) y no deben gastar el rate limit compartido
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "1") != "0"
+# rate limit de la API key (por minuto, compartido por todos los workers de la máquina); 0 = sin gobernador
+GOVERNOR = RateGovernor(
+    rate=float(os.getenv("UPSTREAM_RATE_PER_MIN", "60")) / 60,
+    burst=int(os.getenv("UPSTREAM_BURST", "30")),
+    path=os.getenv("UPSTREAM_BUCKET") or os.path.join(DATA_DIR, "ratelimit.bucket"),
+)
+upstream = UpstreamClient(
+    HEADERS,
+    pool_size=HTTP_POOL_SIZE,
+    max_retries=int(os.getenv("HTTP_MAX_RETRIES", "3")),
+    # presupuesto total (segundos, incluidos reintentos) por endpoint
+    budgets={
+        "/parameters": 20,
+        "/locations/{id}/latest": 15,
+        "/sensors/{id}": 12,
+        "/measurements": 25,
+    },
+    default_budget=30,
+    governor=GOVERNOR,
+    # bulk y background esperan turno en la cola hasta esto (s) sin gastar el presupuesto de arriba
+    queue_timeout=float(os.getenv("UPSTREAM_QUEUE_TIMEOUT", "600")),
+    # el resto (paginación de /sensors/{id}/...) es bulk
+    priorities={
+        "/locations/{id}/latest": "interactive",
+        "/locations/{id}": "metadata",
+        "/sensors/{id}": "metadata",
+        "/locations": "metadata",
+        "/parameters": "metadata",
+        "/parameters/{id}/latest": "background",
+    },
+)
+
+
+# -------------------
+# Catálogo global de parámetros (/parameters)
+# No se pide a OpenAQ al importar: se lee el snapshot local (compartido por todos los workers)
+# y un hilo de fondo lo renueva cuando tiene más de PARAMETERS_REFRESH segundos.
+PARAMETERS_SNAPSHOT = os.getenv("PARAMETERS_SNAPSHOT") or os.path.join(DATA_DIR, "parameters.json")
+PARAMETERS_REFRESH = int(os.getenv("PARAMETERS_REFRESH", "86400"))    # 0 = sin hilo de refresco
+PARAMETERS_RETRY = 60
 PARAMETERS_MAP = {}
 
-try:
-    resp = requests.get(f"{BASE_V3}/parameters", headers=HEADERS, timeout=15)
-    if resp.status_code == 200:
-        for item in resp.json().get("results", []):
-            PARAMETERS_MAP[item["id"]] = {
-                "name": item["name"],
-                "units": item.get("units"),
-                "displayName": item.get("displayName") or item["name"].upper()
-            }
-        print(f"Parámetros cargados: {len(PARAMETERS_MAP)}")
-    else:
-        print("Error al cargar parámetros:", resp.status_code)
-except Exception as e:
-    print("Error cargando parámetros:", e)
+
+def _load_parameters_snapshot():
+    """Carga el snapshot en PARAMETERS_MAP. Devuelve su antigüedad en segundos, o None si no hay."""
+    try:
+        with open(PARAMETERS_SNAPSHOT, encoding="utf-8") as f:
+            data = json.load(f)
+        age = time.time() - os.path.getmtime(PARAMETERS_SNAPSHOT)
+    except (OSError, ValueError):
+        return None
+    PARAMETERS_MAP.update({int(k): v for k, v in data.items()})
+    return age
+
+
+def refresh_parameters():
+    """Pide /parameters a OpenAQ, actualiza PARAMETERS_MAP y reescribe el snapshot (reemplazo atómico)."""
+    resp = upstream.get(f"{BASE_V3}/parameters", timeout=15)
+    if resp.status_code != 200:
+        raise RuntimeError(f"{resp.status_code}: {resp.text}")
+    fresh = {}
+    for item in resp.json().get("results", []):
+        fresh[item["id"]] = {
+            "name": item["name"],
+            "units": item.get("units"),
+            "displayName": item.get("displayName") or item["name"].upper()
+        }
+    PARAMETERS_MAP.update(fresh)
+    os.makedirs(os.path.dirname(os.path.abspath(PARAMETERS_SNAPSHOT)), exist_ok=True)
+    tmp = f"{PARAMETERS_SNAPSHOT}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(fresh, f, ensure_ascii=False)
+    os.replace(tmp, PARAMETERS_SNAPSHOT)
+    return len(fresh)
+
+
+def _parameters_refresher():
+    while True:
+        # otro worker pudo haber renovado el snapshot mientras tanto
+        age = _load_parameters_snapshot()
+        if age is not None and age < PARAMETERS_REFRESH:
+            wait = PARAMETERS_REFRESH - age
+        else:
+            try:
+                with GOVERNOR.priority("background"):
+                    print(f"Parámetros cargados: {refresh_parameters()}")
+                wait = PARAMETERS_REFRESH
+            except Exception as e:
+                print("Error cargando parámetros:", e)
+                wait = PARAMETERS_RETRY
+        # jitter: que los workers no salgan todos a la vez
+        time.sleep(wait + random.uniform(0, PARAMETERS_RETRY / 2))
+
+
+_load_parameters_snapshot()
+if BACKGROUND_JOBS and PARAMETERS_REFRESH > 0:
+    threading.Thread(target=_parameters_refresher, name="parameters-refresh", daemon=True).start()
 
 app = Flask(__name__, static_folder=".", static_url_path="")
 CORS(app)
-client = OpenAQ(api_key=API_KEY)
+client = OpenAQ(api_key=API_KEY, base_url=BASE_V3.rstrip("/") + "/")
 
 
 def _extract_parameter_info(sensor):
@@ -91,33 +417,335 @@ def _extract_parameter_info(sensor):
     return sensor_id, parameter_id, code, display, units
 
 
-def _prefer_datetime(it):
+def _normalize_sensor(sensor):
     """
-    Extrae la mejor fecha UTC disponible en una medición/agg:
-    - period.datetimeFrom.utc
-    - period.datetimeTo.utc
-    - datetime.utc
-    - datetime_utc
-    - date
+    Convierte un sensor (dict u objeto OpenAQ) en un registro plano:
+    {sensor_id, parameter_id, code, display, units, datetime_last}.
+    Es la forma que guardamos en la caché de metadata.
     """
-    if not it:
-        return None
-    # period.datetimeFrom.utc
-    p = it.get("period") or {}
-    if isinstance(p, dict):
-        df = (p.get("datetimeFrom") or {}).get("utc")
-        if df:
-            return df
-        dt = (p.get("datetimeTo") or {}).get("utc")
-        if dt:
-            return dt
-    # datetime or date
-    d = it.get("datetime") or it.get("date") or {}
-    if isinstance(d, dict):
-        if d.get("utc"):
-            return d.get("utc")
-    # direct fields
-    return it.get("datetime_utc") or it.get("date") or None
+    sid, pid, code, display, units = _extract_parameter_info(sensor)
+    if isinstance(sensor, dict):
+        dl = sensor.get("datetimeLast") or sensor.get("datetime_last")
+    else:
+        dl = getattr(sensor, "datetime_last", None)
+    if isinstance(dl, dict):
+        dl = dl.get("utc")
+    elif dl is not None and not isinstance(dl, str):
+        dl = getattr(dl, "utc", None)
+    return {
+        "sensor_id": sid,
+        "parameter_id": pid,
+        "code": code,
+        "display": display,
+        "units": units,
+        "datetime_last": dl,
+    }
+
+
+# -------------------
+# Caché de metadata (location -> sensores normalizados)
+class TTLCache:
+    """
+    Caché en memoria, segura entre hilos, con TTL por entrada,
+    tamaño máximo con expulsión LRU y contadores de hits/misses.
+    """
+
+    def __init__(self, maxsize=512, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()    # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """Devuelve (True, valor) si la clave está vigente, (False, None) si no."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return True, value
+                del self._data[key]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def remaining(self, key):
+        """Segundos que le quedan a la entrada, o None si no está (o ya venció)."""
+        with self._lock:
+            entry = self._data.get(key)
+        left = entry[0] - time.monotonic() if entry is not None else None
+        return left if left is not None and left > 0 else None
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / total, 4) if total else None,
+            }
+
+
+METADATA_CACHE = TTLCache(
+    maxsize=int(os.getenv("METADATA_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("METADATA_CACHE_TTL", "600")),
+)
+
+
+@instrumentation.timed("sensor_lookup")
+def get_location_sensors(location_id):
+    """
+    Devuelve la lista de sensores normalizados (ver _normalize_sensor) de una location,
+    o None si la location no existe. Usa METADATA_CACHE para evitar repetir
+    /locations/{id} en cada request. Las excepciones de la llamada se propagan.
+    """
+    key = int(location_id)
+    found, sensors = METADATA_CACHE.get(key)
+    if found:
+        return sensors
+    # varios hilos con el mismo miss comparten una sola llamada a /locations/{id}
+    return SINGLE_FLIGHT.do(("location_sensors", key), lambda: _load_location_sensors(key), label="/locations/{id}")
+
+
+def _load_location_sensors(key):
+    # por `upstream` y no por el SDK de openaq: así pasa por el rate limit, las métricas y
+    # OPENAQ_BASE_V3 (el SDK siempre habla https y no puede apuntar al stub de los benchmarks)
+    r = upstream.get(f"{BASE_V3}/locations/{key}", timeout=15)
+    coords = None
+    if r.status_code == 404:
+        sensors = None
+    elif r.status_code != 200:
+        raise RuntimeError(f"{r.status_code}: {r.text}")
+    else:
+        results = r.json().get("results", [])
+        sensors = [_normalize_sensor(s) for s in (results[0].get("sensors") or [])] if results else None
+        c = (results[0].get("coordinates") or {}) if results else {}
+        if c.get("latitude") is not None and c.get("longitude") is not None:
+            coords = (c["latitude"], c["longitude"])
+    METADATA_CACHE.set(key, sensors)
+    METADATA_CACHE.set(("coordinates", key), coords)
+    return sensors
+
+
+def get_location_coordinates(location_id):
+    """(lat, lon) de una location, o None. Sale de la misma llamada (cacheada) que sus sensores."""
+    key = int(location_id)
+    found, coords = METADATA_CACHE.get(("coordinates", key))
+    if found:
+        return coords
+    SINGLE_FLIGHT.do(("location_sensors", key), lambda: _load_location_sensors(key), label="/locations/{id}")
+    return METADATA_CACHE.get(("coordinates", key))[1]
+
+
+# -------------------
+# Instrumentación (ver instrumentation.py): /metrics para Prometheus, header Server-Timing
+# y perfilado por muestreo de las requests lentas
+METRICS = instrumentation.Metrics(
+    directory=os.getenv("METRICS_DIR") or os.path.join(DATA_DIR, "metrics"),
+    flush_interval=int(os.getenv("METRICS_FLUSH", "15")),    # 0 = cada worker exporta solo lo suyo
+)
+METRICS.histogram("api_request_duration_seconds", "Duración de las requests por ruta", ("route", "method", "status"))
+METRICS.histogram("api_request_phase_seconds", "Tiempo por fase interna de la request", ("route", "phase"))
+METRICS.histogram("api_request_upstream_calls", "Llamadas a OpenAQ por request", ("route",),
+                  buckets=instrumentation.COUNT_BUCKETS)
+METRICS.histogram("upstream_request_duration_seconds", "Latencia de las llamadas a OpenAQ, con reintentos",
+                  ("route", "endpoint"))
+METRICS.histogram("upstream_response_bytes", "Tamaño de las respuestas de OpenAQ", ("route", "endpoint"),
+                  buckets=instrumentation.SIZE_BUCKETS)
+METRICS.counter("upstream_requests_total", "Llamadas a OpenAQ por status", ("route", "endpoint", "status"))
+METRICS.gauge("upstream_ratelimit_remaining", "Último x-ratelimit-remaining de OpenAQ",
+              lambda: [((), upstream.ratelimit_remaining)])
+METRICS.gauge("upstream_governor_tokens", "Tokens disponibles en el rate limit compartido",
+              lambda: [((), GOVERNOR.tokens())])
+METRICS.gauge("metadata_cache_entries", "Entradas en la caché de metadata", lambda: [((), METADATA_CACHE.stats()["size"])])
+if BACKGROUND_JOBS:
+    METRICS.start()
+
+PROFILE_SLOW_MS = int(os.getenv("PROFILE_SLOW_MS", "0"))    # 0 = sin perfilado
+PROFILE_SAMPLE = float(os.getenv("PROFILE_SAMPLE", "0"))    # fracción de requests perfiladas, además de las con X-Profile: 1
+PROFILER = instrumentation.SamplingProfiler(
+    os.getenv("PROFILE_DIR") or os.path.join(DATA_DIR, "profiles"),
+    slow_ms=PROFILE_SLOW_MS,
+    interval=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+    keep=int(os.getenv("PROFILE_KEEP", "50")),
+)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "1") == "1"
+
+
+class _TimedJSONProvider(DefaultJSONProvider):
+    """El JSON de Flask (jsonify, app.json.dumps) cuenta como la fase serialize."""
+
+    def dumps(self, obj, **kwargs):
+        with instrumentation.phase("serialize"):
+            return super().dumps(obj, **kwargs)
+
+    def response(self, *args, **kwargs):
+        with instrumentation.phase("serialize"):
+            return super().response(*args, **kwargs)
+
+
+app.json = _TimedJSONProvider(app)
+
+
+def _record_upstream(endpoint, elapsed, status, nbytes):
+    """Observer de `upstream`: cada llamada a OpenAQ, atribuida a la ruta que la hizo (o a background)."""
+    trace = instrumentation.current()
+    route = trace.route if trace is not None else "background"
+    if trace is not None:
+        trace.add_upstream(nbytes, elapsed)
+    METRICS.observe("upstream_request_duration_seconds", (route, endpoint), elapsed)
+    if nbytes is not None:
+        METRICS.observe("upstream_response_bytes", (route, endpoint), nbytes)
+    METRICS.inc("upstream_requests_total", (route, endpoint, str(status) if status else "error"))
+
+
+upstream.observer = _record_upstream
+
+
+def _finish_trace(trace, method):
+    """Vuelca una request terminada a METRICS (la usa también asgi.py) y, si era lenta, su perfil."""
+    elapsed = time.perf_counter() - trace.start
+    route = trace.route
+    METRICS.observe("api_request_duration_seconds", (route, method, str(trace.status or 500)), elapsed)
+    METRICS.observe("api_request_upstream_calls", (route,), trace.upstream_calls)
+    for name, seconds in trace.phases.items():
+        METRICS.observe("api_request_phase_seconds", (route, name), seconds)
+    if trace.profile is not None:
+        PROFILER.stop(trace.profile, route, elapsed)
+
+
+@app.before_request
+def _begin_trace():
+    trace = instrumentation.begin(request.endpoint or "unmatched")
+    if PROFILE_SLOW_MS > 0 and (request.headers.get("X-Profile") == "1" or random.random() < PROFILE_SAMPLE):
+        trace.profile = PROFILER.start()
+
+
+# registrado antes que _http_cache, así corre después (Flask los llama en orden inverso) y
+# Server-Timing incluye la fase http_cache
+@app.after_request
+def _server_timing(response):
+    trace = instrumentation.current()
+    if trace is not None:
+        trace.status = response.status_code
+        if SERVER_TIMING:
+            response.headers["Server-Timing"] = trace.server_timing()
+    return response
+
+
+@app.teardown_request
+def _end_trace(error=None):
+    # con stream_with_context corre cuando termina el stream: la duración incluye todo el envío
+    trace = instrumentation.current()
+    if trace is None:
+        return
+    instrumentation.end()
+    _finish_trace(trace, request.method)
+
+
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+
+@app.route("/api/profiles", methods=["GET"])
+def api_profiles():
+    return jsonify(success=True, enabled=PROFILE_SLOW_MS > 0, slow_ms=PROFILE_SLOW_MS, sample=PROFILE_SAMPLE,
+                   dumped=PROFILER.dumped, profiles=PROFILER.profiles())
+
+
+@app.route("/api/profiles/<name>", methods=["GET"])
+def api_profile(name):
+    # solo nombres que están en el directorio (nada de rutas arbitrarias)
+    if name not in PROFILER.profiles():
+        return jsonify(success=False, message="perfil no encontrado"), 404
+    return send_file(os.path.join(PROFILER.directory, name), mimetype="text/plain")
+
+
+# -------------------
+# Caché HTTP (ver http_cache.py): Cache-Control por ruta, ETag + 304 y cuerpos comprimidos
+CACHE_LONG = "public, max-age=86400, stale-while-revalidate=3600"
+CACHE_HOUR = "public, max-age=3600, stale-while-revalidate=600"
+CACHE_MEDIUM = "public, max-age=300"
+CACHE_SHORT = "public, max-age=60, stale-while-revalidate=60"
+CACHE_IMMUTABLE = "public, max-age=31536000, immutable"
+# una ventana histórica que terminó hace más que esto ya no cambia
+HISTORY_SETTLE = int(os.getenv("HISTORY_SETTLE_DAYS", "2")) * 86400
+CACHE_POLICIES = {}    # endpoint -> Cache-Control, o función sin argumentos que lo arma con la request
+COMPRESSED_BODIES = TTLCache(maxsize=int(os.getenv("COMPRESSED_CACHE_SIZE", "256")), ttl=3600)
+
+
+def cache_policy(policy):
+    """Registra la política de caché HTTP de una ruta (va debajo de @app.route)."""
+    def register(view):
+        CACHE_POLICIES[view.__name__] = policy
+        return view
+    return register
+
+
+def history_policy():
+    """
+    Ventanas cerradas (date_to fijo, más viejo que HISTORY_SETTLE, sin last_days) que la vista
+    marcó completas en g.history_complete (ver measurements_payload): inmutables. Una ventana
+    cerrada pero incompleta (fallback global, recortada por limit o max_pages) dura una hora.
+    """
+    date_to = request.args.get("date_to")
+    if date_to and not request.args.get("last_days"):
+        try:
+            if to_epoch(normalize.parse_datetime(date_to)) < time.time() - HISTORY_SETTLE:
+                return CACHE_IMMUTABLE if g.get("history_complete") else CACHE_HOUR
+        except (ValueError, OverflowError):
+            pass
+    return CACHE_MEDIUM
+
+
+@app.after_request
+def _http_cache(response):
+    policy = CACHE_POLICIES.get(request.endpoint)
+    if policy is None or request.method not in ("GET", "HEAD") or response.is_streamed:
+        return response
+    if response.status_code != 200:
+        # errores y 404: que ningún proxy los guarde
+        response.headers["Cache-Control"] = "no-store"
+        return response
+    with instrumentation.phase("http_cache"):
+        status, body, headers = http_cache.conditional(
+            response.get_data(),
+            response.mimetype,
+            policy() if callable(policy) else policy,
+            accept_encoding=request.headers.get("Accept-Encoding"),
+            if_none_match=request.headers.get("If-None-Match"),
+            cache=COMPRESSED_BODIES,
+        )
+    response.status_code = status
+    response.set_data(body)
+    response.headers.update(headers)
+    return response
 
 
 @app.route("/")
@@ -125,9 +753,28 @@ def home():
     return send_file(os.path.join(os.path.dirname(__file__), "index.html"))
 
 
+@app.route("/api/cache_stats", methods=["GET"])
+def api_cache_stats():
+    return jsonify(success=True, metadata=METADATA_CACHE.stats())
+
+
+@app.route("/api/upstream_stats", methods=["GET"])
+def api_upstream_stats():
+    return jsonify(success=True, endpoints=upstream.stats(), single_flight=SINGLE_FLIGHT.stats(), governor=GOVERNOR.stats(),
+                   ratelimit_remaining=upstream.ratelimit_remaining)
+
+
+@app.route("/api/store_stats", methods=["GET"])
+def api_store_stats():
+    if TS_STORE is None:
+        return jsonify(success=True, enabled=False)
+    return jsonify(success=True, enabled=True, **TS_STORE.stats())
+
+
 # -------------------
 # Countries / Stations / Parameters
 @app.route("/api/countries", methods=["GET"])
+@cache_policy(CACHE_LONG)
 def api_countries():
     try:
         resp = client.countries.list(limit=1000)
@@ -139,77 +786,72 @@ def api_countries():
 
 
 @app.route("/api/stations/<country_code>", methods=["GET"])
+@cache_policy(CACHE_HOUR)
 def api_stations(country_code):
+    """Todas las estaciones del país (sin el corte de 500 de una sola página), desde el catálogo."""
     try:
-        resp = client.locations.list(iso=country_code, limit=500)
-        stations = []
-        for loc in resp.results:
-            stations.append({
-                "id": loc.id,
-                "name": loc.name,
-                "locality": getattr(loc, "locality", None) or "",
-                "coordinates": {
-                    "latitude": getattr(loc.coordinates, "latitude", None) if getattr(loc, "coordinates", None) else None,
-                    "longitude": getattr(loc.coordinates, "longitude", None) if getattr(loc, "coordinates", None) else None
-                }
-            })
+        catalog, idx = country_stations(country_code)
+        stations = catalog.records(idx)
         return jsonify(success=True, count=len(stations), results=stations)
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
 
-@app.route("/api/parameters/<int:station_id>", methods=["GET"])
-def api_parameters(station_id):
-    try:
-        # 💡 Cambio Clave: Usamos locations.get para obtener la metadata completa de la estación/sensores,
-        # tal como lo hizo tu código de prueba que funcionó correctamente. Esto usa la API v2.
-        resp = client.locations.get(locations_id=station_id)
-        
-        sensors_out = []
-        seen = set()
+def _parameter_options(sensors_list):
+    """Sensores normalizados -> opciones de /api/parameters (nombre formateado, sin duplicados)."""
+    sensors_out = []
+    seen = set()
+    for s in sensors_list:
+        sid, pid, code, display, units = s["sensor_id"], s["parameter_id"], s["code"], s["display"], s["units"]
 
-        # resp.results[0] es la ubicación. Accedemos a sus sensores asociados.
-        if not resp.results:
-             return jsonify(success=True, count=0, results=[]), 404
+        # Usamos el código o el nombre del parámetro si está disponible
+        sensor_name_display = display or code or f"Sensor {sid}"
+        
+        # Formato de salida mejorado: Nombre del parámetro + (ID Sensor)
+        # También incluimos las unidades que son útiles
+        final_name = f"{sensor_name_display.upper()} (ID Sensor: {sid}, Unidad: {units if units else 'N/A'})"
+        
+        # evitar duplicados por ID (aunque no debería pasar con esta ruta)
+        if sid in seen:
+            continue
+        seen.add(sid)
 
-        # La propiedad 'sensors' de la ubicación tiene la metadata completa que necesitamos.
-        location = resp.results[0]
-        sensors_list = getattr(location, 'sensors', [])
+        sensors_out.append({
+            "sensor_id": sid,
+            "parameter_id": pid,
+            "code": code,
+            "name": final_name,
+            "units": units if units is not None else None
+        })
+    return sensors_out
 
-        for s in sensors_list:
-            sid, pid, code, display, units = _extract_parameter_info(s)
 
-            # Usamos el código o el nombre del parámetro si está disponible
-            sensor_name_display = display or code or f"Sensor {sid}"
-            
-            # Formato de salida mejorado: Nombre del parámetro + (ID Sensor)
-            # También incluimos las unidades que son útiles
-            final_name = f"{sensor_name_display.upper()} (ID Sensor: {sid}, Unidad: {units if units else 'N/A'})"
-            
-            # evitar duplicados por ID (aunque no debería pasar con esta ruta)
-            if sid in seen:
-                continue
-            seen.add(sid)
+@app.route("/api/parameters/<int:station_id>", methods=["GET"])
+@cache_policy(CACHE_HOUR)
+def api_parameters(station_id):
+    HOT_KEYS.hit(("location", station_id))
+    try:
+        # Metadata completa de la estación/sensores (/locations/{id}), servida desde la caché
+        sensors_list = get_location_sensors(station_id)
 
-            sensors_out.append({
-                "sensor_id": sid,
-                "parameter_id": pid,
-                "code": code,
-                "name": final_name,
-                "units": units if units is not None else None
-            })
+        # la location no existe
+        if sensors_list is None:
+            return jsonify(success=True, count=0, results=[]), 404
 
+        sensors_out = _parameter_options(sensors_list)
         return jsonify(success=True, count=len(sensors_out), results=sensors_out)
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
 
 @app.route("/api/last_measurement_date/<int:location_id>/<int:parameter_id>", methods=["GET"])
+@cache_policy(CACHE_MEDIUM)
 def api_last_measurement_date(location_id, parameter_id):
     """
     Ruta para obtener la última fecha de medición disponible para un parámetro en una ubicación.
     Esto es crucial para limitar los selectores de fecha en el frontend.
     """
+    HOT_KEYS.hit(("location", location_id))
     try:
         # Localizar el sensor
         sensor = find_sensor_by_parameter(location_id, parameter_id)
@@ -218,21 +860,16 @@ def api_last_measurement_date(location_id, parameter_id):
             return jsonify(success=False, message="No se encontró el sensor asociado al parámetro."), 404
 
         # Extraer la última fecha del metadata del sensor (v2 location.sensors)
-        last_dt_utc = None
-        if isinstance(sensor, dict):
-             last_dt_utc = (sensor.get("datetimeLast") or {}).get("utc")
-        else:
-             last_dt_utc = (getattr(sensor, "datetime_last", None) or {}).get("utc")
+        last_dt_utc = sensor["datetime_last"]
 
         if not last_dt_utc:
             # Fallback 1: Intentar con el endpoint /v3/locations/{id}/latest
-            url = f"{BASE_V3}/locations/{location_id}/latest"
-            r = requests.get(url, headers=HEADERS, timeout=10)
+            r = get_location_latest(location_id)
             if r.status_code == 200:
                 results = r.json().get("results", [])
-                filtered = [m for m in results if int(m.get("sensorsId", -1)) == int(sensor.id)]
+                filtered = [m for m in results if int(m.get("sensorsId", -1)) == int(sensor["sensor_id"])]
                 if filtered:
-                    last_dt_utc = _prefer_datetime(filtered[0])
+                    last_dt_utc = normalize.prefer_datetime(filtered[0])
             
         if not last_dt_utc:
             # Fallback 2: Usar hoy (como última opción)
@@ -246,11 +883,104 @@ def api_last_measurement_date(location_id, parameter_id):
 
 # -------------------
 # Latest measurement (location latest, filter by sensorsId)
+# /locations/{id}/latest y /sensors/{id} se cachean (solo respuestas 200): latest con TTL corto,
+# la metadata del sensor en METADATA_CACHE. El prefetch los renueva antes de que venzan.
+LOCATION_LATEST_CACHE = TTLCache(
+    maxsize=int(os.getenv("LOCATION_LATEST_CACHE_SIZE", "1024")),
+    ttl=int(os.getenv("LOCATION_LATEST_TTL", "120")),
+)
+
+
+@instrumentation.timed("fetch")
+def _cached_get(cache, key, url, timeout, refresh=False):
+    """upstream.get con caché de las respuestas 200; refresh=True ignora lo cacheado."""
+    if not refresh:
+        found, resp = cache.get(key)
+        if found:
+            return resp
+    resp = upstream.get(url, timeout=timeout)
+    if resp.status_code == 200:
+        cache.set(key, resp)
+    return resp
+
+
+def get_location_latest(location_id, refresh=False):
+    """requests.Response de /locations/{id}/latest (ya leída, se puede compartir entre hilos)."""
+    return _cached_get(LOCATION_LATEST_CACHE, int(location_id), f"{BASE_V3}/locations/{int(location_id)}/latest", 15, refresh)
+
+
+def get_sensor_meta(sensor_id, refresh=False):
+    """requests.Response de /sensors/{id}."""
+    return _cached_get(METADATA_CACHE, ("sensor", int(sensor_id)), f"{BASE_V3}/sensors/{int(sensor_id)}", 10, refresh)
+
+
+def _sensor_latest_record(sensor_id, m, meta, location_sensors):
+    """
+    Arma el registro de /api/sensor_latest a partir de:
+      - m: la medición de /locations/{id}/latest que corresponde al sensor
+      - meta: results de /sensors/{sensor_id} (o None si falló)
+      - location_sensors: sensores normalizados de la location (o None si falló)
+    Compartido por la ruta WSGI y la ruta async (asgi.py) para mantener el mismo JSON.
+    """
+    # 🔁 Inicializamos por defecto
+    sensor_name = "Sensor sin nombre"
+    unit = m.get("unit")    # puede venir None
+
+    # 1) Metadata específica del sensor (/v3/sensors/{sensor_id})
+    if meta and isinstance(meta, list) and len(meta) > 0:
+        meta0 = meta[0]
+        # parameter puede estar dentro
+        p = meta0.get("parameter") or {}
+        # display name preferido
+        sensor_name = p.get("displayName") or p.get("name") or meta0.get("name") or f"Sensor {sensor_id}"
+        # unidades preferidas desde parameter o desde el propio meta0.unit
+        unit = unit or (p.get("units") if isinstance(p, dict) else None) or meta0.get("unit") or unit
+
+    # 2) Si aún no tenemos sensor_name o unidad, hacemos fallback revisando sensors en la location
+    sensores_debug = []
+    try:
+        for s in location_sensors or []:
+            sid, code, display, units = s["sensor_id"], s["code"], s["display"], s["units"]
+            try:
+                sensores_debug.append(int(sid) if sid is not None else sid)
+            except Exception:
+                sensores_debug.append(sid)
+            if sid is not None and int(sid) == int(sensor_id):
+                # preferimos display extraída del sensor metadata local
+                # Mejoramos el nombre para que muestre el código del parámetro
+                parameter_code_display = display or code or f"Sensor {sid}"
+                sensor_name = f"{parameter_code_display.upper()} (ID Sensor: {sid})"
+                if not unit:
+                    unit = units
+                break
+    except Exception:
+        sensores_debug = []
+
+    # final fallback names/units
+    if not sensor_name:
+        sensor_name = f"Sensor {sensor_id}"
+    if unit is None:
+        unit = None    # explícito: puede quedar null
+
+    return {
+        "datetime_utc": normalize.prefer_datetime(m),
+        "datetime_local": (m.get("datetime") or {}).get("local") if m.get("datetime") else None,
+        "value": m.get("value"),
+        "unit": unit,
+        "sensor_name": sensor_name,
+        "sensorsId": m.get("sensorsId"),
+        "locationsId": m.get("locationsId"),
+        "coordinates": m.get("coordinates"),
+        "debug_sensors_found": sensores_debug    # TEMPORAL: muestra todos los IDs que devuelve la location
+    }
+
+
 @app.route("/api/sensor_latest/<int:location_id>/<int:sensor_id>", methods=["GET"])
+@cache_policy(CACHE_SHORT)
 def api_sensor_latest(location_id, sensor_id):
+    HOT_KEYS.hit(("sensor_latest", location_id, sensor_id))
     try:
-        url = f"{BASE_V3}/locations/{location_id}/latest"
-        r = requests.get(url, headers=HEADERS, timeout=15)
+        r = get_location_latest(location_id)
         if r.status_code != 200:
             return jsonify(success=False, status=r.status_code, message=r.text), r.status_code
 
@@ -260,87 +990,465 @@ def api_sensor_latest(location_id, sensor_id):
         if not filtered:
             return jsonify(success=True, count=0, results=[])
 
-        m = filtered[0]
-
-        # 🔁 Inicializamos por defecto
-        sensor_name = "Sensor sin nombre"
-        unit = m.get("unit")    # puede venir None
-
-        # 1) Intentamos obtener metadata específica del sensor (/v3/sensors/{sensor_id})
+        meta = None
         try:
-            meta_resp = requests.get(f"{BASE_V3}/sensors/{int(sensor_id)}", headers=HEADERS, timeout=10)
+            meta_resp = get_sensor_meta(sensor_id)
             if meta_resp.status_code == 200:
                 meta = meta_resp.json().get("results", [])
-                if meta and isinstance(meta, list) and len(meta) > 0:
-                    meta0 = meta[0]
-                    # parameter puede estar dentro
-                    p = meta0.get("parameter") or {}
-                    # display name preferido
-                    sensor_name = p.get("displayName") or p.get("name") or meta0.get("name") or f"Sensor {sensor_id}"
-                    # unidades preferidas desde parameter o desde el propio meta0.unit
-                    unit = unit or (p.get("units") if isinstance(p, dict) else None) or meta0.get("unit") or unit
         except Exception:
             # no rompemos si falla la petición a /sensors/{id}
             pass
 
-        # 2) Si aún no tenemos sensor_name o unidad, hacemos fallback revisando sensors en la location
-        sensors_resp = None
-        sensores_debug = []
+        location_sensors = None
         try:
-            # Usamos locations.get para tener la metadata completa de los sensores (v2 like)
-            sensors_resp = client.locations.get(locations_id=location_id)
-            for s in sensors_resp.results[0].sensors:
-                sid, pid, code, display, units = _extract_parameter_info(s)
-                try:
-                    sensores_debug.append(int(sid) if sid is not None else sid)
-                except Exception:
-                    sensores_debug.append(sid)
-                if sid is not None and int(sid) == int(sensor_id):
-                    # preferimos display extraída del sensor metadata local
-                    # Mejoramos el nombre para que muestre el código del parámetro
-                    parameter_code_display = display or code or f"Sensor {sid}"
-                    sensor_name = f"{parameter_code_display.upper()} (ID Sensor: {sid})"
-                    if not unit:
-                        unit = units or (s.get("unit") if isinstance(s, dict) else None)
-                    break
+            # Metadata completa de los sensores de la location (caché de /locations/{id})
+            location_sensors = get_location_sensors(location_id)
         except Exception:
-            sensores_debug = []
-
-        # final fallback names/units
-        if not sensor_name:
-            sensor_name = f"Sensor {sensor_id}"
-        if unit is None:
-            unit = None    # explícito: puede quedar null
-
-        out = {
-            "datetime_utc": _prefer_datetime(m),
-            "datetime_local": (m.get("datetime") or {}).get("local") if m.get("datetime") else None,
-            "value": m.get("value"),
-            "unit": unit,
-            "sensor_name": sensor_name,
-            "sensorsId": m.get("sensorsId"),
-            "locationsId": m.get("locationsId"),
-            "coordinates": m.get("coordinates"),
-            "debug_sensors_found": sensores_debug    # TEMPORAL: muestra todos los IDs que devuelve la location
-        }
+            pass
+
+        out = _sensor_latest_record(sensor_id, filtered[0], meta, location_sensors)
         return jsonify(success=True, count=1, results=[out])
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
 
+# -------------------
+# Snapshots compartidos entre workers (últimas lecturas, catálogo de estaciones)
+# Cada uno es un .npz en DATA_DIR. Un lock de archivo hace que un solo worker lo pida a OpenAQ;
+# los demás lo recargan cuando cambia su mtime. Un hilo por worker los mantiene al día.
+SNAPSHOT_RETRY = 10
+SNAPSHOT_JOBS = []    # (etiqueta, intervalo s, recargar() -> antigüedad o None, renovar(max_age) -> filas o None)
+
+
+def _fetch_all_pages(url, params=None, max_pages=100):
+    """Todas las páginas (limit 1000) de un listado de OpenAQ; un status != 200 es un error."""
+    results = []
+    for page in range(1, max_pages + 1):
+        r = upstream.get(url, params=dict(params or {}, limit=1000, page=page), timeout=20)
+        if r.status_code != 200:
+            raise RuntimeError(f"{r.status_code}: {r.text}")
+        chunk = r.json().get("results", [])
+        results.extend(chunk)
+        if len(chunk) < 1000:
+            break
+    return results
+
+
+def _locked_refresh(path, reload, max_age, build):
+    """
+    Renueva el snapshot de path con build() si tiene más de max_age segundos (None = siempre).
+    reload() recarga el archivo y devuelve su antigüedad; build() pide a OpenAQ, guarda y devuelve
+    la cantidad de filas. Devuelve None si otro worker lo está renovando o ya estaba al día.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "w") as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        # otro worker pudo haberlo renovado justo antes de que tomáramos el lock
+        age = reload()
+        if max_age is not None and age is not None and age < max_age:
+            return None
+        return build()
+
+
+def _snapshots_refresher():
+    while True:
+        wait = max(interval for _, interval, _, _ in SNAPSHOT_JOBS)
+        for label, interval, reload, refresh in SNAPSHOT_JOBS:
+            age = reload()
+            if age is not None and age < interval:
+                wait = min(wait, interval - age)
+                continue
+            try:
+                with GOVERNOR.priority("background"):
+                    n = refresh(interval)
+                if n is None:
+                    # lo está renovando otro worker: volver a mirar pronto para recargarlo
+                    wait = min(wait, SNAPSHOT_RETRY)
+                else:
+                    print(f"{label}: {n}")
+            except Exception as e:
+                print(f"Error renovando {label}:", e)
+                wait = min(wait, PARAMETERS_RETRY)
+        time.sleep(wait + random.uniform(0, SNAPSHOT_RETRY / 2))
+
+
+# -------------------
+# Últimas lecturas de todas las estaciones por parámetro (mapas y ranking), ver latest_snapshot.py
+LATEST_PARAMETERS = [int(p) for p in os.getenv("LATEST_PARAMETERS", "2").split(",") if p.strip()]
+LATEST_REFRESH = int(os.getenv("LATEST_REFRESH", "600"))    # 0 = sin refresco de fondo
+LATEST_MAX_PAGES = int(os.getenv("LATEST_MAX_PAGES", "100"))
+LATEST_SNAPSHOTS = {}    # parameter_id -> LatestSnapshot (se reemplaza entero, nunca se modifica)
+
+
+def _latest_path(parameter_id):
+    return os.path.join(DATA_DIR, f"latest_{parameter_id}.npz")
+
+
+def _load_latest_snapshot(parameter_id):
+    """Recarga el .npz del parámetro si cambió. Devuelve su antigüedad en segundos, o None si no hay."""
+    path = _latest_path(parameter_id)
+    try:
+        current = LATEST_SNAPSHOTS.get(parameter_id)
+        if current is None or current.mtime != os.path.getmtime(path):
+            LATEST_SNAPSHOTS[parameter_id] = current = LatestSnapshot.load(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return time.time() - current.refreshed_at
+
+
+def refresh_latest(parameter_id, max_age=None):
+    """Renueva el snapshot de /parameters/{id}/latest (ver _locked_refresh)."""
+    path = _latest_path(parameter_id)
+
+    def build():
+        results = _fetch_all_pages(f"{BASE_V3}/parameters/{parameter_id}/latest", max_pages=LATEST_MAX_PAGES)
+        snap = LatestSnapshot.from_results(parameter_id, results, time.time())
+        snap.save(path)
+        LATEST_SNAPSHOTS[parameter_id] = snap
+        return len(snap)
+
+    return _locked_refresh(path, lambda: _load_latest_snapshot(parameter_id), max_age, build)
+
+
+if LATEST_REFRESH > 0:
+    for _pid in LATEST_PARAMETERS:
+        SNAPSHOT_JOBS.append((
+            f"Últimas lecturas del parámetro {_pid}", LATEST_REFRESH,
+            partial(_load_latest_snapshot, _pid), partial(refresh_latest, _pid),
+        ))
+
+
+def country_location_ids(iso):
+    """Array ordenado con los location ids de un país (ver country_stations)."""
+    catalog, idx = country_stations(iso)
+    return catalog.id[idx]
+
+
+@app.route("/api/latest", methods=["GET"])
+@cache_policy(CACHE_SHORT)
+def api_latest():
+    """
+    Última lectura de todas las estaciones de un país y/o bbox, desde el snapshot en memoria.
+    Query: parameter_id (uno de LATEST_PARAMETERS), country (ISO), bbox=oeste,sur,este,norte,
+    max_age_hours (descarta estaciones sin datos recientes), order=desc|asc (por valor), limit.
+    """
+    try:
+        try:
+            parameter_id = int(request.args.get("parameter_id", LATEST_PARAMETERS[0] if LATEST_PARAMETERS else 2))
+            bbox = parse_bbox(request.args["bbox"]) if request.args.get("bbox") else None
+            max_age = request.args.get("max_age_hours", type=float)
+            limit = request.args.get("limit", type=int)
+        except ValueError as e:
+            return jsonify(success=False, message=str(e)), 400
+        order = request.args.get("order")
+        if order not in (None, "asc", "desc"):
+            return jsonify(success=False, message="order debe ser asc o desc"), 400
+        if parameter_id not in LATEST_PARAMETERS:
+            return jsonify(success=False, message=f"parameter_id disponibles: {LATEST_PARAMETERS}"), 400
+
+        _load_latest_snapshot(parameter_id)
+        if parameter_id not in LATEST_SNAPSHOTS:
+            # primer arranque sin snapshot: una sola carga compartida por todas las requests del worker
+            SINGLE_FLIGHT.do(("latest", parameter_id), lambda: refresh_latest(parameter_id), label="/parameters/{id}/latest")
+        snap = LATEST_SNAPSHOTS.get(parameter_id)
+        if snap is None:
+            return jsonify(success=False, message="Snapshot de últimas lecturas en preparación"), 503
+
+        location_ids = country_location_ids(request.args["country"]) if request.args.get("country") else None
+        since = time.time() - max_age * 3600 if max_age is not None else None
+        results = snap.records(snap.select(bbox, location_ids, since), order=order, limit=limit)
+        return jsonify(
+            success=True,
+            parameter_id=parameter_id,
+            parameter=PARAMETERS_MAP.get(parameter_id),
+            refreshed_at=to_iso(snap.refreshed_at),
+            count=len(results),
+            results=results,
+        )
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
+# -------------------
+# Catálogo de estaciones (todas las páginas de /locations), ver station_catalog.py
+STATIONS_REFRESH = int(os.getenv("STATIONS_REFRESH", "86400"))    # 0 = sin refresco de fondo
+STATIONS_MAX_PAGES = int(os.getenv("STATIONS_MAX_PAGES", "200"))
+STATIONS_PATH = os.path.join(DATA_DIR, "stations.npz")
+STATION_CATALOG = None    # StationCatalog global (se reemplaza entero, nunca se modifica)
+# mientras no está el catálogo global, las estaciones de cada país se piden aparte
+COUNTRY_CATALOGS = TTLCache(maxsize=300, ttl=int(os.getenv("COUNTRY_CATALOG_TTL", "86400")))
+CLUSTER_MAX_ZOOM = int(os.getenv("CLUSTER_MAX_ZOOM", "13"))
+NEAREST_MAX = 100
+
+
+def _load_station_catalog():
+    """Recarga el .npz del catálogo si cambió. Devuelve su antigüedad en segundos, o None si no hay."""
+    global STATION_CATALOG
+    try:
+        current = STATION_CATALOG
+        if current is None or current.mtime != os.path.getmtime(STATIONS_PATH):
+            STATION_CATALOG = current = StationCatalog.load(STATIONS_PATH)
+    except (OSError, ValueError, KeyError):
+        return None
+    return time.time() - current.refreshed_at
+
+
+def refresh_stations(max_age=None):
+    """Renueva el catálogo global de estaciones (ver _locked_refresh)."""
+
+    def build():
+        global STATION_CATALOG
+        catalog = StationCatalog.from_results(
+            _fetch_all_pages(f"{BASE_V3}/locations", max_pages=STATIONS_MAX_PAGES), time.time()
+        )
+        catalog.save(STATIONS_PATH)
+        STATION_CATALOG = catalog
+        return len(catalog)
+
+    return _locked_refresh(STATIONS_PATH, _load_station_catalog, max_age, build)
+
+
+if STATIONS_REFRESH > 0:
+    SNAPSHOT_JOBS.append(("Catálogo de estaciones", STATIONS_REFRESH, _load_station_catalog, refresh_stations))
+if BACKGROUND_JOBS and SNAPSHOT_JOBS:
+    threading.Thread(target=_snapshots_refresher, name="snapshots-refresh", daemon=True).start()
+
+
+def station_catalog():
+    """Catálogo global; si todavía no existe, una sola carga compartida por todas las requests del worker."""
+    _load_station_catalog()
+    if STATION_CATALOG is None:
+        SINGLE_FLIGHT.do(("stations",), refresh_stations, label="/locations")
+    return STATION_CATALOG
+
+
+def country_stations(iso):
+    """(catálogo, índices) de las estaciones de un país: del catálogo global si ya está, si no de /locations?iso=."""
+    key = iso.upper()
+    _load_station_catalog()
+    if STATION_CATALOG is not None:
+        return STATION_CATALOG, STATION_CATALOG.select(country=key)
+    found, catalog = COUNTRY_CATALOGS.get(key)
+    if not found:
+        catalog = SINGLE_FLIGHT.do(("country_stations", key), lambda: _load_country_catalog(key), label="/locations")
+    return catalog, np.arange(len(catalog))
+
+
+def _load_country_catalog(iso):
+    results = _fetch_all_pages(f"{BASE_V3}/locations", {"iso": iso}, max_pages=STATIONS_MAX_PAGES)
+    catalog = StationCatalog.from_results(results, time.time())
+    COUNTRY_CATALOGS.set(iso, catalog)
+    return catalog
+
+
+@app.route("/api/stations_viewport", methods=["GET"])
+@cache_policy(CACHE_HOUR)
+def api_stations_viewport():
+    """
+    Estaciones visibles en el mapa. Query: bbox=oeste,sur,este,norte; country (ISO) y zoom opcionales.
+    Con zoom < CLUSTER_MAX_ZOOM las estaciones cercanas entre sí vuelven agrupadas en `clusters`
+    (centroide, cantidad, bounds) y en `results` solo quedan las sueltas.
+    """
+    try:
+        try:
+            bbox = parse_bbox(request.args.get("bbox"))
+            zoom = request.args.get("zoom", type=int)
+        except ValueError as e:
+            return jsonify(success=False, message=str(e)), 400
+        if zoom is not None and not 0 <= zoom <= 22:
+            return jsonify(success=False, message="zoom debe estar entre 0 y 22"), 400
+
+        country = request.args.get("country")
+        catalog = country_stations(country)[0] if country else station_catalog()
+        if catalog is None:
+            return jsonify(success=False, message="Catálogo de estaciones en preparación"), 503
+        idx = catalog.select(bbox, country)
+        if zoom is not None and zoom < CLUSTER_MAX_ZOOM:
+            clusters, singles = catalog.cluster(idx, zoom)
+        else:
+            clusters, singles = [], idx
+        results = catalog.records(singles)
+        return jsonify(success=True, total=len(idx), clusters=clusters, count=len(results), results=results)
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
+@app.route("/api/stations_nearest", methods=["GET"])
+@cache_policy(CACHE_HOUR)
+def api_stations_nearest():
+    """Las k estaciones más cercanas a lat/lon. Query: lat, lon, k (máx. NEAREST_MAX), max_km, country."""
+    try:
+        lat = request.args.get("lat", type=float)
+        lon = request.args.get("lon", type=float)
+        k = request.args.get("k", 5, type=int)
+        max_km = request.args.get("max_km", type=float)
+        if lat is None or lon is None or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            return jsonify(success=False, message="lat y lon son obligatorios y deben estar en rango"), 400
+        if not 1 <= k <= NEAREST_MAX:
+            return jsonify(success=False, message=f"k debe estar entre 1 y {NEAREST_MAX}"), 400
+
+        country = request.args.get("country")
+        catalog = country_stations(country)[0] if country else station_catalog()
+        if catalog is None:
+            return jsonify(success=False, message="Catálogo de estaciones en preparación"), 503
+        idx, dist = catalog.nearest(lat, lon, k=k, max_km=max_km, country=country)
+        results = catalog.records(idx, dist)
+        return jsonify(success=True, count=len(results), results=results)
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
+# -------------------
+# Productos satelitales en grilla (ver satellite.py): TEMPO, MODIS, ... muestreados en las estaciones
+SATELLITE_DIR = os.getenv("SATELLITE_DIR") or os.path.join(DATA_DIR, "satellite")
+SATELLITE = satellite.SatelliteArchive(
+    SATELLITE_DIR,
+    # valores de todas las estaciones por (archivo, catálogo) y estadísticas por bbox
+    cache=TTLCache(
+        maxsize=int(os.getenv("SATELLITE_CACHE_SIZE", "512")),
+        ttl=int(os.getenv("SATELLITE_CACHE_TTL", "86400")),
+    ),
+    max_open=int(os.getenv("SATELLITE_MAX_OPEN", "32")),
+)
+SATELLITE_MAX_POINTS = int(os.getenv("SATELLITE_MAX_POINTS", "10000"))
+SATELLITE_MAX_DATES = int(os.getenv("SATELLITE_MAX_DATES", "400"))
+METRICS.gauge("satellite_open_files", "Archivos satelitales abiertos (memmap)", lambda: [((), SATELLITE.stats()["open_files"])])
+
+
+def _json_values(values):
+    return [None if v != v else v for v in values.tolist()]    # NaN -> null
+
+
+@instrumentation.timed("satellite")
+def satellite_series(product, location_id, date_from, date_to):
+    """
+    {"units", "values": [{"date", "value"}]} del producto en la estación, una fila por fecha con archivo
+    en [date_from, date_to] (YYYY-MM-DD): se lee solo la celda de la estación en cada archivo. Las
+    coordenadas salen del catálogo si ya está cargado, si no de /locations/{id}. None si no hay coordenadas.
+    """
+    dates = SATELLITE.dates(product, date_from, date_to)[-SATELLITE_MAX_DATES:]
+    _load_station_catalog()
+    catalog = STATION_CATALOG
+    index = catalog.find(location_id) if catalog is not None else None
+    if index is not None:
+        coords = (catalog.lat[index], catalog.lon[index])
+    else:
+        coords = get_location_coordinates(location_id)
+        if coords is None:
+            return None
+    pairs = SATELLITE.series(product, coords[0], coords[1], dates)
+    return {"units": SATELLITE.units(product), "values": [{"date": d, "value": v} for d, v in pairs]}
+
+
+def _satellite_products(raw):
+    """'a,b' -> ['a', 'b'] validando que existan (KeyError si no)."""
+    products = [p for p in (raw or "").split(",") if p]
+    for p in products:
+        SATELLITE.dates(p)
+    return products
+
+
+def _parse_points(raw):
+    """'lat,lon;lat,lon' o [[lat, lon], ...] -> (lats, lons). ValueError si no es válido."""
+    try:
+        if isinstance(raw, str):
+            raw = [p.split(",") for p in raw.split(";") if p]
+        points = np.asarray(raw, dtype=np.float64).reshape(-1, 2)
+    except (TypeError, ValueError):
+        raise ValueError("points debe ser 'lat,lon;lat,lon' o [[lat, lon], ...]")
+    if len(points) == 0 or len(points) > SATELLITE_MAX_POINTS:
+        raise ValueError(f"entre 1 y {SATELLITE_MAX_POINTS} puntos")
+    return points[:, 0], points[:, 1]
+
+
+@app.route("/api/satellite/products", methods=["GET"])
+@cache_policy(CACHE_MEDIUM)
+def api_satellite_products():
+    """Productos disponibles en SATELLITE_DIR con sus fechas."""
+    try:
+        return jsonify(success=True, products=SATELLITE.products(), stats=SATELLITE.stats())
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
+@app.route("/api/satellite/<product>/<date>/sample", methods=["GET", "POST"])
+@cache_policy(CACHE_HOUR)
+def api_satellite_sample(product, date):
+    """
+    Valor del producto en muchos puntos a la vez (vecino más cercano; null sin dato).
+    GET ?points=lat,lon;lat,lon  o  POST {"points": [[lat, lon], ...]} (máx. SATELLITE_MAX_POINTS).
+    """
+    try:
+        raw = (request.get_json(silent=True) or {}).get("points") if request.method == "POST" else request.args.get("points")
+        try:
+            lats, lons = _parse_points(raw)
+        except ValueError as e:
+            return jsonify(success=False, message=str(e)), 400
+        try:
+            values = SATELLITE.sample(product, date, lats, lons)
+        except KeyError as e:
+            return jsonify(success=False, message=e.args[0]), 404
+        return jsonify(success=True, product=product, date=date, units=SATELLITE.units(product),
+                       count=len(values), values=_json_values(values))
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
+@app.route("/api/satellite/<product>/<date>/stations", methods=["GET"])
+@cache_policy(CACHE_HOUR)
+def api_satellite_stations(product, date):
+    """
+    Valor del producto en cada estación del catálogo dentro del bbox (y/o country), para unirlo con
+    las lecturas de OpenAQ en el mapa, más las estadísticas de la grilla dentro del bbox (`grid`).
+    Query: bbox=oeste,sur,este,norte (obligatorio), country opcional.
+    """
+    try:
+        try:
+            bbox = parse_bbox(request.args.get("bbox"))
+        except ValueError as e:
+            return jsonify(success=False, message=str(e)), 400
+        country = request.args.get("country")
+        catalog = country_stations(country)[0] if country else station_catalog()
+        if catalog is None:
+            return jsonify(success=False, message="Catálogo de estaciones en preparación"), 503
+        try:
+            values = SATELLITE.sample_catalog(product, date, catalog)
+            grid = SATELLITE.window(product, date, bbox)
+        except KeyError as e:
+            return jsonify(success=False, message=e.args[0]), 404
+        idx = catalog.select(bbox, country)
+        results = [
+            {"id": i, "latitude": la, "longitude": lo, "value": v}
+            for i, la, lo, v in zip(catalog.id[idx].tolist(), catalog.lat[idx].tolist(),
+                                    catalog.lon[idx].tolist(), _json_values(values[idx]))
+        ]
+        return jsonify(success=True, product=product, date=date, units=SATELLITE.units(product),
+                       grid=grid, count=len(results), results=results)
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
 # -------------------
 def find_sensor_by_parameter(location_id, parameter_id):
     """
     Busca el sensor dentro de la location que corresponde al parameter_id.
-    Devuelve el sensor (dict/obj) o None.
+    Devuelve el registro normalizado del sensor (ver _normalize_sensor) o None.
     """
     try:
-        # Usamos locations.get para tener la metadata completa de los sensores
-        resp = client.locations.get(locations_id=location_id)
-        if not resp.results:
+        # Metadata completa de los sensores (caché de /locations/{id})
+        return _best_sensor(get_location_sensors(location_id), parameter_id)
+    except Exception:
+        return None
+
+
+def _best_sensor(sensors_list, parameter_id):
+    """Entre los sensores normalizados del parameter_id, el de datetime_last más reciente."""
+    try:
+        if not sensors_list:
             return None
-        
-        sensors_list = getattr(resp.results[0], 'sensors', [])
 
         best = None
         best_dt = None
@@ -350,23 +1458,15 @@ def find_sensor_by_parameter(location_id, parameter_id):
 
 
         for s in sensors_list:
-            sid, pid, code, display, units = _extract_parameter_info(s)
-            
             # Comparamos el PID (int)
-            param_match = (pid == parameter_id_int)
+            param_match = (s["parameter_id"] == parameter_id_int)
             
             if param_match:
                 # intentar tomar datetimeLast para escoger el sensor con datos más recientes
-                dt_str = None
-                if isinstance(s, dict):
-                    dt_str = (s.get("datetimeLast") or {}).get("utc")
-                else:
-                    # En la API v2 de OpenAQ, el último datetime está en el objeto de la lista de sensores.
-                    dt_str = (getattr(s, "datetime_last", None) or {}).get("utc")
-                    
+                dt_str = s["datetime_last"]
                 if dt_str:
                     try:
-                        dt = dparser.parse(dt_str)
+                        dt = normalize.parse_datetime(dt_str)
                     except Exception:
                         dt = None
                 else:
@@ -379,36 +1479,672 @@ def find_sensor_by_parameter(location_id, parameter_id):
         return None
 
 
-def call_sensor_endpoint(sensor_id, suffix, params=None, max_pages=50):
+# Paginación concurrente: pool compartido y acotado para todas las requests del worker
+PARALLEL_PAGINATION = os.getenv("PARALLEL_PAGINATION", "1") == "1"
+PAGE_POOL = ThreadPoolExecutor(max_workers=PAGINATION_WORKERS, thread_name_prefix="openaq-page")
+
+
+def _fetch_sensor_page(url, params, page):
+    """Descarga una página. Devuelve (status, text, results, found)."""
+    page_params = dict(params)
+    page_params["page"] = page
+    r = upstream.get(url, params=page_params, timeout=20)
+    if r.status_code != 200:
+        return r.status_code, r.text, [], None
+    body = r.json()
+    found = (body.get("meta") or {}).get("found")
+    # 'found' puede venir como ">1000" cuando la API no cuenta el total
+    if not isinstance(found, int):
+        found = None
+    return 200, None, body.get("results", []), found
+
+
+def iter_sensor_pages(sensor_id, suffix, params=None, max_pages=50, parallel=None):
+    """
+    Generador de páginas de /v3/sensors/{sensor_id}/{suffix}, en orden: (status, text, results).
+    Después de una página con status != 200 no sigue. Es la base de call_sensor_endpoint y del
+    modo streaming: quien consume solo retiene la página actual (en paralelo, a lo sumo una
+    ventana de PAGINATION_WORKERS páginas en vuelo).
+    """
+    if parallel is None:
+        parallel = PARALLEL_PAGINATION
+    params = params.copy() if params else {}
+    params.setdefault("limit", 1000)
+    per_page = int(params["limit"])
+    url = f"{BASE_V3}/sensors/{sensor_id}/{suffix}"
+
+    status, text, chunk, found = _fetch_sensor_page(url, params, 1)
+    yield status, text, chunk
+    if status != 200 or len(chunk) < per_page or max_pages <= 1:
+        return
+
+    if not parallel:
+        page = 2
+        while True:
+            status, text, chunk, _ = _fetch_sensor_page(url, params, page)
+            yield status, text, chunk
+            if status != 200 or len(chunk) < per_page or page >= max_pages:
+                return
+            page += 1
+
+    # con meta.found exacto se pide hasta la última página; si no, hasta ver una incompleta
+    total_pages = -(-found // per_page) if found else None
+    last = min(total_pages if total_pages and total_pages >= 2 else max_pages, max_pages)
+    # ventana deslizante: a lo sumo PAGINATION_WORKERS páginas pedidas y sin entregar
+    pending = deque()
+    next_page = 2
+    try:
+        while True:
+            while next_page <= last and len(pending) < PAGINATION_WORKERS:
+                pending.append(instrumentation.submit(PAGE_POOL, _fetch_sensor_page, url, params, next_page))
+                next_page += 1
+            if not pending:
+                return
+            status, text, chunk, _ = pending.popleft().result()
+            yield status, text, chunk
+            if status != 200 or len(chunk) < per_page:
+                return
+    finally:
+        # también si el consumidor deja de iterar (cliente desconectado)
+        for fut in pending:
+            fut.cancel()
+
+
+@instrumentation.timed("fetch")
+def call_sensor_endpoint(sensor_id, suffix, params=None, max_pages=50, parallel=None):
     """
     Helper para llamar a /v3/sensors/{sensor_id}/{suffix} paginando hasta max_pages.
-    Devuelve dict: {"ok": bool, "status": int, "text": ..., "results": [...]}
+    Devuelve dict: {"ok": bool, "status": int, "text": ..., "results": [...], "truncated": bool}
+    truncated indica que se cortó en max_pages con la última página llena (puede haber más filas).
+
+    Con parallel=True (por defecto según PARALLEL_PAGINATION) la primera página se pide sola
+    para conocer meta.found; el resto se pide en paralelo en PAGE_POOL, con a lo sumo
+    PAGINATION_WORKERS páginas por delante de la que se entrega. Si la API no informa el total,
+    se sigue pidiendo así hasta ver una página incompleta. El orden de los resultados y el
+    resultado parcial ante error se mantienen.
     """
+    per_page = int((params or {}).get("limit", 1000))
     results = []
-    page = 1
-    per_page = 1000
-    params = params.copy() if params else {}
-    params.setdefault("limit", per_page)
-    while True:
-        params["page"] = page
-        url = f"{BASE_V3}/sensors/{sensor_id}/{suffix}"
-        r = requests.get(url, headers=HEADERS, params=params, timeout=20)
-        if r.status_code != 200:
-            # si fallo en p=1 devolvemos error directo
-            if page == 1:
-                return {"ok": False, "status": r.status_code, "text": r.text, "results": []}
-            else:
-                return {"ok": False, "status": r.status_code, "text": r.text, "results": results}
-        chunk = r.json().get("results", [])
+    pages = 0
+    chunk = []
+    for status, text, chunk in iter_sensor_pages(sensor_id, suffix, params, max_pages, parallel):
+        if status != 200:
+            return {"ok": False, "status": status, "text": text, "results": results, "truncated": False}
         results.extend(chunk)
-        if len(chunk) < per_page or page >= max_pages:
+        pages += 1
+    truncated = pages >= max_pages and len(chunk) >= per_page
+    return {"ok": True, "status": 200, "results": results, "truncated": truncated}
+
+
+# -------------------
+# Histórico local con sincronización incremental (ver timeseries_store.py)
+TS_STORE = None
+if os.getenv("TS_STORE", "1") == "1":
+    try:
+        TS_STORE = TimeSeriesStore(os.getenv("TS_STORE_PATH") or os.path.join(DATA_DIR, "timeseries.sqlite"))
+    except Exception as e:
+        print("Error abriendo el almacén de series:", e)
+
+# no volvemos a pedir la cola a OpenAQ si la última sincronización es más reciente que esto (s)
+TS_TAIL_REFRESH = int(os.getenv("TS_TAIL_REFRESH", "300"))
+
+# por tipo de serie: (tamaño de cada tramo de descarga, solape al refrescar la cola) en días.
+# El último periodo (hora/día/mes en curso) todavía puede cambiar, por eso se vuelve a pedir.
+TS_SLICES = {
+    "measurements": (90, 1),
+    "hours": (90, 1),
+    "measurements/hourly": (90, 1),
+    "days": (3650, 2),
+    "measurements/daily": (3650, 2),
+    "days/monthly": (36500, 32),
+    "measurements/monthly": (36500, 32),
+    "days/yearly": (36500, 367),
+    "measurements/yearly": (36500, 367),
+}
+
+
+def _missing_ranges(suffix, coverage, ts_from, ts_to, now):
+    """
+    Tramos [(desde, hasta), ...] que hay que pedir a OpenAQ para cubrir [ts_from, ts_to]: la
+    ventana pedida menos los intervalos ya sincronizados (TS_STORE.coverage), nunca el hueco
+    entre la ventana y una cobertura lejana. Un tramo que sigue a un intervalo sincronizado
+    "en vivo" (su final era el presente) arranca `overlap` antes, porque el último periodo
+    todavía podía cambiar; si ese final tiene menos de TS_TAIL_REFRESH s, no se vuelve a pedir.
+    """
+    ts_to = min(ts_to, now)
+    overlap = TS_SLICES.get(suffix, (90, 1))[1] * 86400
+    gaps = []
+    start, before = ts_from, None    # before: (covered_to, synced_at) del intervalo que termina en start
+    for covered_from, covered_to, synced_at in coverage:
+        if covered_to < start:
+            continue
+        if covered_from > ts_to:
+            break
+        if covered_from > start:
+            gaps.append((start, covered_from, before))
+        start, before = max(start, covered_to), (covered_to, synced_at)
+    if start < ts_to or (before is None and start == ts_to):
+        gaps.append((start, ts_to, before))
+
+    ranges = []
+    for a, b, before in gaps:
+        if before is not None and before[1] - before[0] < overlap:
+            if now - before[0] < TS_TAIL_REFRESH:
+                continue
+            a = before[0] - overlap
+        ranges.append((a, b))
+    return ranges
+
+
+def _slices(suffix, ts_from, ts_to):
+    step = TS_SLICES.get(suffix, (90, 1))[0] * 86400
+    out = []
+    start = ts_from
+    while start < ts_to:
+        out.append((start, min(start + step, ts_to)))
+        start += step
+    if not out:
+        out.append((ts_from, ts_to))
+    return out
+
+
+@instrumentation.timed("fetch")
+def get_sensor_series(sensor_id, suffix, date_from=None, date_to=None, max_pages=40, as_rows=False):
+    """
+    Igual que call_sensor_endpoint, pero para rangos con date_from sirve lo que ya está en
+    TS_STORE y solo descarga de OpenAQ los tramos de la ventana que faltan, en tramos
+    de TS_SLICES para no toparse con max_pages. Los tramos se guardan según llegan, así un
+    error deja persistido lo ya descargado; en ese caso devuelve ok=False con lo que haya local.
+    Con as_rows=True los resultados son tuplas (ts_epoch, value, unit, parameter).
+    complete=True si la ventana salió entera: sin cortes por max_pages y, con almacén, cubierta.
+    """
+    if TS_STORE is None or not date_from:
+        params = {}
+        if date_from: params["date_from"] = date_from
+        if date_to: params["date_to"] = date_to
+        info = call_sensor_endpoint(sensor_id, suffix, params=params, max_pages=max_pages)
+        if as_rows:
+            info["results"] = sorted(normalize.store_rows(info["results"]))
+        info["complete"] = info["ok"] and not info["truncated"]
+        return info
+
+    ts_from, ts_to = _epoch_window(date_from, date_to)
+    sensor_id = int(sensor_id)
+    error = sync_sensor_series(sensor_id, suffix, ts_from, ts_to, max_pages=max_pages)
+
+    results = TS_STORE.query(sensor_id, suffix, ts_from, ts_to)
+    if not as_rows:
+        results = normalize.results_from_rows(results)
+    if error:
+        return {"ok": False, "status": error.get("status"), "text": error.get("text"), "results": results,
+                "complete": False}
+    complete = TS_STORE.covers(sensor_id, suffix, ts_from, _synced_end(ts_from, ts_to))
+    return {"ok": True, "status": 200, "results": results, "complete": complete}
+
+
+def _epoch_window(date_from, date_to):
+    ts_to = to_epoch(normalize.parse_datetime(date_to)) if date_to else int(time.time())
+    return to_epoch(normalize.parse_datetime(date_from)), ts_to
+
+
+def _synced_end(ts_from, ts_to):
+    """Hasta dónde tiene que estar cubierta [ts_from, ts_to]: la cola de menos de TS_TAIL_REFRESH s no se vuelve a pedir."""
+    return max(ts_from, min(ts_to, int(time.time()) - TS_TAIL_REFRESH))
+
+
+def sync_sensor_series(sensor_id, suffix, ts_from, ts_to, max_pages=40):
+    """
+    Descarga de OpenAQ a TS_STORE los tramos de [ts_from, ts_to] que faltan.
+    Devuelve None, o el dict de call_sensor_endpoint del tramo que falló. Un tramo cortado
+    por max_pages se guarda pero no se marca como cubierto.
+    """
+    for _, _, error in _sync_slices(sensor_id, suffix, ts_from, ts_to, max_pages):
+        if error:
+            return error
+    return None
+
+
+def _sync_slices(sensor_id, suffix, ts_from, ts_to, max_pages=40):
+    """
+    Genera (s_from, s_to, error) por cada tramo que faltaba, en orden cronológico, apenas queda
+    guardado en TS_STORE. error es None o el dict de call_sensor_endpoint; tras un error no sigue.
+    """
+    now = int(time.time())
+    for a, b in _missing_ranges(suffix, TS_STORE.coverage(sensor_id, suffix), ts_from, ts_to, now):
+        for s_from, s_to in _slices(suffix, a, b):
+            params = {"date_from": to_iso(s_from), "date_to": to_iso(s_to)}
+            info = call_sensor_endpoint(sensor_id, suffix, params=params, max_pages=max_pages)
+            rows = normalize.store_rows(info.get("results", []))
+            TS_STORE.upsert(sensor_id, suffix, rows)
+            if not info.get("ok"):
+                yield s_from, s_to, info
+                return
+            if not info.get("truncated"):
+                TS_STORE.extend_coverage(sensor_id, suffix, s_from, s_to)
+            yield s_from, s_to, None
+
+
+def iter_sensor_series(sensor_id, suffix, date_from=None, date_to=None, max_pages=40):
+    """
+    Versión en streaming de get_sensor_series: genera (status, text, results) por bloques.
+    Con TS_STORE sincroniza lo que falta tramo a tramo y, apenas se guarda cada tramo, emite
+    desde un cursor lo que ya está local hasta su final; sin almacén pasa las páginas de
+    OpenAQ según llegan.
+    """
+    if TS_STORE is None or not date_from:
+        params = {}
+        if date_from: params["date_from"] = date_from
+        if date_to: params["date_to"] = date_to
+        yield from iter_sensor_pages(sensor_id, suffix, params=params, max_pages=max_pages)
+        return
+
+    ts_from, ts_to = _epoch_window(date_from, date_to)
+    sensor_id = int(sensor_id)
+    cursor = ts_from    # lo anterior a cursor ya salió
+    for _, s_to, error in _sync_slices(sensor_id, suffix, ts_from, ts_to, max_pages=max_pages):
+        if error:
+            yield error.get("status"), error.get("text"), []
+            return
+        # el borde s_to queda para después: también lo trae el tramo siguiente
+        for rows in TS_STORE.iter_query(sensor_id, suffix, cursor, s_to - 1):
+            yield 200, None, normalize.results_from_rows(rows)
+        cursor = max(cursor, s_to)
+    for rows in TS_STORE.iter_query(sensor_id, suffix, cursor, ts_to):
+        yield 200, None, normalize.results_from_rows(rows)
+
+
+# -------------------
+# Agregación local (ver aggregation.py)
+# AGG_ENGINE: "upstream" = rollups de OpenAQ con toda la cadena de candidatos (comportamiento anterior),
+#             "local"    = siempre calculado aquí desde las mediciones crudas,
+#             "fallback" = rollup principal de OpenAQ y, si falla, cálculo local (sin más candidatos).
+# El cálculo local solo se hace con una ventana acotada (date_from o last_days); sin ella,
+# "fallback" se comporta como "upstream" y "local" responde 400.
+AGG_ENGINE = os.getenv("AGG_ENGINE", "fallback")
+
+
+def aggregate_sensor_series(sensor_id, agg, date_from, date_to=None, max_pages=40):
+    """
+    Calcula el rollup (hours/days/monthly/yearly) desde las mediciones crudas del sensor, en una
+    ventana acotada. Devuelve el mismo dict que call_sensor_endpoint, con filas en forma de
+    rollup de OpenAQ. Si las mediciones no salieron enteras (corte por max_pages, error a mitad,
+    tramos sin sincronizar) se descartan los periodos que tocan lo que falta, en vez de darlos
+    por completos con menos datos.
+    """
+    period = aggregation.AGG_PERIODS[agg]
+    info = get_sensor_series(sensor_id, "measurements", date_from=date_from, date_to=date_to,
+                             max_pages=max_pages, as_rows=True)
+    rows = info.get("results", [])
+    if not rows:
+        return info
+    ts = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+    values = np.fromiter((np.nan if r[1] is None else r[1] for r in rows), dtype=np.float64, count=len(rows))
+    _, _, unit, parameter = rows[-1]
+    with instrumentation.phase("aggregate"):
+        agg_out = aggregation.aggregate(ts, values, period)
+        if not info.get("complete"):
+            agg_out = aggregation.drop_periods(agg_out, _missing_spans(sensor_id, date_from, date_to, ts))
+        info = dict(info)
+        info["results"] = aggregation.to_rollup_rows(agg_out, to_iso, unit=unit, parameter=parameter)
+    return info
+
+
+def _missing_spans(sensor_id, date_from, date_to, ts):
+    """
+    Huecos [a, b) de la ventana donde pueden faltar mediciones. Con TS_STORE, lo que no está
+    sincronizado; sin almacén las páginas son contiguas, así que solo puede faltar antes de la
+    primera fila o después de la última.
+    """
+    if TS_STORE is None:
+        return [(-np.inf, int(ts[0])), (int(ts[-1]) + 1, np.inf)]
+    ts_from, ts_to = _epoch_window(date_from, date_to)
+    ts_to = _synced_end(ts_from, ts_to)
+    spans, start = [], ts_from
+    for covered_from, covered_to, _ in TS_STORE.coverage(int(sensor_id), "measurements"):
+        if covered_from > start:
+            spans.append((start, min(covered_from, ts_to)))
+        start = max(start, covered_to)
+    if start < ts_to:
+        spans.append((start, ts_to))
+    return [(a, b) for a, b in spans if a < b]
+
+
+# -------------------
+_LOOKUP = object()
+
+
+def _measurement_window(sensor, last_days, date_from, date_to):
+    """Si last_days es pedido (y no date_from), calcula date_from/date_to usando datetimeLast del sensor (o ahora)."""
+    if last_days and (not date_from):
+        try:
+            days = int(last_days)
+        except Exception:
+            days = None
+        if days:
+            dt_to = None
+            if sensor:
+                dt_str = sensor["datetime_last"]
+                try:
+                    dt_to = normalize.parse_datetime(dt_str) if dt_str else datetime.utcnow()
+                except Exception:
+                    dt_to = datetime.utcnow()
+            else:
+                dt_to = datetime.utcnow()
+            dt_from_obj = dt_to - timedelta(days=days)
+            date_from = dt_from_obj.isoformat()
+            # Ajustar date_to al último día encontrado o hoy
+            date_to = dt_to.isoformat()
+    return date_from, date_to
+
+
+# mapping agg -> sensor endpoint suffix candidates
+AGG_CANDIDATES = {
+    "raw": ["measurements"],
+    "hours": ["hours", "measurements/hourly"],
+    "days": ["days", "measurements/daily"],
+    "monthly": ["days/monthly", "measurements/monthly"],
+    "yearly": ["days/yearly", "measurements/yearly"]
+}
+
+
+def _agg_candidates(agg, engine, date_from=None):
+    """
+    (sufijos a probar en orden, si se calcula localmente cuando no hay rollup de OpenAQ).
+    El cálculo local necesita una ventana acotada (date_from): sin ella, "fallback" se queda con
+    los rollups de OpenAQ y "local" es ValueError.
+    """
+    candidates = AGG_CANDIDATES.get(agg, ["measurements"])
+    engine = (engine or AGG_ENGINE).lower()
+    local_agg = agg in aggregation.AGG_PERIODS and engine in ("local", "fallback")
+    if local_agg and not date_from:
+        if engine == "local":
+            raise ValueError("engine=local necesita date_from o last_days")
+        local_agg = False
+    if local_agg:
+        # "local": ningún rollup de OpenAQ; "fallback": solo el principal
+        candidates = [] if engine == "local" else candidates[:1]
+    return candidates, local_agg
+
+
+def measurements_payload(location_id, parameter_id, agg="raw", limit="100", last_days=None,
+                         date_from=None, date_to=None, engine=None, sensor=_LOOKUP, report=None):
+    """
+    Núcleo de /api/measurements (y de cada serie de /api/measurements/batch).
+    Devuelve (payload, status) con el mismo JSON de siempre. Si el sensor ya se resolvió
+    (batch), se pasa en `sensor` (registro normalizado o None) y no se vuelve a buscar.
+    Si se pasa `report` (dict), deja en report["complete"] si la respuesta tiene la ventana
+    entera del sensor: no el fallback global, ni recortada por limit o max_pages.
+    """
+    if report is None:
+        report = {}
+    report["complete"] = False
+    agg = (agg or "raw").lower()
+    if limit is None:
+        limit = "100"
+
+    # localizar sensor que corresponde al parameter_id
+    if sensor is _LOOKUP:
+        sensor = find_sensor_by_parameter(location_id, parameter_id)
+    sensor_id = None
+    sensor_units = None
+    if sensor:
+        sensor_id = sensor["sensor_id"]
+        # units ya vienen normalizadas en el registro del sensor
+        sensor_units = sensor["units"]
+
+    date_from, date_to = _measurement_window(sensor, last_days, date_from, date_to)
+
+    # validate date_from/date_to (if provided)
+    try:
+        if date_from:
+            _ = normalize.parse_datetime(date_from)
+        if date_to:
+            _ = normalize.parse_datetime(date_to)
+    except Exception:
+        return {"success": False, "message": "date_from/date_to no válidas"}, 400
+
+    # si no encontramos sensor hacemos fallback a measurements global (location_id + parameter_id)
+    if sensor_id is None:
+        # fallback simple
+        url = f"{BASE_V3}/measurements"
+        params = {
+            "location_id": location_id,
+            "parameters_id": parameter_id,
+            "limit": int(limit) if str(limit).isdigit() else 100,
+            "order_by": "datetime",
+            "sort": "desc"
+        }
+        if date_from: params["date_from"] = date_from
+        if date_to: params["date_to"] = date_to
+        r = upstream.get(url, params=params, timeout=15)
+        if r.status_code != 200:
+            return {"success": False, "status": r.status_code, "message": r.text}, r.status_code
+        results = r.json().get("results", [])
+        out = []
+        with instrumentation.phase("format"):
+            for it in results:
+                dt = normalize.prefer_datetime(it)
+                unit = (it.get("parameter") or {}).get("units") or it.get("unit") or sensor_units
+                out.append({"datetime_utc": dt, "value": it.get("value"), "unit": unit, "parameter": (it.get("parameter") or {}).get("name")})
+        return {"success": True, "count": len(out), "results": out}, 200
+
+    try:
+        candidates, local_agg = _agg_candidates(agg, engine, date_from)
+    except ValueError as e:
+        return {"success": False, "message": str(e)}, 400
+
+    results = []
+    last_err = None
+    for cand in candidates:
+        # histórico local + solo lo que falta desde OpenAQ
+        info = get_sensor_series(sensor_id, cand, date_from=date_from, date_to=date_to, max_pages=40)
+        if info.get("ok"):
+            results = info["results"]
+            report["complete"] = info.get("complete", False)
+            last_err = None
+            break
+        else:
+            last_err = {"status": info.get("status"), "text": info.get("text")}
+
+    if local_agg and (not candidates or last_err):
+        info = aggregate_sensor_series(sensor_id, agg, date_from=date_from, date_to=date_to, max_pages=40)
+        if info.get("ok") or info.get("results"):
+            results = info["results"]
+            report["complete"] = bool(info.get("ok") and info.get("complete"))
+            last_err = None
+        else:
+            last_err = {"status": info.get("status"), "text": info.get("text")}
+
+    if not results and last_err:
+        return {"success": False, "status": last_err.get("status"), "message": last_err.get("text")}, last_err.get("status", 500)
+
+    # si agg == raw y limit es numerico, recortar
+    if agg == "raw" and str(limit).isdigit():
+        n = int(limit)
+        if n < len(results):
+            results = results[:n]
+            report["complete"] = False
+
+    # formatear salida
+    with instrumentation.phase("format"):
+        out = normalize.format_measurements(results, sensor_units)
+    return {"success": True, "count": len(out), "results": out}, 200
+
+
+# -------------------
+# Streaming: el histórico sale por bloques según llega, sin armar la lista completa
+STREAM_FORMATS = {"ndjson": "application/x-ndjson", "json": "application/json"}
+
+
+def _prepend(first, rest):
+    yield first
+    yield from rest
+
+
+def measurements_stream(location_id, parameter_id, agg="raw", limit="100", last_days=None,
+                        date_from=None, date_to=None, engine=None):
+    """
+    Igual que measurements_payload, pero devuelve (chunks, None), donde chunks genera
+    (status, text, filas formateadas) por página/bloque, o (None, (payload, status)) si falla
+    antes de tener la primera página. Un status != 200 dentro de chunks es un error a mitad de camino.
+    """
+    agg = (agg or "raw").lower()
+    if limit is None:
+        limit = "100"
+
+    sensor = find_sensor_by_parameter(location_id, parameter_id)
+    if sensor is None:
+        # fallback a /measurements de la location: una sola página, no hay nada que streamear
+        payload, status = measurements_payload(location_id, parameter_id, agg=agg, limit=limit, last_days=last_days,
+                                               date_from=date_from, date_to=date_to, engine=engine, sensor=None)
+        if status != 200:
+            return None, (payload, status)
+        return iter([(200, None, payload["results"])]), None
+
+    sensor_id = sensor["sensor_id"]
+    sensor_units = sensor["units"]
+    date_from, date_to = _measurement_window(sensor, last_days, date_from, date_to)
+    try:
+        if date_from:
+            _ = normalize.parse_datetime(date_from)
+        if date_to:
+            _ = normalize.parse_datetime(date_to)
+    except Exception:
+        return None, ({"success": False, "message": "date_from/date_to no válidas"}, 400)
+
+    try:
+        candidates, local_agg = _agg_candidates(agg, engine, date_from)
+    except ValueError as e:
+        return None, ({"success": False, "message": str(e)}, 400)
+    source = None
+    last_err = None
+    for cand in candidates:
+        pages = iter_sensor_series(sensor_id, cand, date_from=date_from, date_to=date_to, max_pages=40)
+        first = next(pages, (200, None, []))
+        if first[0] == 200:
+            source = _prepend(first, pages)
             break
-        page += 1
-    return {"ok": True, "status": 200, "results": results}
+        pages.close()
+        last_err = {"status": first[0], "text": first[1]}
+
+    if source is None and local_agg:
+        # el rollup local necesita la serie completa, pero la salida es una fila por periodo
+        info = aggregate_sensor_series(sensor_id, agg, date_from=date_from, date_to=date_to, max_pages=40)
+        if info.get("ok") or info.get("results"):
+            source = _prepend((200, None, info["results"]), ())
+        else:
+            last_err = {"status": info.get("status"), "text": info.get("text")}
+
+    if source is None:
+        return None, ({"success": False, "status": last_err.get("status"), "message": last_err.get("text")},
+                      last_err.get("status") or 500)
+
+    def chunks():
+        # si agg == raw y limit es numerico, cortar (y dejar de pedir páginas) al llegar
+        remaining = int(limit) if agg == "raw" and str(limit).isdigit() else None
+        try:
+            for status, text, rows in source:
+                if status != 200:
+                    yield status, text, []
+                    return
+                if remaining is not None:
+                    rows = rows[:remaining]
+                    remaining -= len(rows)
+                yield 200, None, normalize.format_measurements(rows, sensor_units)
+                if remaining == 0:
+                    return
+        finally:
+            source.close()
+
+    return chunks(), None
+
+
+def _stream_response(chunks, fmt):
+    """
+    ndjson: una fila por línea; un error a mitad de camino sale como última línea {"success": false, ...}.
+    json: el mismo objeto que sin streaming ({"results": [...], "count", "success"}), escrito por partes.
+    """
+    dumps = app.json.dumps
+
+    def ndjson():
+        try:
+            for status, text, rows in chunks:
+                if status != 200:
+                    yield dumps({"success": False, "status": status, "message": text}) + "\n"
+                    return
+                if rows:
+                    yield "".join(dumps(r) + "\n" for r in rows)
+        except Exception as e:
+            yield dumps({"success": False, "message": str(e)}) + "\n"
+
+    def json_array():
+        count = 0
+        yield '{"results": ['
+        try:
+            for status, text, rows in chunks:
+                if status != 200:
+                    yield f'], "count": {count}, "success": false, "status": {dumps(status)}, "message": {dumps(text)}}}'
+                    return
+                if rows:
+                    yield ("," if count else "") + ",".join(dumps(r) for r in rows)
+                    count += len(rows)
+        except Exception as e:
+            yield f'], "count": {count}, "success": false, "message": {dumps(str(e))}}}'
+            return
+        yield f'], "count": {count}, "success": true}}'
+
+    body = ndjson() if fmt == "ndjson" else json_array()
+    return Response(stream_with_context(body), mimetype=STREAM_FORMATS[fmt])
 
 
 # -------------------
+# Formatos compactos para series (?format=): unit/parameter una sola vez y columnas paralelas
+#   columnar: JSON {"t": [epoch s, ...], "v": [valor | null, ...], "unit", "parameter", "count", "success"}
+#   binary:   application/octet-stream, little-endian:
+#             b"OAQ1" | uint32 n | uint32 meta_len | meta JSON utf-8 (relleno a múltiplo de 4)
+#             | uint32[n] epoch s | float32[n] valores (NaN = sin dato)
+SERIES_FORMATS = ("json", "columnar", "binary")
+SERIES_MAGIC = b"OAQ1"
+
+
+@instrumentation.timed("format")
+def _series_columns(rows):
+    """Filas formateadas (datetime_utc, value, unit[, parameter]) -> (ts int64, values float64, meta)."""
+    rows = [r for r in rows if r.get("datetime_utc")]
+    ts = normalize.epochs([r["datetime_utc"] for r in rows])
+    values = np.fromiter((np.nan if r.get("value") is None else r["value"] for r in rows), dtype=np.float64, count=len(rows))
+    units = [r.get("unit") for r in rows]
+    meta = {
+        "count": len(rows),
+        "unit": next((u for u in units if u), None),
+        "parameter": next((r.get("parameter") for r in rows if r.get("parameter")), None),
+    }
+    # casi nunca cambia dentro de una serie; si cambia, va por fila
+    if len(set(units)) > 1:
+        meta["units"] = units
+    return ts, values, meta
+
+
+def _series_response(rows, fmt):
+    ts, values, meta = _series_columns(rows)
+    if fmt == "columnar":
+        v = [None if np.isnan(x) else x for x in values.tolist()]
+        return jsonify(success=True, t=ts.tolist(), v=v, **meta)
+
+    head = app.json.dumps(meta).encode("utf-8")
+    head += b" " * (-len(head) % 4)
+    body = b"".join((
+        SERIES_MAGIC,
+        np.array([len(ts), len(head)], dtype="<u4").tobytes(),
+        head,
+        ts.astype("<u4").tobytes(),
+        values.astype("<f4").tobytes(),
+    ))
+    return Response(body, mimetype="application/octet-stream")
+
+
 @app.route("/api/measurements/<int:location_id>/<int:parameter_id>", methods=["GET"])
+@cache_policy(history_policy)
 def api_measurements(location_id, parameter_id):
     """
     Compatible con tu frontend:
@@ -417,204 +2153,360 @@ def api_measurements(location_id, parameter_id):
       - limit: número (solo para raw), o 'all' (no recomendado)
       - last_days: entero -> usa última medición del sensor y retrocede N días
       - date_from, date_to: ISO datetimes (si se pasan, se usan)
+      - engine: upstream | local | fallback (default: AGG_ENGINE) para agg != raw
+      - stream: ndjson | json -> respuesta por partes según llegan las páginas (memoria constante)
+      - format: json | columnar | binary (ver SERIES_FORMATS); no se combina con stream
+      - satellite: productos de SATELLITE_DIR separados por coma -> `satellite` con el valor diario
+        de cada uno en la estación, para las fechas de los resultados (solo format=json sin stream)
     """
+    agg = (request.args.get("agg") or "raw").lower()
+    if agg in PREFETCH_WINDOWS:
+        HOT_KEYS.hit(("measurements", location_id, parameter_id, agg))
     try:
-        agg = (request.args.get("agg") or "raw").lower()
-        limit = request.args.get("limit", "100")
-        last_days = request.args.get("last_days", None)
-        date_from = request.args.get("date_from", None)
-        date_to = request.args.get("date_to", None)
-
-        # localizar sensor que corresponde al parameter_id
-        sensor = find_sensor_by_parameter(location_id, parameter_id)
-        sensor_id = None
-        sensor_units = None
-        if sensor:
-            sensor_id = sensor.get("id") if isinstance(sensor, dict) else getattr(sensor, "id", None)
-            # obtener units si están en metadata
-            try:
-                param = sensor.get("parameter") if isinstance(sensor, dict) else getattr(sensor, "parameter", None)
-                if isinstance(param, dict):
-                    sensor_units = param.get("units")
-                else:
-                    # Acceder a la unidad directamente desde el parámetro del objeto sensor (v2)
-                    sensor_units = getattr(param, "units", None) if param else None
-            except Exception:
-                sensor_units = None
-
-        # si last_days es pedido, calcular date_from/date_to usando datetimeLast del sensor (o ahora)
-        if last_days and (not date_from):
-            try:
-                days = int(last_days)
-            except Exception:
-                days = None
-            if days:
-                dt_to = None
-                if sensor:
-                    if isinstance(sensor, dict):
-                        dt_str = (sensor.get("datetimeLast") or {}).get("utc")
-                    else:
-                        dt_str = (getattr(sensor, "datetime_last", None) or {}).get("utc")
-                    try:
-                        dt_to = dparser.parse(dt_str) if dt_str else datetime.utcnow()
-                    except Exception:
-                        dt_to = datetime.utcnow()
-                else:
-                    dt_to = datetime.utcnow()
-                dt_from_obj = dt_to - timedelta(days=days)
-                date_from = dt_from_obj.isoformat()
-                # Ajustar date_to al último día encontrado o hoy
-                date_to = dt_to.isoformat()
-
-        # validate date_from/date_to (if provided)
+        fmt = request.args.get("format", "json")
+        if fmt not in SERIES_FORMATS:
+            return jsonify(success=False, message="format debe ser json, columnar o binary"), 400
+        stream = request.args.get("stream")
+        if stream and fmt != "json":
+            return jsonify(success=False, message="stream solo admite format=json"), 400
         try:
-            if date_from:
-                _ = dparser.parse(date_from)
-            if date_to:
-                _ = dparser.parse(date_to)
-        except Exception:
-            return jsonify(success=False, message="date_from/date_to no válidas"), 400
-
-        # si no encontramos sensor hacemos fallback a measurements global (location_id + parameter_id)
-        if sensor_id is None:
-            # fallback simple
-            url = f"{BASE_V3}/measurements"
-            params = {
-                "location_id": location_id,
-                "parameters_id": parameter_id,
-                "limit": int(limit) if str(limit).isdigit() else 100,
-                "order_by": "datetime",
-                "sort": "desc"
+            products = _satellite_products(request.args.get("satellite"))
+        except KeyError as e:
+            return jsonify(success=False, message=e.args[0]), 400
+        if products and (stream or fmt != "json"):
+            return jsonify(success=False, message="satellite solo admite format=json sin stream"), 400
+        if stream:
+            if stream not in STREAM_FORMATS:
+                return jsonify(success=False, message="stream debe ser ndjson o json"), 400
+            chunks, error = measurements_stream(
+                location_id,
+                parameter_id,
+                agg=request.args.get("agg"),
+                limit=request.args.get("limit", "100"),
+                last_days=request.args.get("last_days", None),
+                date_from=request.args.get("date_from", None),
+                date_to=request.args.get("date_to", None),
+                engine=request.args.get("engine"),
+            )
+            if error:
+                payload, status = error
+                return jsonify(payload), status
+            return _stream_response(chunks, stream)
+
+        report = {}
+        payload, status = measurements_payload(
+            location_id,
+            parameter_id,
+            agg=request.args.get("agg"),
+            limit=request.args.get("limit", "100"),
+            last_days=request.args.get("last_days", None),
+            date_from=request.args.get("date_from", None),
+            date_to=request.args.get("date_to", None),
+            engine=request.args.get("engine"),
+            report=report,
+        )
+        g.history_complete = report["complete"]
+        if status == 200 and fmt != "json":
+            return _series_response(payload["results"], fmt)
+        if status == 200 and products:
+            days = [r["datetime_utc"][:10] for r in payload["results"] if r.get("datetime_utc")]
+            payload["satellite"] = {
+                p: satellite_series(p, location_id, min(days), max(days)) if days else {"units": None, "values": []}
+                for p in products
             }
-            if date_from: params["date_from"] = date_from
-            if date_to: params["date_to"] = date_to
-            r = requests.get(url, headers=HEADERS, params=params, timeout=15)
-            if r.status_code != 200:
-                return jsonify(success=False, status=r.status_code, message=r.text), r.status_code
-            results = r.json().get("results", [])
-            out = []
-            for it in results:
-                dt = _prefer_datetime(it)
-                unit = (it.get("parameter") or {}).get("units") or it.get("unit") or sensor_units
-                out.append({"datetime_utc": dt, "value": it.get("value"), "unit": unit, "parameter": (it.get("parameter") or {}).get("name")})
-            return jsonify(success=True, count=len(out), results=out)
-
-        # mapping agg -> sensor endpoint suffix candidates
-        mapping = {
-            "raw": ["measurements"],
-            "hours": ["hours", "measurements/hourly"],
-            "days": ["days", "measurements/daily"],
-            "monthly": ["days/monthly", "measurements/monthly"],
-            "yearly": ["days/yearly", "measurements/yearly"]
-        }
-        candidates = mapping.get(agg, ["measurements"])
+        return jsonify(payload), status
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
 
-        params = {}
-        # sensor endpoints accept datetime_from / datetime_to (según doc)
-        if date_from: params["date_from"] = date_from
-        if date_to: params["date_to"] = date_to
 
-        results = []
-        last_err = None
-        for cand in candidates:
-            info = call_sensor_endpoint(sensor_id, cand, params=params, max_pages=40)
-            if info.get("ok"):
-                results = info["results"]
-                last_err = None
-                break
-            else:
-                last_err = {"status": info.get("status"), "text": info.get("text")}
+# -------------------
+# Batch: varias series (location_id, parameter_id) con la misma ventana en una sola llamada
+BATCH_MAX_SERIES = int(os.getenv("BATCH_MAX_SERIES", "50"))
+BATCH_POOL = ThreadPoolExecutor(max_workers=int(os.getenv("BATCH_WORKERS", "4")), thread_name_prefix="batch-series")
+
+
+def _parse_series(raw):
+    """[{"location_id": 1, "parameter_id": 2} | [1, 2], ...] -> [(1, 2), ...] o ValueError."""
+    if not isinstance(raw, list) or not raw:
+        raise ValueError("series debe ser una lista no vacía")
+    if len(raw) > BATCH_MAX_SERIES:
+        raise ValueError(f"máximo {BATCH_MAX_SERIES} series por llamada")
+    pairs = []
+    for item in raw:
+        if isinstance(item, dict):
+            pairs.append((int(item["location_id"]), int(item["parameter_id"])))
+        else:
+            loc, param = item
+            pairs.append((int(loc), int(param)))
+    return pairs
+
 
-        if not results and last_err:
-            return jsonify(success=False, status=last_err.get("status"), message=last_err.get("text")), last_err.get("status", 500)
+def _resolve_sensors_bulk(pairs):
+    """
+    Resuelve todos los sensores de una vez: una sola consulta (cacheada) por location única,
+    en paralelo. Devuelve {(location_id, parameter_id): registro del sensor o None}.
+    """
+    futures = {loc: instrumentation.submit(BATCH_POOL, get_location_sensors, loc) for loc in {loc for loc, _ in pairs}}
+    sensors_by_location = {}
+    for loc, fut in futures.items():
+        try:
+            sensors_by_location[loc] = fut.result()
+        except Exception:
+            sensors_by_location[loc] = None
+    return {(loc, param): _best_sensor(sensors_by_location[loc], param) for loc, param in pairs}
 
-        # si agg == raw y limit es numerico, recortar
-        if agg == "raw" and str(limit).isdigit():
-            n = int(limit)
-            if n < len(results):
-                results = results[:n]
 
-        # formatear salida
-        out = []
-        for it in results:
-            dt = _prefer_datetime(it)
-            # unit prefer parameter.units, luego it.unit, luego sensor_units
-            unit = None
-            if it.get("parameter") and isinstance(it.get("parameter"), dict):
-                unit = it.get("parameter", {}).get("units") or sensor_units
-            else:
-                unit = it.get("unit") or sensor_units
-            out.append({
-                "datetime_utc": dt,
-                "value": it.get("value"),
-                "unit": unit,
-                "parameter": (it.get("parameter") or {}).get("name")
-            })
-        return jsonify(success=True, count=len(out), results=out)
+def _batch_item(location_id, parameter_id, sensor, opts):
+    try:
+        payload, status = measurements_payload(location_id, parameter_id, sensor=sensor, **opts)
+    except Exception as e:
+        payload, status = {"success": False, "message": str(e)}, 500
+    return dict(
+        payload,
+        location_id=location_id,
+        parameter_id=parameter_id,
+        sensor_id=sensor["sensor_id"] if sensor else None,
+        status=status,
+    )
+
+
+@app.route("/api/measurements/batch", methods=["POST"])
+def api_measurements_batch():
+    """
+    Varias series en una sola llamada. Body JSON:
+      - series: [{"location_id": .., "parameter_id": ..}, ...]  (o pares [location_id, parameter_id])
+      - agg, limit, last_days, date_from, date_to, engine: igual que /api/measurements, compartidos
+      - stream: true -> NDJSON, una línea por serie a medida que terminan
+    Sin stream devuelve {"success", "count", "results": [...]} en el orden pedido; cada elemento
+    es la respuesta de /api/measurements de esa serie más location_id, parameter_id, sensor_id y status.
+    """
+    try:
+        body = request.get_json(silent=True) or {}
+        try:
+            pairs = _parse_series(body.get("series"))
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify(success=False, message=f"series inválidas: {e}"), 400
+
+        opts = {k: body.get(k) for k in ("agg", "limit", "last_days", "date_from", "date_to", "engine")}
+        if opts["limit"] is not None:
+            opts["limit"] = str(opts["limit"])
+        sensors = _resolve_sensors_bulk(pairs)
+        futures = [instrumentation.submit(BATCH_POOL, _batch_item, loc, param, sensors[(loc, param)], opts)
+                   for loc, param in pairs]
+
+        if body.get("stream"):
+            def generate():
+                for fut in as_completed(futures):
+                    yield app.json.dumps(fut.result()) + "\n"
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        results = [fut.result() for fut in futures]
+        return jsonify(success=True, count=len(results), results=results)
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
 
 # Extra: mantenemos la ruta antiguamente usada por ti (/api/aggregated/...) por compatibilidad
 @app.route("/api/aggregated/<int:location_id>/<int:sensor_id>/<tipo>", methods=["GET"])
+@cache_policy(CACHE_MEDIUM)
 def api_aggregated(location_id, sensor_id, tipo):
     """
     Ruta de compatibilidad para quienes usaban:
       /api/aggregated/<location_id>/<sensor_id>/<tipo> con tipo en days|months|years
+    Query param opcional format: json | columnar | binary (ver SERIES_FORMATS).
     """
     try:
-        # buscar última fecha real del sensor (desde locations/latest)
-        latest_url = f"{BASE_V3}/locations/{location_id}/latest"
-        r = requests.get(latest_url, headers=HEADERS, timeout=10)
-        last_dt = None
-        if r.status_code == 200:
-            for item in r.json().get("results", []):
-                if item.get("sensorsId") == sensor_id:
-                    last_dt = (item.get("datetime") or {}).get("utc')") if False else (item.get("datetime") or {}).get("utc")    # fallback safe
-                    # use prefer if available
-                    last_dt = (item.get("datetime") or {}).get("utc") or item.get("datetime_utc")
-                    break
-        if not last_dt:
-            # fallback: try sensors/{id} metadata
-            sresp = requests.get(f"{BASE_V3}/sensors/{sensor_id}", headers=HEADERS, timeout=10)
-            if sresp.status_code == 200:
-                sres = sresp.json().get("results", [])
-                if sres:
-                    last_dt = (sres[0].get("datetimeLast") or {}).get("utc") or None
-        if not last_dt:
-            return jsonify(success=False, message="No se encontró última medición"), 404
-
-        dt_end = dparser.parse(last_dt)
-        if tipo == "days":
-            dt_start = dt_end - timedelta(days=15)
-            endpoint = "days"
-        elif tipo == "months":
-            dt_start = dt_end - timedelta(days=365)
-            endpoint = "days/monthly"
-        elif tipo == "years":
-            dt_start = dt_end - timedelta(days=3650)
-            endpoint = "days/yearly"
-        else:
-            return jsonify(success=False, message="Tipo inválido: usa days|months|years"), 400
-
-        params = {
-            "date_from": dt_start.isoformat(),
-            "date_to": dt_end.isoformat(),
-            "limit": 1000
-        }
-        info = call_sensor_endpoint(sensor_id, endpoint, params=params, max_pages=40)
+        fmt = request.args.get("format", "json")
+        if fmt not in SERIES_FORMATS:
+            return jsonify(success=False, message="format debe ser json, columnar o binary"), 400
+        if tipo in AGGREGATED_WINDOWS:
+            HOT_KEYS.hit(("aggregated", location_id, sensor_id, tipo))
+
+        info, error = aggregated_series(location_id, sensor_id, tipo)
+        if error:
+            payload, status = error
+            return jsonify(payload), status
         if not info.get("ok"):
             return jsonify(success=False, status=info.get("status"), message=info.get("text")), info.get("status", 500)
         data = info.get("results", [])
-        out = []
-        for d in data:
-            dt = _prefer_datetime(d)
-            unit = (d.get("parameter") or {}).get("units") or None
-            out.append({"datetime_utc": dt, "value": d.get("value"), "unit": unit})
+        out = normalize.format_rollups(data)
+        if fmt != "json":
+            return _series_response(out, fmt)
         return jsonify(success=True, count=len(out), results=out)
     except Exception as e:
         return jsonify(success=False, message=str(e)), 500
 
 
+# tipo de /api/aggregated -> (días hacia atrás desde la última medición, rollup de OpenAQ)
+AGGREGATED_WINDOWS = {
+    "days": (15, "days"),
+    "months": (365, "days/monthly"),
+    "years": (3650, "days/yearly"),
+}
+
+
+def aggregated_series(location_id, sensor_id, tipo):
+    """
+    Núcleo de /api/aggregated (y del prefetch): la ventana por defecto del tipo, terminando en la
+    última medición del sensor. Devuelve (info de get_sensor_series, None) o (None, (payload, status)).
+    """
+    # buscar última fecha real del sensor (desde locations/latest)
+    r = get_location_latest(location_id)
+    last_dt = None
+    if r.status_code == 200:
+        for item in r.json().get("results", []):
+            if item.get("sensorsId") == sensor_id:
+                last_dt = (item.get("datetime") or {}).get("utc") or item.get("datetime_utc")
+                break
+    if not last_dt:
+        # fallback: try sensors/{id} metadata
+        sresp = get_sensor_meta(sensor_id)
+        if sresp.status_code == 200:
+            sres = sresp.json().get("results", [])
+            if sres:
+                last_dt = (sres[0].get("datetimeLast") or {}).get("utc") or None
+    if not last_dt:
+        return None, ({"success": False, "message": "No se encontró última medición"}, 404)
+    if tipo not in AGGREGATED_WINDOWS:
+        return None, ({"success": False, "message": "Tipo inválido: usa days|months|years"}, 400)
+
+    days, endpoint = AGGREGATED_WINDOWS[tipo]
+    dt_end = normalize.parse_datetime(last_dt)
+    dt_start = dt_end - timedelta(days=days)
+    info = get_sensor_series(sensor_id, endpoint, date_from=dt_start.isoformat(), date_to=dt_end.isoformat(), max_pages=40)
+    if not info.get("ok") and AGG_ENGINE != "upstream":
+        # respaldo: mismo rollup calculado localmente desde las mediciones crudas
+        local = aggregate_sensor_series(sensor_id, tipo, date_from=dt_start.isoformat(), date_to=dt_end.isoformat(), max_pages=40)
+        if local.get("ok"):
+            info = local
+    return info, None
+
+
+# -------------------
+# Precalentado de las estaciones más consultadas (ver prefetch.py)
+# Cada worker cuenta sus requests y renueva sus propias cachés en memoria (sensores, latest,
+# metadata del sensor); las series van al TS_STORE compartido, donde lo que ya está no se pide.
+PREFETCH_INTERVAL = int(os.getenv("PREFETCH_INTERVAL", "60"))    # 0 = sin precalentado
+PREFETCH_RESERVE = int(os.getenv("PREFETCH_RESERVE", "20"))    # requests de rate limit que se dejan a los usuarios
+# agg de /api/measurements -> días de la ventana por defecto de app.js (updateDateRange)
+PREFETCH_WINDOWS = {"raw": 3, "hours": 3, "days": 31, "monthly": 366, "yearly": 3660}
+HOT_KEYS = HotKeys(half_life=int(os.getenv("PREFETCH_HALF_LIFE", "3600")))
+
+
+def _stale(cache, key):
+    """Vence antes del próximo pase del prefetch (o ya no está)."""
+    left = cache.remaining(key)
+    return left is None or left < PREFETCH_INTERVAL * 1.5
+
+
+def _warm_location(location_id):
+    if _stale(METADATA_CACHE, int(location_id)):
+        _load_location_sensors(int(location_id))
+
+
+def warm(key):
+    """Renueva lo que usa la ruta de la clave (ver los HOT_KEYS.hit de cada ruta)."""
+    with GOVERNOR.priority("background"):
+        _warm(key)
+
+
+def _warm(key):
+    kind, location_id, *rest = key
+    _warm_location(location_id)
+    if kind == "sensor_latest" or kind == "aggregated":
+        if _stale(LOCATION_LATEST_CACHE, location_id):
+            get_location_latest(location_id, refresh=True)
+        if _stale(METADATA_CACHE, ("sensor", rest[0])):
+            get_sensor_meta(rest[0], refresh=True)
+    # sin TS_STORE las series no quedan guardadas en ningún lado: no tiene sentido pedirlas
+    if TS_STORE is None:
+        return
+    if kind == "aggregated":
+        aggregated_series(location_id, *rest)
+    elif kind == "measurements":
+        parameter_id, agg = rest
+        measurements_payload(location_id, parameter_id, agg=agg, limit="all", last_days=PREFETCH_WINDOWS[agg])
+
+
+PREFETCHER = Prefetcher(
+    HOT_KEYS,
+    warm,
+    interval=PREFETCH_INTERVAL,
+    top_n=int(os.getenv("PREFETCH_TOP", "20")),
+    min_score=float(os.getenv("PREFETCH_MIN_SCORE", "2")),
+    pause=float(os.getenv("PREFETCH_PAUSE", "0.2")),
+    can_spend=lambda: upstream.ratelimit_remaining is None or upstream.ratelimit_remaining > PREFETCH_RESERVE,
+)
+if BACKGROUND_JOBS and PREFETCH_INTERVAL > 0:
+    PREFETCHER.start()
+
+
+@app.route("/api/prefetch_stats", methods=["GET"])
+def api_prefetch_stats():
+    return jsonify(success=True, **PREFETCHER.stats())
+
+
+# -------------------
+# Pronóstico LSTM en proceso (ver forecast.py)
+FORECAST = forecast.ForecastService(
+    os.getenv("FORECAST_MODEL") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "LSTM_PREDICTIONS.pth"),
+    scalers_path=os.getenv("FORECAST_SCALERS") or os.path.join(os.path.dirname(os.path.abspath(__file__)), "LSTM_SCALERS.json"),
+    max_batch=int(os.getenv("FORECAST_MAX_BATCH", "32")),
+    max_wait=float(os.getenv("FORECAST_MAX_WAIT_MS", "5")) / 1000,
+    threads=int(os.getenv("FORECAST_THREADS", "1")),
+    cache=TTLCache(
+        maxsize=int(os.getenv("FORECAST_CACHE_SIZE", "2048")),
+        ttl=int(os.getenv("FORECAST_CACHE_TTL", "3600")),
+    ),
+    # versiones publicadas por update_lstm.py; si existe el puntero tiene prioridad sobre FORECAST_MODEL
+    current_path=os.getenv("FORECAST_CURRENT") or os.path.join(DATA_DIR, "models", "current.json"),
+    reload_interval=int(os.getenv("FORECAST_RELOAD", "30")),
+)
+
+
+@app.route("/api/forecast_stats", methods=["GET"])
+def api_forecast_stats():
+    return jsonify(success=True, model=FORECAST.stats(), cache=FORECAST.cache.stats())
+
+
+@app.route("/api/forecast/<int:location_id>", methods=["POST"])
+def api_forecast(location_id):
+    """
+    Pronóstico del paso siguiente para una estación. Body JSON:
+      - window_end: ISO datetime de la última fila de la ventana
+      - window: seq_len filas [pm25, no2, o3, co, T2M, U2M, V2M, PS] en unidades reales
+    Se cachea por (versión del modelo, location_id, window_end, digest de window): una ventana que
+    ya terminó no cambia, pero la manda el cliente, así que dos ventanas distintas no comparten entrada.
+    """
+    try:
+        if not FORECAST.available():
+            return jsonify(success=False, message="Modelo de pronóstico no disponible"), 503
+        body = request.get_json(silent=True) or {}
+        try:
+            end_ts = to_epoch(normalize.parse_datetime(body["window_end"]))
+        except Exception:
+            return jsonify(success=False, message="window_end no válida"), 400
+
+        digest = hashlib.sha1(json.dumps(body.get("window")).encode()).hexdigest()
+        key = (location_id, end_ts, digest)
+        try:
+            # requests idénticas simultáneas: un solo lugar en el micro-lote
+            out, cached = SINGLE_FLIGHT.do(
+                ("forecast",) + key, lambda: FORECAST.predict(body.get("window"), key=key), label="forecast"
+            )
+        except (ValueError, TypeError) as e:
+            return jsonify(success=False, message=str(e)), 400
+        return jsonify(
+            success=True,
+            location_id=location_id,
+            window_end=to_iso(end_ts),
+            features=list(forecast.FEATURES),
+            forecast=out,
+            cached=cached,
+        )
+    except Exception as e:
+        return jsonify(success=False, message=str(e)), 500
+
+
 if __name__ == "__main__":
     app.run(debug=True, port=5000, threaded=True)
@@ -0,0 +1,332 @@
+# asgi.py
+"""
+Modo de servicio asíncrono (ASGI).
+
+Las rutas que encadenan varias llamadas independientes a OpenAQ se atienden aquí con
+un cliente httpx asíncrono y asyncio.gather, en vez de bloquear un hilo por cada
+llamada secuencial:
+  - /api/sensor_latest/<location>/<sensor>        latest + /sensors/{id} + sensores de la location
+  - /api/last_measurement_date/<location>/<param> sensores de la location + latest
+  - /api/parameters/<station>
+El JSON es exactamente el mismo que el de app.py (se arma con las mismas funciones
+y se serializa con el proveedor JSON de Flask), con los mismos headers de caché HTTP
+(ETag, 304, Cache-Control, compresión; ver http_cache.py) y las mismas métricas por ruta
+(ver instrumentation.py; el perfilador por muestreo es solo de las rutas Flask, porque en el
+event loop las pilas de varias requests se mezclan). El resto de rutas pasa a la app Flask a
+través de WsgiToAsgi.
+
+Ejecutar:
+    uvicorn asgi:application --workers 4 --port 5000
+"""
+import asyncio
+import os
+import random
+import re
+import time
+from datetime import datetime
+
+import httpx
+from asgiref.wsgi import WsgiToAsgi
+
+import app as backend
+import http_cache
+import instrumentation
+import normalize
+
+
+class AsyncSingleFlight:
+    """Single-flight dentro del event loop; los contadores van a backend.SINGLE_FLIGHT."""
+
+    def __init__(self):
+        self._futures = {}
+
+    async def do(self, key, coro_fn, label=None):
+        fut = self._futures.get(key)
+        if fut is not None:
+            backend.SINGLE_FLIGHT.record(label, leader=False)
+            return await asyncio.shield(fut)
+        backend.SINGLE_FLIGHT.record(label, leader=True)
+        fut = self._futures[key] = asyncio.get_running_loop().create_future()
+        try:
+            result = await coro_fn()
+            fut.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            fut.cancel()
+            raise
+        except BaseException as e:
+            fut.set_exception(e)
+            fut.exception()    # marcada como leída aunque nadie más la espere
+            raise
+        finally:
+            del self._futures[key]
+
+
+single_flight = AsyncSingleFlight()
+
+
+class AsyncUpstreamClient:
+    """
+    Versión asíncrona de backend.UpstreamClient: misma política de reintentos,
+    presupuestos por endpoint, single-flight y mismas estadísticas (se registran en backend.upstream).
+    """
+
+    def __init__(self, sync_client, pool_size):
+        self.sync = sync_client
+        self.pool_size = pool_size
+        self._client = None
+
+    @property
+    def client(self):
+        # se crea dentro del event loop que lo va a usar
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            self._client = httpx.AsyncClient(headers=backend.HEADERS, limits=limits)
+        return self._client
+
+    async def get(self, url, params=None, timeout=15):
+        key = ("GET", url, tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())))
+        return await single_flight.do(key, lambda: self._get(url, params, timeout), label=self.sync.endpoint_of(url))
+
+    async def _get(self, url, params, timeout):
+        sync = self.sync
+        endpoint = sync.endpoint_of(url)
+        budget = sync.budgets.get(endpoint, sync.default_budget)
+        start = time.monotonic()
+        deadline = start + budget
+        resp = None
+        error = None
+        attempt = 0
+        priority = sync.priorities.get(endpoint, sync.default_priority)
+        while True:
+            if sync.governor is not None:
+                queued = time.monotonic()
+                if not await sync.governor.acquire_async(priority, timeout=sync.queue_timeout_of(priority, deadline - queued)):
+                    resp, error = None, backend.RateLimitTimeout(f"sin turno en el rate limit ({priority}) para {endpoint}")
+                    break
+                if priority in sync.queued_priorities:
+                    deadline += time.monotonic() - queued
+            remaining = deadline - time.monotonic()
+            try:
+                resp = await self.client.get(url, params=params, timeout=max(0.5, min(timeout, remaining)))
+                error = None
+            except (httpx.TransportError, httpx.TimeoutException) as e:
+                resp, error = None, e
+
+            retryable = error is not None or resp.status_code in sync.RETRY_STATUS
+            if not retryable or attempt >= sync.max_retries:
+                break
+            wait = sync._retry_after(resp)
+            if wait is None:
+                wait = min(sync.max_backoff, sync.backoff * (2 ** attempt)) + random.uniform(0, sync.backoff)
+            if time.monotonic() + wait >= deadline:
+                break
+            await asyncio.sleep(wait)
+            attempt += 1
+
+        sync._record(endpoint, time.monotonic() - start, resp.status_code if resp is not None else None, attempt,
+                     len(resp.content) if resp is not None else None)
+        if resp is None:
+            raise error
+        remaining = resp.headers.get("x-ratelimit-remaining")
+        if remaining is not None and remaining.isdigit():
+            sync.ratelimit_remaining = int(remaining)
+        return resp
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# un solo event loop atiende muchas requests a la vez: el pool es mayor que el de los hilos
+upstream = AsyncUpstreamClient(backend.upstream, pool_size=int(os.getenv("ASYNC_POOL_SIZE", "100")))
+
+
+async def get_location_sensors(location_id):
+    """Equivalente async de backend.get_location_sensors (comparte METADATA_CACHE)."""
+    key = int(location_id)
+    found, sensors = backend.METADATA_CACHE.get(key)
+    if found:
+        return sensors
+    return await single_flight.do(("location_sensors", key), lambda: _load_location_sensors(key), label="/locations/{id}")
+
+
+async def _cached_get(cache, key, url, timeout):
+    """Equivalente async de backend._cached_get: comparte sus cachés (httpx.Response también está ya leída)."""
+    found, resp = cache.get(key)
+    if found:
+        return resp
+    resp = await upstream.get(url, timeout=timeout)
+    if resp.status_code == 200:
+        cache.set(key, resp)
+    return resp
+
+
+def get_location_latest(location_id):
+    url = f"{backend.BASE_V3}/locations/{int(location_id)}/latest"
+    return _cached_get(backend.LOCATION_LATEST_CACHE, int(location_id), url, 15)
+
+
+def get_sensor_meta(sensor_id):
+    return _cached_get(backend.METADATA_CACHE, ("sensor", int(sensor_id)), f"{backend.BASE_V3}/sensors/{int(sensor_id)}", 10)
+
+
+async def _load_location_sensors(key):
+    r = await upstream.get(f"{backend.BASE_V3}/locations/{key}", timeout=15)
+    if r.status_code == 404:
+        sensors = None
+    elif r.status_code != 200:
+        raise RuntimeError(f"{r.status_code}: {r.text}")
+    else:
+        results = r.json().get("results", [])
+        sensors = [backend._normalize_sensor(s) for s in (results[0].get("sensors") or [])] if results else None
+    backend.METADATA_CACHE.set(key, sensors)
+    return sensors
+
+
+def _json(payload, status=200):
+    """Serializa igual que jsonify (mismo proveedor JSON de Flask)."""
+    resp = backend.app.json.response(payload)
+    return status, resp.get_data()
+
+
+# -------------------
+# Rutas async
+async def sensor_latest(location_id, sensor_id):
+    backend.HOT_KEYS.hit(("sensor_latest", location_id, sensor_id))
+    try:
+        latest, meta_resp, location_sensors = await asyncio.gather(
+            get_location_latest(location_id),
+            get_sensor_meta(sensor_id),
+            get_location_sensors(location_id),
+            return_exceptions=True,
+        )
+        if isinstance(latest, Exception):
+            raise latest
+        if latest.status_code != 200:
+            return _json({"success": False, "status": latest.status_code, "message": latest.text}, latest.status_code)
+
+        results = latest.json().get("results", [])
+        filtered = [m for m in results if int(m.get("sensorsId", -1)) == int(sensor_id)]
+        if not filtered:
+            return _json({"success": True, "count": 0, "results": []})
+
+        meta = None
+        if not isinstance(meta_resp, Exception) and meta_resp.status_code == 200:
+            meta = meta_resp.json().get("results", [])
+        if isinstance(location_sensors, Exception):
+            location_sensors = None
+
+        out = backend._sensor_latest_record(sensor_id, filtered[0], meta, location_sensors)
+        return _json({"success": True, "count": 1, "results": [out]})
+    except Exception as e:
+        return _json({"success": False, "message": str(e)}, 500)
+
+
+async def last_measurement_date(location_id, parameter_id):
+    backend.HOT_KEYS.hit(("location", location_id))
+    try:
+        # latest se pide a la vez: casi nunca viene datetimeLast en los sensores de la location
+        sensors, latest = await asyncio.gather(
+            get_location_sensors(location_id),
+            get_location_latest(location_id),
+            return_exceptions=True,
+        )
+        sensor = None if isinstance(sensors, Exception) else backend._best_sensor(sensors, parameter_id)
+        if not sensor:
+            return _json({"success": False, "message": "No se encontró el sensor asociado al parámetro."}, 404)
+
+        last_dt_utc = sensor["datetime_last"]
+        if not last_dt_utc:
+            if isinstance(latest, Exception):
+                raise latest
+            if latest.status_code == 200:
+                results = latest.json().get("results", [])
+                filtered = [m for m in results if int(m.get("sensorsId", -1)) == int(sensor["sensor_id"])]
+                if filtered:
+                    last_dt_utc = normalize.prefer_datetime(filtered[0])
+
+        if not last_dt_utc:
+            return _json({"success": True, "date_utc": datetime.utcnow().isoformat() + "Z"})
+        return _json({"success": True, "date_utc": last_dt_utc})
+    except Exception as e:
+        return _json({"success": False, "message": f"Error al obtener última fecha: {str(e)}"}, 500)
+
+
+async def parameters(station_id):
+    backend.HOT_KEYS.hit(("location", station_id))
+    try:
+        sensors_list = await get_location_sensors(station_id)
+        if sensors_list is None:
+            return _json({"success": True, "count": 0, "results": []}, 404)
+        sensors_out = backend._parameter_options(sensors_list)
+        return _json({"success": True, "count": len(sensors_out), "results": sensors_out})
+    except Exception as e:
+        return _json({"success": False, "message": str(e)}, 500)
+
+
+# (ruta, handler, endpoint de Flask equivalente: de ahí sale la política de caché HTTP)
+ROUTES = [
+    (re.compile(r"^/api/sensor_latest/(\d+)/(\d+)$"), sensor_latest, "api_sensor_latest"),
+    (re.compile(r"^/api/last_measurement_date/(\d+)/(\d+)$"), last_measurement_date, "api_last_measurement_date"),
+    (re.compile(r"^/api/parameters/(\d+)$"), parameters, "api_parameters"),
+]
+
+flask_asgi = WsgiToAsgi(backend.app)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await upstream.aclose()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+def _http_cache(scope, endpoint, status, body):
+    """Lo mismo que el after_request de app.py (ETag, 304, Cache-Control, compresión)."""
+    if status != 200:
+        return status, body, {"Cache-Control": "no-store"}
+    request_headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+    return http_cache.conditional(
+        body,
+        "application/json",
+        backend.CACHE_POLICIES[endpoint],
+        accept_encoding=request_headers.get("accept-encoding"),
+        if_none_match=request_headers.get("if-none-match"),
+        cache=backend.COMPRESSED_BODIES,
+    )
+
+
+async def application(scope, receive, send):
+    if scope["type"] == "lifespan":
+        return await _lifespan(receive, send)
+    if scope["type"] == "http" and scope["method"] == "GET":
+        for rx, handler, endpoint in ROUTES:
+            m = rx.match(scope["path"])
+            if m:
+                # cada request corre en su propia task: el ContextVar de la traza es solo suyo
+                trace = instrumentation.begin(endpoint)
+                try:
+                    status, body = await handler(*(int(g) for g in m.groups()))
+                    with instrumentation.phase("http_cache"):
+                        status, body, extra = _http_cache(scope, endpoint, status, body)
+                    trace.status = status
+                finally:
+                    instrumentation.end()
+                    backend._finish_trace(trace, "GET")
+                if backend.SERVER_TIMING:
+                    extra["Server-Timing"] = trace.server_timing()
+                headers = [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())]
+                headers += [(k.lower().encode(), v.encode()) for k, v in extra.items()]
+                # mismo comportamiento que flask-cors: solo si el navegador manda Origin
+                if any(k == b"origin" for k, _ in scope.get("headers", [])):
+                    headers.append((b"access-control-allow-origin", b"*"))
+                await send({"type": "http.response.start", "status": status, "headers": headers})
+                await send({"type": "http.response.body", "body": body})
+                return
+    await flask_asgi(scope, receive, send)
@@ -0,0 +1,129 @@
+"""
+Prueba de carga: modo WSGI (gunicorn, hilos) vs modo ASGI (uvicorn, asgi.py)
+sobre /api/sensor_latest contra el stub local con latencia artificial.
+
+Levanta el stub y cada servidor como subprocesos, con la caché de metadata apagada
+para que cada request haga sus tres llamadas a OpenAQ, y mide requests/s y p50/p99.
+
+Uso:
+    python bench/bench_async.py --concurrency 16 --duration 10 --latency 0.3
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def _wait_ready(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"no responde: {url}")
+
+
+async def _load(base_url, path_for, concurrency, duration):
+    latencies = []
+    errors = 0
+    stop_at = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(n):
+            nonlocal errors
+            i = n
+            while time.perf_counter() < stop_at:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.get(path_for(i))
+                    if r.status_code != 200:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - t0)
+                i += concurrency
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(worker(n) for n in range(concurrency)))
+        elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--latency", type=float, default=0.3)
+    parser.add_argument("--threads", type=int, default=16, help="hilos del worker gunicorn (modo WSGI)")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    parser.add_argument("--app-port", type=int, default=8901)
+    args = parser.parse_args()
+
+    env = dict(
+        os.environ,
+        OPENAQ_BASE_V3=f"http://127.0.0.1:{args.stub_port}/v3",
+        METADATA_CACHE_TTL="0",
+        TS_STORE="0",
+        GUNICORN_THREADS=str(args.threads),
+        # se mide el servidor, no el rate limit de OpenAQ
+        UPSTREAM_RATE_PER_MIN="0",
+    )
+    stub = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, "bench", "stub_openaq.py"), "--port", str(args.stub_port),
+         "--latency", str(args.latency)],
+        stdout=subprocess.DEVNULL,
+    )
+    servers = {
+        "wsgi (gunicorn)": [sys.executable, "-m", "gunicorn", "-w", "1", "--threads", str(args.threads),
+                            "-b", f"127.0.0.1:{args.app_port}", "app:app"],
+        "asgi (uvicorn)": [sys.executable, "-m", "uvicorn", "asgi:application", "--workers", "1",
+                           "--port", str(args.app_port), "--log-level", "warning"],
+    }
+    base_url = f"http://127.0.0.1:{args.app_port}"
+    try:
+        _wait_ready(f"http://127.0.0.1:{args.stub_port}/v3/locations/1")
+        print(f"latencia stub={args.latency}s concurrencia={args.concurrency} duración={args.duration}s")
+        for name, cmd in servers.items():
+            proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                _wait_ready(base_url + "/api/cache_stats")
+                res = asyncio.run(_load(
+                    base_url,
+                    lambda i: f"/api/sensor_latest/{i % 200 + 1}/{(i % 200 + 1) * 10}",
+                    args.concurrency,
+                    args.duration,
+                ))
+                print(f"{name:<18} req/s={res['rps']:7.1f}  p50={res['p50_ms']:7.1f}ms  "
+                      f"p99={res['p99_ms']:7.1f}ms  requests={res['requests']} errores={res['errors']}")
+            finally:
+                proc.terminate()
+                proc.wait()
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
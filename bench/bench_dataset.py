@@ -0,0 +1,93 @@
+"""
+Pipeline de datos del LSTM: SeaTempDataset + DataLoader del notebook (una copia por muestra y
+collate en Python) vs lstm_dataset.WindowLoader (vista con strides + un gather por lote).
+
+Mide una época completa de lotes (sin el forward) y el RSS pico de cada variante en un proceso
+propio, sobre datos sintéticos del tamaño de 2000-2024 (un paso por hora por defecto).
+
+Uso:
+    python bench/bench_dataset.py --rows 210000 --seq-len 200
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def _data(rows):
+    return np.random.default_rng(0).random((rows, 8), dtype=np.float32)
+
+
+def _notebook_epoch(data, seq_len, batch_size):
+    import torch
+    from torch.utils.data import DataLoader, Dataset
+
+    class SeaTempDataset(Dataset):
+        def __init__(self, data, seq_len):
+            self.data = data
+            self.seq_len = seq_len
+
+        def __len__(self):
+            return len(self.data) - self.seq_len
+
+        def __getitem__(self, idx):
+            seq = self.data[idx:idx + self.seq_len]
+            label = self.data[idx + self.seq_len]
+            return torch.tensor(seq, dtype=torch.float32), torch.tensor(label, dtype=torch.float32)
+
+    batches = 0
+    for _ in DataLoader(SeaTempDataset(data, seq_len), batch_size=batch_size, shuffle=True):
+        batches += 1
+    return batches
+
+
+def _window_epoch(data, seq_len, batch_size):
+    import lstm_dataset
+
+    batches = 0
+    for _ in lstm_dataset.WindowLoader(lstm_dataset.WindowDataset(data, seq_len), batch_size, shuffle=True, seed=0):
+        batches += 1
+    return batches
+
+
+def _run(variant, rows, seq_len, batch_size):
+    data = _data(rows)
+    t0 = time.perf_counter()
+    batches = (_notebook_epoch if variant == "notebook" else _window_epoch)(data, seq_len, batch_size)
+    elapsed = time.perf_counter() - t0
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{variant:<10} lotes={batches}  época={elapsed:6.2f}s  RSS pico={rss:6.0f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=24 * 365 * 24)
+    parser.add_argument("--seq-len", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--variant", choices=("notebook", "window"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.variant:
+        return _run(args.variant, args.rows, args.seq_len, args.batch_size)
+
+    try:
+        import torch  # noqa: F401
+        variants = ("notebook", "window")
+    except ImportError:
+        print("torch no instalado: solo se mide WindowLoader")
+        variants = ("window",)
+    # cada variante en su propio proceso para que el RSS pico no se mezcle
+    for variant in variants:
+        subprocess.run([sys.executable, __file__, "--variant", variant, "--rows", str(args.rows),
+                        "--seq-len", str(args.seq_len), "--batch-size", str(args.batch_size)], check=True)
+
+
+if __name__ == "__main__":
+    main()
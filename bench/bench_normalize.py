@@ -0,0 +1,70 @@
+"""
+CPU por request de las rutas de históricos con 40k filas (normalización y formateo de filas).
+
+El stub (latencia 0) sirve una serie horaria de --rows filas; una primera pasada llena el
+almacén local (TS_STORE), así lo que se mide después es el trabajo de la app: leer el almacén,
+normalizar, formatear y serializar. "sin almacén" vuelve a pedir y parsear las páginas de OpenAQ.
+
+Uso:
+    python bench/bench_normalize.py --rows 40000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from stub_openaq import EPOCH, StubOpenAQ  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=40000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, StubOpenAQ(total_rows=args.rows, latency=0) as stub:
+        os.environ.update(
+            OPENAQ_BASE_V3=stub.base_url,
+            DATA_DIR=tmp,
+            UPSTREAM_RATE_PER_MIN="0",
+            PARAMETERS_REFRESH="0",
+            LATEST_REFRESH="0",
+            STATIONS_REFRESH="0",
+            PREFETCH_INTERVAL="0",
+            METRICS_FLUSH="0",
+        )
+        import app
+
+        client = app.app.test_client()
+        window = f"date_from={EPOCH.isoformat()}Z&date_to={stub.last_datetime.isoformat()}Z&limit=all"
+        cases = [
+            ("json", f"/api/measurements/7/2?{window}", True),
+            ("columnar", f"/api/measurements/7/2?{window}&format=columnar", True),
+            ("binary", f"/api/measurements/7/2?{window}&format=binary", True),
+            ("agg=days local", f"/api/measurements/7/2?{window}&agg=days&engine=local", True),
+            ("aggregated years", "/api/aggregated/7/70/years", True),
+            ("json sin almacén", f"/api/measurements/7/2?{window}", False),
+        ]
+        store = app.TS_STORE
+        print(f"filas={args.rows} repeticiones={args.repeat}")
+        for label, url, use_store in cases:
+            app.TS_STORE = store if use_store else None
+            r = client.get(url)    # llena el almacén (y las cachés de metadata)
+            count = r.json.get("count") if r.is_json else None
+            cpu, wall = [], []
+            for _ in range(args.repeat):
+                c0, w0 = time.process_time(), time.perf_counter()
+                r = client.get(url)
+                r.get_data()
+                cpu.append(time.process_time() - c0)
+                wall.append(time.perf_counter() - w0)
+            print(f"{label:<18} status={r.status_code} filas={count if count is not None else '-':>6}  "
+                  f"cpu={min(cpu) * 1000:7.1f}ms  wall={min(wall) * 1000:7.1f}ms  bytes={len(r.get_data())}")
+        app.TS_STORE = store
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Benchmark de call_sensor_endpoint: paginación secuencial vs concurrente
+contra el stub local (bench/stub_openaq.py) con latencia artificial.
+
+Uso:
+    python bench/bench_pagination.py --rows 40000 --latency 0.2
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from stub_openaq import StubOpenAQ  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=40000)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--max-pages", type=int, default=40)
+    parser.add_argument("--no-found", action="store_true", help="el stub no informa meta.found (modo especulativo)")
+    args = parser.parse_args()
+
+    # se mide la paginación, no el rate limit de OpenAQ
+    os.environ.setdefault("UPSTREAM_RATE_PER_MIN", "0")
+    import app
+
+    with StubOpenAQ(total_rows=args.rows, latency=args.latency, report_found=not args.no_found) as stub:
+        app.BASE_V3 = stub.base_url
+        for parallel in (False, True):
+            stub.requests = 0
+            t0 = time.perf_counter()
+            info = app.call_sensor_endpoint(1, "measurements", params={}, max_pages=args.max_pages, parallel=parallel)
+            elapsed = time.perf_counter() - t0
+            mode = f"paralelo ({app.PAGINATION_WORKERS} workers)" if parallel else "secuencial"
+            print(f"{mode:<24} ok={info['ok']} filas={len(info['results'])} "
+                  f"requests={stub.requests} tiempo={elapsed:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
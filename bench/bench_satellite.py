@@ -0,0 +1,84 @@
+"""
+Muestreo de productos satelitales en grilla (satellite.py) en puntos de estaciones.
+
+Genera un producto sintético de --size x 2*size celdas en tres formatos (GeoTIFF por strips,
+GeoTIFF en tiles y NetCDF clásico), verifica que el muestreo devuelva las mismas celdas que el
+array original y compara el tiempo de muestrear --points puntos contra leer el raster entero.
+
+Uso:
+    python bench/bench_satellite.py --size 3600 --points 20000
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import satellite  # noqa: E402
+from grid_files import write_geotiff, write_netcdf  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size", type=int, default=3600, help="filas (latitud); columnas = 2 * size")
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rows, cols = args.size, 2 * args.size
+    cell = 180.0 / rows
+    rng = np.random.default_rng(0)
+    data = rng.random((rows, cols), dtype=np.float32) * 100
+    data[:5] = -9999.0    # nodata en los polos
+    lats = rng.uniform(-89.9, 89.9, args.points)
+    lons = rng.uniform(-179.9, 179.9, args.points)
+    # celda esperada de cada punto (grilla norte-arriba desde -180, 90)
+    r = np.floor((90 - lats) / cell).astype(int)
+    c = np.floor((lons + 180) / cell).astype(int)
+    expected = data[r, c].astype(np.float64)
+    expected[expected == -9999.0] = np.nan
+
+    with tempfile.TemporaryDirectory() as tmp:
+        product = os.path.join(tmp, "tempo_no2")
+        os.makedirs(product)
+        paths = {
+            "geotiff strips": os.path.join(product, "2024-06-01.tif"),
+            "geotiff tiles": os.path.join(product, "2024-06-02.tif"),
+            "netcdf clásico": os.path.join(product, "2024-06-03.nc"),
+        }
+        write_geotiff(paths["geotiff strips"], data, -180.0, 90.0, cell, nodata=-9999)
+        write_geotiff(paths["geotiff tiles"], data, -180.0, 90.0, cell, tile=256, nodata=-9999)
+        centers_lat = 90 - cell * (np.arange(rows) + 0.5)
+        centers_lon = -180 + cell * (np.arange(cols) + 0.5)
+        write_netcdf(paths["netcdf clásico"], data[None], centers_lat, centers_lon, -9999.0)
+
+        archive = satellite.SatelliteArchive(tmp)
+        print(f"grilla={rows}x{cols} ({data.nbytes / 1e6:.0f} MB float32) puntos={args.points} "
+              f"productos={archive.products()['tempo_no2']['dates']}")
+        for label, path in paths.items():
+            date = os.path.splitext(os.path.basename(path))[0]
+            t0 = time.perf_counter()
+            grid = satellite.open_grid(path)
+            t_open = time.perf_counter() - t0
+            got = archive.sample("tempo_no2", date, lats, lons)
+            ok = np.array_equal(np.isnan(got), np.isnan(expected)) and np.allclose(got[~np.isnan(got)], expected[~np.isnan(expected)])
+            times = []
+            for _ in range(args.repeat):
+                t0 = time.perf_counter()
+                archive.sample("tempo_no2", date, lats, lons)
+                times.append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            full = np.fromfile(path, dtype=np.uint8)    # referencia: leer todo el archivo
+            t_full = time.perf_counter() - t0
+            del full
+            stats = archive.window("tempo_no2", date, (-10.0, -10.0, 10.0, 10.0))
+            print(f"{label:<15} ok={ok}  abrir={t_open * 1000:6.2f}ms  muestreo={min(times) * 1000:7.2f}ms  "
+                  f"leer archivo entero={t_full * 1000:7.1f}ms  bbox mean={stats['mean']:.3f} n={stats['count']} "
+                  f"shape={grid.shape}")
+
+
+if __name__ == "__main__":
+    main()
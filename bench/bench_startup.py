@@ -0,0 +1,58 @@
+"""
+Tiempo de arranque en frío de app.py (import en un proceso nuevo) según la latencia de OpenAQ.
+
+Con el catálogo de /parameters en segundo plano el import no debería depender de la red:
+se mide sin snapshot (primer arranque) y con el snapshot ya escrito por un worker anterior.
+
+Uso:
+    python bench/bench_startup.py --latency 3
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from stub_openaq import StubOpenAQ  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+IMPORT = "import time; t0 = time.perf_counter(); import app; print(time.perf_counter() - t0)"
+
+
+def _cold_start(env):
+    out = subprocess.run([sys.executable, "-c", IMPORT], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=3.0)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, StubOpenAQ(latency=args.latency) as stub:
+        snapshot = os.path.join(tmp, "parameters.json")
+        env = dict(
+            os.environ,
+            OPENAQ_BASE_V3=stub.base_url,
+            PARAMETERS_SNAPSHOT=snapshot,
+            TS_STORE_PATH=os.path.join(tmp, "timeseries.sqlite"),
+            UPSTREAM_RATE_PER_MIN="0",
+        )
+        print(f"latencia stub={args.latency}s")
+        for label in ("sin snapshot", "con snapshot"):
+            if label == "con snapshot":
+                # lo que dejaría escrito el hilo de fondo del primer worker
+                subprocess.run([sys.executable, "-c", "import app; app.refresh_parameters()"],
+                               cwd=ROOT, env=env, capture_output=True, check=True)
+            times = []
+            for _ in range(args.runs):
+                if label == "sin snapshot" and os.path.exists(snapshot):
+                    os.remove(snapshot)
+                times.append(_cold_start(env))
+            print(f"{label:<14} import app: min={min(times):.2f}s  max={max(times):.2f}s  (snapshot={os.path.exists(snapshot)})")
+
+
+if __name__ == "__main__":
+    main()
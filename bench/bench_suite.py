@@ -0,0 +1,346 @@
+"""
+Suite de benchmarks reproducible: workloads con guion contra la app (gunicorn o uvicorn) y el
+stub local de OpenAQ (sintético o reproduciendo respuestas grabadas, ver stub_openaq.py), con
+latencia y errores inyectados. Cada workload corre contra un servidor nuevo (cachés y DATA_DIR vacíos).
+
+Workloads (cada usuario virtual repite sesiones; las estaciones se eligen con popularidad tipo Zipf):
+  dashboard  abrir una estación: parámetros, última fecha, último valor y 3 días horarios
+  history    históricos: un año horario (columnar), 90 días agregados localmente, batch de 5 series
+  map        mapa: últimas lecturas por bbox, estaciones del viewport con clusters, las más cercanas
+
+Reporta por workload req/s, p50/p90/p99, errores, llamadas a OpenAQ por request, memoria del
+servidor (RSS al final y pico) y el desglose por fase de /metrics. Cada corrida se agrega a
+bench/results/history.jsonl; se compara contra la última con la misma configuración (o la del
+commit --baseline) y se marcan las regresiones (--check: sale con 1 si hay alguna).
+
+Uso:
+    python bench/bench_suite.py --duration 20 --users 8 --latency 0.1 --faults 500:0.01,429:0.01
+    python bench/bench_suite.py --replay bench/cassettes/openaq.jsonl --workloads dashboard,map --check
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from bench_async import _percentile, _wait_ready  # noqa: E402
+from stub_openaq import StubOpenAQ, parse_faults  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+RESULTS = os.path.join(ROOT, "bench", "results", "history.jsonl")
+
+
+# -------------------
+# Workloads: sesión(rng, estaciones) -> [(método, path, body JSON o None)]
+def _pick(rng, stations):
+    # Zipf aproximado: pocas estaciones concentran la mayoría de las visitas
+    return stations[min(len(stations) - 1, int(rng.paretovariate(1.2)) - 1)]
+
+
+def dashboard(rng, stations):
+    loc, _, _, sensors = _pick(rng, stations)
+    pid, sid = sensors[0]
+    return [
+        ("GET", f"/api/parameters/{loc}", None),
+        ("GET", f"/api/last_measurement_date/{loc}/{pid}", None),
+        ("GET", f"/api/sensor_latest/{loc}/{sid}", None),
+        ("GET", f"/api/measurements/{loc}/{pid}?agg=hours&last_days=3", None),
+    ]
+
+
+def history(rng, stations):
+    loc, _, _, sensors = _pick(rng, stations)
+    pid, _ = rng.choice(sensors)
+    batch = [[s[0], s[3][0][0]] for s in rng.sample(stations, min(5, len(stations)))]
+    return [
+        ("GET", f"/api/measurements/{loc}/{pid}?last_days=365&limit=all&format=columnar", None),
+        ("GET", f"/api/measurements/{loc}/{pid}?agg=days&engine=local&last_days=90", None),
+        ("POST", "/api/measurements/batch", {"series": batch, "agg": "days", "last_days": 30}),
+    ]
+
+
+def map_snapshot(rng, stations):
+    _, lat, lon, _ = _pick(rng, stations)
+    half = rng.choice((0.5, 2, 8))
+    bbox = f"{lon - half:.3f},{lat - half:.3f},{lon + half:.3f},{lat + half:.3f}"
+    zoom = {0.5: 11, 2: 8, 8: 6}[half]
+    return [
+        ("GET", f"/api/latest?parameter_id=2&bbox={bbox}", None),
+        ("GET", f"/api/stations_viewport?bbox={bbox}&zoom={zoom}", None),
+        ("GET", f"/api/stations_nearest?lat={lat:.4f}&lon={lon:.4f}&k=10", None),
+    ]
+
+
+WORKLOADS = {"dashboard": dashboard, "history": history, "map": map_snapshot}
+
+
+def _route(path):
+    """'/api/sensor_latest/7/70?x=1' -> '/api/sensor_latest/{id}/{id}'"""
+    return re.sub(r"/\d+(?=/|$)", "/{id}", path.split("?", 1)[0])
+
+
+# -------------------
+# Servidor
+def _start_server(args, env):
+    if args.server == "asgi":
+        cmd = [sys.executable, "-m", "uvicorn", "asgi:application", "--workers", "1",
+               "--port", str(args.app_port), "--log-level", "warning"]
+    else:
+        cmd = [sys.executable, "-m", "gunicorn", "-w", "1", "--threads", str(args.threads),
+               "-b", f"127.0.0.1:{args.app_port}", "app:app"]
+    return subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for entry in os.listdir("/proc"):
+        if entry.isdigit():
+            try:
+                with open(f"/proc/{entry}/stat") as f:
+                    # el nombre del comando va entre paréntesis y puede tener espacios
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            if ppid == pid:
+                pids.append(int(entry))
+    return pids
+
+
+def _memory_mb(pid):
+    """(RSS, pico de RSS) en MB del proceso más grande del árbol (el worker, con gunicorn)."""
+    rss = peak = 0.0
+    for p in _process_tree(pid):
+        try:
+            with open(f"/proc/{p}/status") as f:
+                fields = dict(line.split(":", 1) for line in f if ":" in line)
+        except OSError:
+            continue
+        rss = max(rss, int(fields.get("VmRSS", "0 kB").split()[0]) / 1024)
+        peak = max(peak, int(fields.get("VmHWM", "0 kB").split()[0]) / 1024)
+    return round(rss, 1), round(peak, 1)
+
+
+def _phases(metrics_text):
+    """{ruta: {fase: ms promedio}} desde api_request_phase_seconds de /metrics."""
+    sums, counts = {}, {}
+    for line in metrics_text.splitlines():
+        m = re.match(r'api_request_phase_seconds_(sum|count)\{route="([^"]+)",phase="([^"]+)"\} (\S+)', line)
+        if m:
+            kind, route, phase, value = m.groups()
+            (sums if kind == "sum" else counts)[(route, phase)] = float(value)
+    out = {}
+    for (route, phase), total in sums.items():
+        if counts.get((route, phase)):
+            out.setdefault(route, {})[phase] = round(total / counts[(route, phase)] * 1000, 2)
+    return out
+
+
+# -------------------
+# Carga
+async def _run(base_url, workload, stations, users, duration, seed):
+    latencies, per_route = [], {}
+    errors = 0
+    stop_at = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=users, max_keepalive_connections=users)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        async def user(n):
+            nonlocal errors
+            rng = random.Random(seed * 1000 + n)
+            while time.perf_counter() < stop_at:
+                for method, path, body in workload(rng, stations):
+                    t0 = time.perf_counter()
+                    try:
+                        r = await client.request(method, path, json=body)
+                        ok = r.status_code in (200, 304)
+                    except httpx.HTTPError:
+                        ok = False
+                    elapsed = time.perf_counter() - t0
+                    errors += not ok
+                    latencies.append(elapsed)
+                    per_route.setdefault(_route(path), []).append(elapsed)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(user(n) for n in range(users)))
+        elapsed = time.perf_counter() - t0
+    return latencies, per_route, errors, elapsed
+
+
+def _summary(latencies):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p90_ms": round(_percentile(latencies, 90) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def run_workload(name, args, stub, stations):
+    with tempfile.TemporaryDirectory() as data_dir:
+        env = dict(
+            os.environ,
+            OPENAQ_BASE_V3=stub.base_url,
+            DATA_DIR=data_dir,
+            GUNICORN_THREADS=str(args.threads),
+            METRICS_FLUSH="0",
+            PREFETCH_INTERVAL="0",
+        )
+        if not args.rate_limit:
+            # se mide el servidor, no el rate limit de OpenAQ
+            env["UPSTREAM_RATE_PER_MIN"] = "0"
+        base_url = f"http://127.0.0.1:{args.app_port}"
+        proc = _start_server(args, env)
+        try:
+            _wait_ready(base_url + "/api/cache_stats")
+            if args.warmup > 0:
+                asyncio.run(_run(base_url, WORKLOADS[name], stations, args.users, args.warmup, args.seed + 1))
+            before = stub.stats()
+            latencies, per_route, errors, elapsed = asyncio.run(
+                _run(base_url, WORKLOADS[name], stations, args.users, args.duration, args.seed))
+            after = stub.stats()
+            rss, peak = _memory_mb(proc.pid)
+            phases = _phases(httpx.get(base_url + "/metrics", timeout=30).text)
+        finally:
+            proc.terminate()
+            proc.wait()
+    upstream = {k: after[k] - before[k] for k in after}
+    res = dict(
+        _summary(latencies),
+        errors=errors,
+        rps=round(len(latencies) / elapsed, 2),
+        upstream_per_request=round(upstream["requests"] / len(latencies), 2) if latencies else None,
+        upstream=upstream,
+        rss_mb=rss,
+        peak_rss_mb=peak,
+        routes={route: _summary(v) for route, v in sorted(per_route.items())},
+        phases_ms=phases,
+    )
+    return res
+
+
+# -------------------
+# Resultados
+def _commit():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                             check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT,
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _history():
+    if not os.path.exists(RESULTS):
+        return []
+    with open(RESULTS, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _baseline(config, commit=None):
+    for run in reversed(_history()):
+        if run["config"] == config and (commit is None or (run.get("commit") or "").startswith(commit)):
+            return run
+    return None
+
+
+# (métrica, True si más alto es mejor)
+COMPARED = (("rps", True), ("p50_ms", False), ("p99_ms", False), ("peak_rss_mb", False),
+            ("upstream_per_request", False))
+
+
+def _compare(name, res, base, threshold):
+    """Líneas de diferencias contra la corrida base; True si alguna empeoró más que threshold %."""
+    prev = (base or {}).get("workloads", {}).get(name)
+    if not prev:
+        return [], False
+    lines, regressed = [], False
+    for metric, higher_is_better in COMPARED:
+        old, new = prev.get(metric), res.get(metric)
+        if not old or new is None:
+            continue
+        delta = (new - old) / old * 100
+        worse = -delta if higher_is_better else delta
+        flag = worse > threshold
+        regressed |= flag
+        lines.append(f"    {metric:<22} {old:>10} -> {new:<10} ({delta:+.1f}%){'  REGRESIÓN' if flag else ''}")
+    return lines, regressed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workloads", default=",".join(WORKLOADS))
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--threads", type=int, default=8, help="hilos del worker gunicorn (modo wsgi)")
+    parser.add_argument("--users", type=int, default=8, help="usuarios virtuales concurrentes")
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--warmup", type=float, default=3, help="segundos de carga sin medir antes de cada workload")
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--faults", default="", help="errores inyectados en el stub, p. ej. 500:0.01,429:0.01,drop:0.005")
+    parser.add_argument("--replay", help="cassette grabado (ver stub_openaq.py --record)")
+    parser.add_argument("--strict", action="store_true", help="con --replay, solo lo grabado")
+    parser.add_argument("--rows", type=int, default=40000, help="horas de datos sintéticos por sensor")
+    parser.add_argument("--stations", type=int, default=200, help="estaciones entre las que eligen los usuarios")
+    parser.add_argument("--rate-limit", action="store_true", help="dejar activo el gobernador del rate limit")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--app-port", type=int, default=8911)
+    parser.add_argument("--baseline", help="commit contra el que comparar (por defecto la última corrida igual)")
+    parser.add_argument("--threshold", type=float, default=10, help="%% de empeoramiento que cuenta como regresión")
+    parser.add_argument("--check", action="store_true", help="salir con 1 si hay regresiones")
+    parser.add_argument("--no-save", action="store_true")
+    args = parser.parse_args()
+
+    names = [w.strip() for w in args.workloads.split(",") if w.strip()]
+    unknown = set(names) - set(WORKLOADS)
+    if unknown:
+        parser.error(f"workloads desconocidos: {sorted(unknown)}")
+    # lo que tiene que coincidir para que dos corridas sean comparables
+    config = {
+        "server": args.server, "threads": args.threads, "users": args.users, "duration": args.duration,
+        "latency": args.latency, "jitter": args.jitter, "faults": args.faults,
+        "replay": os.path.basename(args.replay) if args.replay else None, "stations": args.stations,
+    }
+    base = _baseline(config, args.baseline)
+
+    run = {"time": datetime.now(timezone.utc).isoformat(timespec="seconds"), "commit": _commit(), "config": config,
+           "workloads": {}}
+    regressed = False
+    with StubOpenAQ(total_rows=args.rows, latency=args.latency, jitter=args.jitter, faults=parse_faults(args.faults),
+                    replay=args.replay, strict=args.strict, seed=args.seed) as stub:
+        stations = stub.stations(args.stations)
+        if not stations:
+            sys.exit("el cassette no tiene ninguna /v3/locations/{id} grabada")
+        print(f"{config}  (base: {base['commit'] + ' ' + base['time'] if base else 'ninguna'})")
+        for name in names:
+            res = run_workload(name, args, stub, stations)
+            run["workloads"][name] = res
+            print(f"{name:<10} req/s={res['rps']:7.1f}  p50={res['p50_ms']:8.1f}ms  p90={res['p90_ms']:8.1f}ms  "
+                  f"p99={res['p99_ms']:8.1f}ms  requests={res['requests']}  errores={res['errors']}  "
+                  f"openaq/req={res['upstream_per_request']}  rss={res['rss_mb']}MB (pico {res['peak_rss_mb']}MB)")
+            lines, worse = _compare(name, res, base, args.threshold)
+            regressed |= worse
+            for line in lines:
+                print(line)
+
+    if not args.no_save:
+        os.makedirs(os.path.dirname(RESULTS), exist_ok=True)
+        with open(RESULTS, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run, ensure_ascii=False) + "\n")
+        print(f"guardado en {os.path.relpath(RESULTS, ROOT)}")
+    if args.check and regressed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
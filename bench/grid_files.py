@@ -0,0 +1,113 @@
+"""
+Archivos de grilla sintéticos para satellite.py: GeoTIFF (strips o tiles, sin compresión) y
+NetCDF clásico, escritos a mano para no depender de GDAL. Los usan bench/bench_satellite.py y
+los fixtures de tests/test_satellite.py.
+"""
+import struct
+
+import numpy as np
+
+
+def write_geotiff(path, data, west, north, cell, tile=None, nodata=None, order="<", bigtiff=False, compression=1):
+    """
+    GeoTIFF float32, una banda, EPSG:4326. order: "<" (II) o ">" (MM); bigtiff: versión 43 con
+    offsets de 8 bytes; compression: valor del tag 259 (los datos se escriben crudos igual).
+    """
+    height, width = data.shape
+    data = data.astype(order + "f4")
+    if tile:
+        blocks = [data[r:r + tile, c:c + tile] for r in range(0, height, tile) for c in range(0, width, tile)]
+        blocks = [np.pad(b, ((0, tile - b.shape[0]), (0, tile - b.shape[1]))).tobytes() for b in blocks]
+    else:
+        rps = max(1, 8192 // (width * 4))
+        blocks = [data[r:r + rps].tobytes() for r in range(0, height, rps)]
+    header_size = 16 if bigtiff else 8
+    offsets, pos = [], header_size
+    for b in blocks:
+        offsets.append(pos)
+        pos += len(b)
+    extra = []    # valores que no entran en la entrada del IFD (van después)
+    entries = [(256, 4, [width]), (257, 4, [height]), (258, 3, [32]), (259, 3, [compression]),
+               (262, 3, [1]), (277, 3, [1]), (284, 3, [1]), (339, 3, [3])]
+    if tile:
+        entries += [(322, 4, [tile]), (323, 4, [tile]), (324, 4, offsets),
+                    (325, 4, [len(b) for b in blocks])]
+    else:
+        entries += [(273, 4, offsets), (278, 4, [rps]), (279, 4, [len(b) for b in blocks])]
+    entries += [(33550, 12, [cell, cell, 0.0]), (33922, 12, [0, 0, 0, west, north, 0]),
+                (34735, 3, [1, 1, 0, 2, 1024, 0, 1, 2, 1025, 0, 1, 1])]
+    if nodata is not None:
+        entries.append((42113, 2, str(nodata).encode() + b"\0"))
+    entries.sort()
+    fmt = {2: "s", 3: "H", 4: "I", 12: "d"}
+    size = {2: 1, 3: 2, 4: 4, 12: 8}
+    count_fmt, entry_fmt, ptr_fmt, inline = ("Q", "HHQ", "Q", 8) if bigtiff else ("H", "HHI", "I", 4)
+    ifd_pos = pos
+    ifd = struct.pack(order + count_fmt, len(entries))
+    entry_size = struct.calcsize(order + entry_fmt) + inline
+    extra_pos = ifd_pos + len(ifd) + entry_size * len(entries) + inline
+    for tag, typ, values in entries:
+        n = len(values)
+        packed = struct.pack(f"{order}{n}s" if typ == 2 else f"{order}{n}{fmt[typ]}", *([values] if typ == 2 else values))
+        if n * size[typ] <= inline:
+            ifd += struct.pack(order + entry_fmt, tag, typ, n) + packed.ljust(inline, b"\0")
+        else:
+            ifd += struct.pack(order + entry_fmt + ptr_fmt, tag, typ, n, extra_pos + sum(len(e) for e in extra))
+            extra.append(packed + b"\0" * (len(packed) % 2))
+    ifd += struct.pack(order + ptr_fmt, 0)
+    magic = b"II" if order == "<" else b"MM"
+    with open(path, "wb") as f:
+        if bigtiff:
+            f.write(magic + struct.pack(order + "HHHQ", 43, 8, 0, ifd_pos))
+        else:
+            f.write(magic + struct.pack(order + "HI", 42, ifd_pos))
+        for b in blocks:
+            f.write(b)
+        f.write(ifd)
+        for e in extra:
+            f.write(e)
+
+
+def write_netcdf(path, data, lats, lons, fill, version=1):
+    """NetCDF clásico (version 1 = CDF-1, 2 = offsets de 64 bits) con lat, lon y no2 (time=1, lat, lon) de registro."""
+    def name(s):
+        s = s.encode()
+        return struct.pack(">I", len(s)) + s + b"\0" * (-len(s) % 4)
+
+    def attrs(items):
+        if not items:
+            return struct.pack(">II", 0, 0)
+        out = struct.pack(">II", 0x0C, len(items))
+        for key, typ, value in items:
+            raw = value.encode() if typ == 2 else np.asarray([value], dtype={5: ">f4", 6: ">f8"}[typ]).tobytes()
+            n = len(raw) if typ == 2 else 1
+            out += name(key) + struct.pack(">II", typ, n) + raw + b"\0" * (-len(raw) % 4)
+        return out
+
+    dims = [("time", 0), ("lat", len(lats)), ("lon", len(lons))]
+    variables = [
+        ("lat", [1], 6, [("units", 2, "degrees_north")], np.asarray(lats, ">f8")),
+        ("lon", [2], 6, [("units", 2, "degrees_east")], np.asarray(lons, ">f8")),
+        ("no2", [0, 1, 2], 5, [("_FillValue", 5, fill), ("units", 2, "molec/cm2")], data.astype(">f4")),
+    ]
+    begin_fmt = ">Q" if version == 2 else ">I"
+    header = b"CDF" + bytes([version]) + struct.pack(">I", 1)
+    header += struct.pack(">II", 0x0A, len(dims)) + b"".join(name(n) + struct.pack(">I", s) for n, s in dims)
+    header += attrs([])
+
+    def var_list(begins):
+        out = struct.pack(">II", 0x0B, len(variables))
+        for (vname, dimids, typ, vattrs, arr), begin in zip(variables, begins):
+            out += name(vname) + struct.pack(">I", len(dimids)) + b"".join(struct.pack(">I", d) for d in dimids)
+            out += attrs(vattrs) + struct.pack(">II", typ, arr.nbytes) + struct.pack(begin_fmt, begin)
+        return out
+
+    size = len(header) + len(var_list([0] * len(variables)))
+    begins, pos = [], size
+    for *_, arr in variables:
+        begins.append(pos)
+        pos += arr.nbytes
+    with open(path, "wb") as f:
+        f.write(header + var_list(begins))
+        for *_, arr in variables:
+            f.write(arr.tobytes())
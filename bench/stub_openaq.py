@@ -0,0 +1,460 @@
+"""
+Servidor stub local de la API v3 de OpenAQ para benchmarks.
+
+Responde, con datos sintéticos y una latencia configurable por request (base + cola exponencial):
+  - /v3/parameters                     catálogo de parámetros
+  - /v3/parameters/{id}/latest         última lectura de ese parámetro en todas las locations
+  - /v3/locations?iso=                 locations 1..N (todas en PE), con paginación
+  - /v3/locations/{id}                 location con 4 sensores (pm25, no2, o3, co)
+  - /v3/locations/{id}/latest          última medición de cada sensor
+  - /v3/sensors/{id}                   metadata del sensor
+  - /v3/sensors/{id}/{suffix}          mediciones horarias desde 2020-01-01, con paginación
+                                       (page/limit y meta.found) y filtro date_from/date_to
+Los ids de sensor son location_id * 10 + k (k = 0..3).
+
+Respuestas grabadas (Cassette, un JSON por línea): con `replay` se sirven primero las grabadas
+(misma ruta y query; si no hay, misma ruta y query sin date_from/date_to, porque las ventanas de
+last_days dependen de la fecha) y lo que no está se responde con los datos sintéticos (o 404 con
+strict). Con `record` + `upstream` el stub hace de proxy hacia OpenAQ y graba lo que no tenía.
+
+Errores inyectados (faults): {status: probabilidad} por request; "drop" cierra la conexión sin
+responder. Los 429 llevan Retry-After: 1.
+
+Uso directo:
+    python bench/stub_openaq.py --port 8900 --latency 0.1 --jitter 0.05 --faults 500:0.02,429:0.01
+    # grabar (con red y API key), con la app apuntando a este stub:
+    python bench/stub_openaq.py --record bench/cassettes/openaq.jsonl --upstream https://api.openaq.org/v3
+"""
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, parse_qsl, urlencode, urlparse
+
+SERIES_RE = re.compile(r"^/v3/sensors/(\d+)/(.+)$")
+SENSOR_RE = re.compile(r"^/v3/sensors/(\d+)$")
+LOCATION_RE = re.compile(r"^/v3/locations/(\d+)$")
+LATEST_RE = re.compile(r"^/v3/locations/(\d+)/latest$")
+PARAMETERS_RE = re.compile(r"^/v3/parameters$")
+PARAMETER_LATEST_RE = re.compile(r"^/v3/parameters/(\d+)/latest$")
+LOCATIONS_RE = re.compile(r"^/v3/locations$")
+EPOCH = datetime(2020, 1, 1)
+
+PARAMETERS = [
+    {"id": 2, "name": "pm25", "units": "µg/m³", "displayName": "PM2.5"},
+    {"id": 5, "name": "no2", "units": "ppm", "displayName": "NO₂"},
+    {"id": 3, "name": "o3", "units": "ppm", "displayName": "O₃"},
+    {"id": 4, "name": "co", "units": "ppm", "displayName": "CO"},
+]
+
+
+def _dt(dt):
+    return {"utc": dt.isoformat() + "Z", "local": dt.isoformat()}
+
+
+def _row(sensor_id, i):
+    dt_from = EPOCH + timedelta(hours=i)
+    dt_to = dt_from + timedelta(hours=1)
+    return {
+        "value": round(10 + (i * 7 % 50) / 3, 3),
+        "parameter": {"id": 2, "name": "pm25", "units": "µg/m³"},
+        "period": {
+            "label": "1hour",
+            "datetimeFrom": _dt(dt_from),
+            "datetimeTo": _dt(dt_to),
+        },
+        "sensorsId": sensor_id,
+    }
+
+
+def _hour_index(value, ceil=False):
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00")).replace(tzinfo=None)
+    hours = (dt - EPOCH).total_seconds() / 3600
+    return int(-(-hours // 1)) if ceil else int(hours // 1)
+
+
+def _coords(location_id):
+    return {"latitude": -12.0 + (location_id % 100) / 10, "longitude": -77.0 + (location_id % 70) / 10}
+
+
+def _location(location_id, last):
+    sensors = [
+        {"id": location_id * 10 + k, "name": f"{p['name']} {p['units']}", "parameter": p,
+         "datetimeLast": _dt(last)}
+        for k, p in enumerate(PARAMETERS)
+    ]
+    return {
+        "id": location_id,
+        "name": f"Estación {location_id}",
+        "locality": "Stub",
+        "timezone": "UTC",
+        "country": {"id": 1, "code": "PE", "name": "Peru"},
+        "owner": {"id": 1, "name": "stub"},
+        "provider": {"id": 1, "name": "stub"},
+        "isMobile": False,
+        "isMonitor": True,
+        "instruments": [{"id": 1, "name": "Government Monitor"}],
+        "sensors": sensors,
+        "coordinates": _coords(location_id),
+        "bounds": [0, 0, 0, 0],
+        "distance": None,
+        "datetimeFirst": _dt(EPOCH),
+        "datetimeLast": _dt(last),
+    }
+
+
+def parse_faults(spec):
+    """'500:0.02,429:0.01,drop:0.005' -> {500: 0.02, 429: 0.01, 'drop': 0.005}"""
+    faults = {}
+    for part in (spec or "").split(","):
+        if part.strip():
+            kind, _, rate = part.partition(":")
+            kind = kind.strip()
+            faults["drop" if kind == "drop" else int(kind)] = float(rate)
+    return faults
+
+
+class Cassette:
+    """Respuestas grabadas: {"path", "query", "status", "body"} por línea (query normalizada)."""
+
+    DATE_PARAMS = ("date_from", "date_to")
+
+    def __init__(self, path):
+        self.path = path
+        self._exact = {}
+        self._loose = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        self._add(json.loads(line))
+
+    @staticmethod
+    def _query(query, drop=()):
+        return urlencode(sorted((k, v) for k, v in parse_qsl(query) if k not in drop))
+
+    def _add(self, entry):
+        value = (entry["status"], json.dumps(entry["body"]).encode())
+        self._exact[(entry["path"], entry["query"])] = value
+        self._loose.setdefault((entry["path"], self._query(entry["query"], self.DATE_PARAMS)), value)
+
+    def __len__(self):
+        return len(self._exact)
+
+    def lookup(self, path, query):
+        """(status, cuerpo, exacta) o None."""
+        hit = self._exact.get((path, self._query(query)))
+        if hit is not None:
+            return hit + (True,)
+        hit = self._loose.get((path, self._query(query, self.DATE_PARAMS)))
+        return hit + (False,) if hit is not None else None
+
+    def record(self, path, query, status, body):
+        entry = {"path": path, "query": self._query(query), "status": status, "body": body}
+        with self._lock:
+            self._add(entry)
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+    def locations(self):
+        """{location_id: body de /v3/locations/{id}} de lo grabado."""
+        out = {}
+        for (path, _), (status, body) in self._exact.items():
+            m = LOCATION_RE.match(path)
+            if m and status == 200:
+                results = json.loads(body).get("results") or []
+                if results:
+                    out[int(m.group(1))] = results[0]
+        return out
+
+
+class StubOpenAQ:
+    """
+    Servidor en un hilo de fondo. Uso:
+        with StubOpenAQ(total_rows=40000, latency=0.2) as stub:
+            app.BASE_V3 = stub.base_url
+    """
+
+    def __init__(self, total_rows=40000, latency=0.1, report_found=True, port=0, locations=500,
+                 jitter=0.0, faults=None, replay=None, strict=False, record=None, upstream=None, seed=0):
+        self.total_rows = total_rows
+        self.locations = locations
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = faults or {}
+        self.report_found = report_found
+        self.cassette = Cassette(record or replay) if (record or replay) else None
+        self.strict = strict
+        self.upstream = upstream.rstrip("/") if record and upstream else None
+        self.requests = 0
+        self.counts = {"replayed": 0, "replayed_loose": 0, "recorded": 0, "synthetic": 0, "missing": 0,
+                       "injected": 0}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                with stub._lock:
+                    stub.requests += 1
+                    delay = stub.latency + (stub._rng.expovariate(1 / stub.jitter) if stub.jitter > 0 else 0)
+                    fault = stub._fault()
+                time.sleep(delay)
+                if fault == "drop":
+                    # sin respuesta: del lado de la app es un ConnectionError
+                    self.close_connection = True
+                    return
+                if fault is not None:
+                    return self._send(fault, {"detail": "injected"}, retry_after=1 if fault == 429 else None)
+
+                url = urlparse(self.path)
+                if stub.cassette is not None:
+                    hit = stub.cassette.lookup(url.path, url.query)
+                    if hit is not None:
+                        status, data, exact = hit
+                        stub._count("replayed" if exact else "replayed_loose")
+                        return self._send_bytes(status, data)
+                    if stub.upstream:
+                        return self._send(*stub._forward(url, self.headers.get("X-API-Key")))
+                    if stub.strict:
+                        stub._count("missing")
+                        return self._send(404, {"detail": "not recorded"})
+                stub._count("synthetic")
+                qs = parse_qs(url.query)
+                for rx, handler in (
+                    (PARAMETERS_RE, stub._parameters),
+                    (PARAMETER_LATEST_RE, stub._parameter_latest),
+                    (LOCATIONS_RE, stub._locations),
+                    (LATEST_RE, stub._latest),
+                    (LOCATION_RE, stub._location),
+                    (SENSOR_RE, stub._sensor),
+                    (SERIES_RE, stub._series),
+                ):
+                    m = rx.match(url.path)
+                    if m:
+                        return self._send(*handler(qs, *m.groups()))
+                self._send(404, {"detail": "not found"})
+
+            def _send(self, status, body, retry_after=None):
+                self._send_bytes(status, json.dumps(body).encode(), retry_after)
+
+            def _send_bytes(self, status, data, retry_after=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                # el cliente openaq respeta estos headers: que nunca espere en el benchmark
+                self.send_header("x-ratelimit-limit", "1000000")
+                self.send_header("x-ratelimit-remaining", "1000000")
+                self.send_header("x-ratelimit-reset", "60")
+                self.end_headers()
+                self.wfile.write(data)
+
+        class Server(ThreadingHTTPServer):
+            # el backlog por defecto (5) hace que las conexiones concurrentes esperen al reintento SYN
+            request_queue_size = 256
+
+            def handle_error(self, request, client_address):
+                # clientes que se cierran a mitad de respuesta (p. ej. procesos de benchmark que terminan)
+                pass
+
+        self.server = Server(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def _fault(self):
+        """Con el lock tomado: status (o "drop") a inyectar en esta request, o None."""
+        r = self._rng.random()
+        for kind, rate in self.faults.items():
+            if r < rate:
+                self.counts["injected"] += 1
+                return kind
+            r -= rate
+        return None
+
+    def _forward(self, url, api_key):
+        """Modo grabación: pide a OpenAQ lo que no está en el cassette y lo graba (también los 404)."""
+        path = url.path.split("/v3", 1)[1] if "/v3" in url.path else url.path
+        target = f"{self.upstream}{path}" + (f"?{url.query}" if url.query else "")
+        req = urllib.request.Request(target, headers={
+            "X-API-Key": api_key or os.getenv("OPENAQ_API_KEY", ""), "Accept": "application/json",
+        })
+        try:
+            with urllib.request.urlopen(req, timeout=30) as resp:
+                status, body = resp.status, json.load(resp)
+        except urllib.error.HTTPError as e:
+            status = e.code
+            try:
+                body = json.load(e)
+            except ValueError:
+                body = {"detail": e.reason}
+        if status in (200, 404):
+            # los 429/5xx de OpenAQ no se graban: se reintentan en la próxima pasada
+            self.cassette.record(url.path, url.query, status, body)
+            self._count("recorded")
+        return status, body
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counts, requests=self.requests)
+
+    def stations(self, limit=None):
+        """
+        [(location_id, lat, lon, [(parameter_id, sensor_id), ...])] que el stub sabe responder:
+        las grabadas si hay cassette (con strict, solo esas), si no las sintéticas.
+        """
+        out = []
+        recorded = self.cassette.locations() if self.cassette is not None else {}
+        for loc_id, loc in sorted(recorded.items()):
+            coords = loc.get("coordinates") or {}
+            sensors = [((s.get("parameter") or {}).get("id"), s["id"]) for s in loc.get("sensors") or []]
+            if coords.get("latitude") is not None and sensors:
+                out.append((loc_id, coords["latitude"], coords["longitude"], sensors))
+        if not out and not self.strict:
+            out = [
+                (i, _coords(i)["latitude"], _coords(i)["longitude"],
+                 [(p["id"], i * 10 + k) for k, p in enumerate(PARAMETERS)])
+                for i in range(1, self.locations + 1)
+            ]
+        return out[:limit] if limit else out
+
+    @property
+    def last_datetime(self):
+        return EPOCH + timedelta(hours=self.total_rows - 1)
+
+    def _page(self, rows, qs, limit):
+        return {"meta": {"page": int(qs.get("page", ["1"])[0]), "limit": limit, "found": len(rows)}, "results": rows}
+
+    def _parameters(self, qs):
+        return 200, self._page(PARAMETERS, qs, 100)
+
+    def _slice(self, qs, make):
+        """Paginación sobre las locations 1..self.locations: make(location_id) -> fila."""
+        page = int(qs.get("page", ["1"])[0])
+        limit = int(qs.get("limit", ["100"])[0])
+        ids = range(1 + (page - 1) * limit, min(page * limit, self.locations) + 1)
+        return {"meta": {"page": page, "limit": limit, "found": self.locations}, "results": [make(i) for i in ids]}
+
+    def _locations(self, qs):
+        if qs.get("iso", ["PE"])[0].upper() != "PE":
+            return 200, {"meta": {"page": 1, "limit": 100, "found": 0}, "results": []}
+        return 200, self._slice(qs, lambda i: _location(i, self.last_datetime))
+
+    def _parameter_latest(self, qs, parameter_id):
+        k = next((k for k, p in enumerate(PARAMETERS) if p["id"] == int(parameter_id)), 0)
+        i = self.total_rows - 1
+        return 200, self._slice(qs, lambda loc: {
+            "datetime": _dt(self.last_datetime - timedelta(hours=loc % 72)),
+            "value": _row(0, i + loc)["value"],
+            "coordinates": _coords(loc),
+            "sensorsId": loc * 10 + k,
+            "locationsId": loc,
+        })
+
+    def _location(self, qs, location_id):
+        return 200, self._page([_location(int(location_id), self.last_datetime)], qs, 100)
+
+    def _latest(self, qs, location_id):
+        location_id = int(location_id)
+        i = self.total_rows - 1
+        rows = [
+            {
+                "datetime": _dt(self.last_datetime),
+                "value": _row(0, i + k)["value"],
+                "coordinates": _coords(location_id),
+                "sensorsId": location_id * 10 + k,
+                "locationsId": location_id,
+            }
+            for k in range(len(PARAMETERS))
+        ]
+        return 200, self._page(rows, qs, 100)
+
+    def _sensor(self, qs, sensor_id):
+        sensor_id = int(sensor_id)
+        p = PARAMETERS[sensor_id % 10 % len(PARAMETERS)]
+        row = {
+            "id": sensor_id,
+            "name": f"{p['name']} {p['units']}",
+            "parameter": p,
+            "datetimeFirst": _dt(EPOCH),
+            "datetimeLast": _dt(self.last_datetime),
+        }
+        return 200, self._page([row], qs, 100)
+
+    def _series(self, qs, sensor_id, suffix):
+        page = int(qs.get("page", ["1"])[0])
+        limit = int(qs.get("limit", ["100"])[0])
+        # fila i = hora i desde EPOCH; date_from/date_to recortan el rango
+        first, last = 0, self.total_rows
+        if qs.get("date_from"):
+            first = max(first, _hour_index(qs["date_from"][0], ceil=True))
+        if qs.get("date_to"):
+            last = min(last, _hour_index(qs["date_to"][0]) + 1)
+        total = max(0, last - first)
+        start = first + (page - 1) * limit
+        stop = min(start + limit, last)
+        rows = [_row(int(sensor_id), i) for i in range(start, stop)]
+        found = total if self.report_found else f">{limit}"
+        return 200, {"meta": {"page": page, "limit": limit, "found": found}, "results": rows}
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/v3"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--rows", type=int, default=40000)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--locations", type=int, default=500)
+    parser.add_argument("--jitter", type=float, default=0.0, help="media de la cola exponencial sumada a la latencia")
+    parser.add_argument("--faults", default="", help="errores inyectados, p. ej. 500:0.02,429:0.01,drop:0.005")
+    parser.add_argument("--replay", help="cassette (.jsonl) con respuestas grabadas")
+    parser.add_argument("--strict", action="store_true", help="con --replay, 404 para lo no grabado")
+    parser.add_argument("--record", help="cassette donde grabar (requiere --upstream)")
+    parser.add_argument("--upstream", default="https://api.openaq.org/v3")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    with StubOpenAQ(total_rows=args.rows, latency=args.latency, port=args.port, locations=args.locations,
+                    jitter=args.jitter, faults=parse_faults(args.faults), replay=args.replay, strict=args.strict,
+                    record=args.record, upstream=args.upstream, seed=args.seed) as stub:
+        mode = f"grabando en {args.record}" if args.record else f"cassette {args.replay}" if args.replay else "sintético"
+        print(f"Stub OpenAQ en {stub.base_url} (latencia {args.latency}s, {mode})", flush=True)
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
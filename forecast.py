@@ -0,0 +1,313 @@
+# forecast.py
+"""
+Servicio de pronóstico con el LSTM de LSTM_8_PARAMETROS.ipynb (Net: 8 variables, seq_len 200).
+
+- El checkpoint (LSTM_PREDICTIONS.pth) se carga una sola vez por worker, en CPU y en modo inferencia.
+- Las requests concurrentes se juntan en micro-lotes: un hilo toma lo que haya en la cola
+  (hasta max_batch ventanas, esperando como mucho max_wait segundos) y hace un solo forward.
+- Las ventanas llegan en unidades reales; se escalan con los MinMax por columna del
+  entrenamiento y la salida se desescala con los mismos.
+- Los pronósticos se guardan en la caché que se pase (p. ej. TTLCache de app.py) por la clave
+  que elija quien llama, típicamente (estación, fin de ventana), más la versión del modelo.
+- Checkpoints versionados (ver publish_checkpoint): si existe el puntero current.json, se sirve
+  la versión que indica y se cambia en caliente cuando cambia, sin reiniciar el worker.
+
+torch está en requirements.txt, pero sigue siendo opcional aquí: sin torch o sin checkpoint,
+available() es False.
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+import numpy as np
+
+try:
+    import torch
+    import torch.nn as nn
+except ImportError:
+    torch = None
+
+
+FEATURES = ("pm25_avg", "no2_avg", "o3_avg", "co_avg", "T2M", "U2M", "V2M", "PS")
+SEQ_LEN = 200
+
+
+if torch is not None:
+    class Net(nn.Module):
+        """Misma arquitectura que el notebook (los nombres de las capas coinciden con el state_dict)."""
+
+        def __init__(self, input_size=8, output_size=8, hidden_size=96, num_layers=1):
+            super().__init__()
+            self.hidden_size = hidden_size
+            self.num_layers = num_layers
+            self.LSTM = nn.LSTM(
+                input_size=input_size,
+                hidden_size=hidden_size,
+                num_layers=num_layers,
+                batch_first=True
+            )
+            self.fc = nn.Linear(hidden_size, output_size)
+
+        def forward(self, x):
+            h0 = torch.zeros(self.LSTM.num_layers, x.size(0), self.hidden_size).to(x.device)
+            c0 = torch.zeros(self.LSTM.num_layers, x.size(0), self.hidden_size).to(x.device)
+            out, _ = self.LSTM(x, (h0, c0))
+            return self.fc(out[:, -1, :])
+
+
+class MinMaxScalers:
+    """Los MinMaxScaler por columna del notebook: x' = (x - min) / (max - min), en bloque para todas."""
+
+    def __init__(self, mins, maxs):
+        self.mins = np.asarray(mins, dtype=np.float32)
+        self.maxs = np.asarray(maxs, dtype=np.float32)
+        rng = self.maxs - self.mins
+        # igual que sklearn: una columna constante no se escala
+        self.scale = np.where(rng == 0, 1.0, rng).astype(np.float32)
+
+    @classmethod
+    def from_dict(cls, data):
+        """{columna: [min, max]} con las columnas de FEATURES."""
+        return cls([data[c][0] for c in FEATURES], [data[c][1] for c in FEATURES])
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+    def to_dict(self):
+        return {c: [float(lo), float(hi)] for c, lo, hi in zip(FEATURES, self.mins, self.maxs)}
+
+    def updated(self, data):
+        """
+        Amplía min/max con datos nuevos (como partial_fit de MinMaxScaler).
+        Devuelve (scalers, columnas que cambiaron); las demás quedan exactamente igual.
+        """
+        mins = np.minimum(self.mins, np.nanmin(data, axis=0))
+        maxs = np.maximum(self.maxs, np.nanmax(data, axis=0))
+        changed = [c for c, a, b, c0, c1 in zip(FEATURES, mins, maxs, self.mins, self.maxs) if a != c0 or b != c1]
+        return MinMaxScalers(mins, maxs), changed
+
+    def transform(self, x):
+        return (x - self.mins) / self.scale
+
+    def inverse(self, x):
+        return x * self.scale + self.mins
+
+
+def load_checkpoint(path, scalers_path=None):
+    """
+    Acepta el state_dict tal cual lo guarda el notebook, o un dict
+    {"state_dict", "config": {"seq_len", ...}, "scalers": {columna: [min, max]}, "version"}.
+    Tamaños de la red se deducen de los pesos. Devuelve (net, scalers, seq_len, version).
+    Se carga con weights_only: solo tensores y dicts/listas/números/str, nunca objetos pickle
+    arbitrarios (el puntero current.json se cambia en caliente).
+    """
+    ckpt = torch.load(path, map_location="cpu", weights_only=True)
+    if "state_dict" in ckpt:
+        state, config, scalers = ckpt["state_dict"], ckpt.get("config") or {}, ckpt.get("scalers")
+        version = ckpt.get("version")
+    else:
+        state, config, scalers, version = ckpt, {}, None, None
+    if scalers is None:
+        if not scalers_path or not os.path.exists(scalers_path):
+            raise RuntimeError("faltan los scalers MinMax del entrenamiento")
+        scalers = MinMaxScalers.from_file(scalers_path)
+    else:
+        scalers = MinMaxScalers.from_dict(scalers)
+
+    net = Net(
+        input_size=state["LSTM.weight_ih_l0"].shape[1],
+        output_size=state["fc.weight"].shape[0],
+        hidden_size=state["fc.weight"].shape[1],
+        num_layers=sum(1 for k in state if k.startswith("LSTM.weight_ih_l")),
+    )
+    net.load_state_dict(state)
+    net.eval()
+    version = version or time.strftime("%Y%m%d%H%M%S", time.gmtime(os.path.getmtime(path)))
+    return net, scalers, int(config.get("seq_len", SEQ_LEN)), version
+
+
+def read_current(current_path):
+    """Ruta del checkpoint al que apunta current.json, o None si no hay puntero."""
+    try:
+        with open(current_path, encoding="utf-8") as f:
+            pointer = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return os.path.join(os.path.dirname(os.path.abspath(current_path)), pointer["path"])
+
+
+def publish_checkpoint(models_dir, checkpoint, keep=5):
+    """
+    Guarda checkpoint (dict con "version", ver load_checkpoint) como models_dir/LSTM_<version>.pth
+    y mueve el puntero current.json de forma atómica. Conserva las últimas `keep` versiones.
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    name = f"LSTM_{checkpoint['version']}.pth"
+    tmp = os.path.join(models_dir, f".{name}.tmp")
+    torch.save(checkpoint, tmp)
+    os.replace(tmp, os.path.join(models_dir, name))
+
+    current = os.path.join(models_dir, "current.json")
+    with open(current + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": checkpoint["version"], "path": name}, f)
+    os.replace(current + ".tmp", current)
+
+    versions = sorted(n for n in os.listdir(models_dir) if n.startswith("LSTM_") and n.endswith(".pth"))
+    for old in versions[:-keep]:
+        os.remove(os.path.join(models_dir, old))
+    return os.path.join(models_dir, name)
+
+
+LoadedModel = namedtuple("LoadedModel", "forward scalers seq_len version path mtime")
+
+
+class ForecastService:
+    """Modelo cargado una vez (y recargado en caliente) + hilo de micro-lotes + caché de pronósticos."""
+
+    def __init__(self, model_path, scalers_path=None, max_batch=32, max_wait=0.005, threads=1, cache=None,
+                 current_path=None, reload_interval=30):
+        self.model_path = model_path
+        self.scalers_path = scalers_path
+        self.current_path = current_path
+        self.reload_interval = reload_interval
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.threads = threads
+        self.cache = cache
+        self._model = None      # LoadedModel; se reemplaza entero, nunca se modifica
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._checked_at = 0.0
+        self._queue = queue.Queue()
+        self._worker = None
+        self.batches = 0
+        self.batched_requests = 0
+        self.max_batch_seen = 0
+        self.reloads = 0
+
+    def _resolve_path(self):
+        """El checkpoint de current.json si hay puntero; si no, model_path."""
+        if self.current_path:
+            path = read_current(self.current_path)
+            if path and os.path.exists(path):
+                return path
+        return self.model_path
+
+    def available(self):
+        return torch is not None and os.path.exists(self._resolve_path())
+
+    def _load(self, path):
+        net, scalers, seq_len, version = load_checkpoint(path, self.scalers_path)
+
+        def forward(x):
+            with torch.inference_mode():
+                return net(torch.from_numpy(x)).numpy()
+
+        return LoadedModel(forward, scalers, seq_len, version, path, os.path.getmtime(path))
+
+    def _ensure_loaded(self):
+        if self._model is not None:
+            self._maybe_reload()
+            return self._model
+        with self._lock:
+            if self._model is None:
+                if torch is not None:
+                    # varios workers por máquina: cada uno con pocos hilos de torch
+                    torch.set_num_threads(self.threads)
+                self._model = self._load(self._resolve_path())
+                self._checked_at = time.monotonic()
+                self._worker = threading.Thread(target=self._run, name="forecast-batcher", daemon=True)
+                self._worker.start()
+        return self._model
+
+    def _maybe_reload(self):
+        """Cada reload_interval s mira si el puntero/archivo cambió; carga la versión nueva sin frenar a nadie."""
+        if time.monotonic() - self._checked_at < self.reload_interval:
+            return
+        # una sola request hace la recarga; las demás siguen con el modelo actual mientras tanto
+        if not self._reload_lock.acquire(blocking=False):
+            return
+        try:
+            self._checked_at = time.monotonic()
+            path = self._resolve_path()
+            current = self._model
+            if path == current.path and os.path.exists(path) and os.path.getmtime(path) == current.mtime:
+                return
+            try:
+                self._model = self._load(path)
+                self.reloads += 1
+            except Exception as e:
+                # checkpoint a medio escribir o inválido: seguimos con el que hay
+                print("Error recargando el modelo de pronóstico:", e)
+        finally:
+            self._reload_lock.release()
+
+    def predict(self, window, key=None, timeout=30):
+        """
+        window: secuencia (seq_len, 8) en unidades reales, columnas en el orden de FEATURES.
+        Devuelve ({variable: valor del paso siguiente}, desde_caché).
+        """
+        model = self._ensure_loaded()
+        if key is not None and self.cache is not None:
+            found, value = self.cache.get((model.version,) + tuple(key))
+            if found:
+                return value, True
+        x = np.asarray(window, dtype=np.float32)
+        if x.shape != (model.seq_len, len(FEATURES)):
+            raise ValueError(f"la ventana debe ser {model.seq_len} filas x {len(FEATURES)} columnas ({', '.join(FEATURES)})")
+        if not np.isfinite(x).all():
+            raise ValueError("la ventana tiene valores vacíos o no numéricos")
+        fut = Future()
+        self._queue.put((x, fut))
+        out, version = fut.result(timeout=timeout)
+        if key is not None and self.cache is not None:
+            self.cache.set((version,) + tuple(key), out)
+        return out, False
+
+    def _next_batch(self):
+        items = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(items) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                items.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return items
+
+    def _run(self):
+        while True:
+            items = self._next_batch()
+            # escalado, forward y desescalado con la misma versión, aunque se cambie a mitad de camino
+            model = self._model
+            try:
+                x = model.scalers.transform(np.stack([x for x, _ in items]))
+                y = model.scalers.inverse(model.forward(x))
+                for (_, fut), row in zip(items, y):
+                    fut.set_result(({f: float(v) for f, v in zip(FEATURES, row)}, model.version))
+            except Exception as e:
+                for _, fut in items:
+                    fut.set_exception(e)
+            self.batches += 1
+            self.batched_requests += len(items)
+            self.max_batch_seen = max(self.max_batch_seen, len(items))
+
+    def stats(self):
+        model = self._model
+        return {
+            "available": self.available(),
+            "loaded": model is not None,
+            "version": model.version if model else None,
+            "path": model.path if model else None,
+            "reloads": self.reloads,
+            "batches": self.batches,
+            "requests": self.batched_requests,
+            "avg_batch": round(self.batched_requests / self.batches, 2) if self.batches else None,
+            "max_batch": self.max_batch_seen,
+        }
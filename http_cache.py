@@ -0,0 +1,89 @@
+# http_cache.py
+"""
+Semántica de caché HTTP para las respuestas de la API (la usan app.py y asgi.py).
+
+- ETag fuerte = hash del cuerpo sin comprimir (+ sufijo de la codificación, porque el cuerpo
+  enviado cambia); If-None-Match que coincide -> 304 sin cuerpo.
+- Cache-Control lo decide quien llama (política por ruta).
+- Cuerpos JSON grandes se comprimen con brotli (si está instalado) o gzip, y la versión
+  comprimida se guarda por (ETag, codificación): la misma respuesta no se comprime dos veces.
+"""
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+COMPRESSIBLE = ("application/json", "application/x-ndjson", "text/")
+MIN_COMPRESS_SIZE = 1024
+
+
+def etag_of(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+def encodings_available():
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def negotiate_encoding(accept_encoding):
+    """Primera codificación disponible (br, gzip) que el cliente acepta con q > 0, o None."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        q = 1.0
+        if params.strip().startswith("q="):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for enc in encodings_available():
+        if accepted.get(enc, accepted.get("*", 0)) > 0:
+            return enc
+    return None
+
+
+def compress(body, encoding):
+    if encoding == "br":
+        return brotli.compress(body, quality=5)
+    # mtime=0: mismo cuerpo -> mismos bytes comprimidos
+    return gzip.compress(body, compresslevel=6, mtime=0)
+
+
+def matches(if_none_match, *tags):
+    """If-None-Match contiene alguna de las etiquetas (comparación débil, como pide la RFC 9110)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    sent = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    return any(t in sent for t in tags)
+
+
+def conditional(body, content_type, cache_control, accept_encoding=None, if_none_match=None, cache=None):
+    """
+    Para una respuesta 200: devuelve (status, cuerpo, headers) con ETag, Cache-Control, Vary y,
+    si conviene, Content-Encoding. cache: objeto con get/set (p. ej. TTLCache) para los comprimidos.
+    """
+    base = etag_of(body)
+    compressible = (content_type or "").startswith(COMPRESSIBLE)
+    encoding = negotiate_encoding(accept_encoding) if compressible and len(body) >= MIN_COMPRESS_SIZE else None
+    tag = f'"{base}-{encoding}"' if encoding else f'"{base}"'
+    headers = {"ETag": tag, "Cache-Control": cache_control}
+    if compressible:
+        headers["Vary"] = "Accept-Encoding"
+    if matches(if_none_match, tag, f'"{base}"'):
+        return 304, b"", headers
+    if encoding:
+        found, packed = cache.get((base, encoding)) if cache is not None else (False, None)
+        if not found:
+            packed = compress(body, encoding)
+            if cache is not None:
+                cache.set((base, encoding), packed)
+        body = packed
+        headers["Content-Encoding"] = encoding
+    return 200, body, headers
@@ -0,0 +1,359 @@
+# instrumentation.py
+"""
+Instrumentación por ruta: en qué se fue el tiempo de una request lenta.
+
+- Metrics: contadores e histogramas con etiquetas, en formato de texto de Prometheus (render()).
+  Con `directory`, cada worker vuelca sus series a <pid>.json cada tanto y render() suma las de
+  todos, así un scrape a cualquier worker ve el total de la máquina.
+- Trace: la request en curso (ruta, fases, llamadas a OpenAQ) en un ContextVar, que sirve igual
+  para los hilos de gunicorn y para las corutinas de asgi.py. Los pools de hilos no heredan el
+  contexto: hay que mandarles el trabajo con submit() de este módulo.
+- phase("fetch") / @timed("fetch"): tiempo por fase. Las fases pueden anidarse (el tiempo de
+  "aggregate" incluye el "fetch" que hace adentro); una fase que ya está abierta no se vuelve a
+  contar. Fuera de una request no hacen nada.
+- SamplingProfiler: muestrea cada `interval` s la pila del hilo de las requests marcadas y, si la
+  request tardó más que slow_ms, guarda las pilas colapsadas ("a;b;c 12", el formato de
+  flamegraph.pl y speedscope).
+"""
+import bisect
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+
+def _number(x):
+    if x == float("inf"):
+        return "+Inf"
+    return repr(float(x)) if isinstance(x, float) and not x.is_integer() else str(int(x))
+
+
+class Metrics:
+    def __init__(self, directory=None, flush_interval=15, stale_after=86400):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.stale_after = stale_after
+        self._families = {}    # nombre -> {"type", "help", "labels", "buckets", "series": {valores: [...]}}
+        self._gauges = {}      # nombre -> (help, labels, fn() -> [(valores, número)])
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _family(self, kind, name, help, labels, buckets=None):
+        fam = self._families.get(name)
+        if fam is None:
+            fam = self._families[name] = {"type": kind, "help": help, "labels": tuple(labels),
+                                          "buckets": list(buckets) if buckets else None, "series": {}}
+        return fam
+
+    def counter(self, name, help, labels=()):
+        with self._lock:
+            self._family("counter", name, help, labels)
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        with self._lock:
+            self._family("histogram", name, help, labels, buckets)
+
+    def gauge(self, name, help, fn, labels=()):
+        """Gauge que se calcula al exportar (solo en el worker que responde el scrape)."""
+        self._gauges[name] = (help, tuple(labels), fn)
+
+    def inc(self, name, labels=(), value=1):
+        with self._lock:
+            series = self._families[name]["series"]
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            fam = self._families[name]
+            st = fam["series"].get(labels)
+            if st is None:
+                # conteo por bucket (no acumulado) + el de +Inf, suma y cantidad
+                st = fam["series"][labels] = [0] * (len(fam["buckets"]) + 1) + [0.0, 0]
+            st[bisect.bisect_left(fam["buckets"], value)] += 1
+            st[-2] += value
+            st[-1] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                name: dict(fam, series=[[list(k), v if isinstance(v, (int, float)) else list(v)]
+                                        for k, v in fam["series"].items()])
+                for name, fam in self._families.items()
+            }
+
+    # --- varios workers
+    def start(self):
+        if self.directory and self.flush_interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._flusher, name="metrics-flush", daemon=True)
+            self._thread.start()
+
+    def _flusher(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print("Error guardando métricas:", e)
+
+    def flush(self):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{os.getpid()}.json")
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def _others(self):
+        """Snapshots de los otros workers (también de los que ya terminaron, hasta stale_after)."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return []
+        own = f"{os.getpid()}.json"
+        out = []
+        for name in os.listdir(self.directory):
+            if name == own or not name.endswith(".json"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                if time.time() - os.path.getmtime(path) > self.stale_after:
+                    os.remove(path)
+                    continue
+                with open(path, encoding="utf-8") as f:
+                    out.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return out
+
+    @staticmethod
+    def _merge(into, snapshot):
+        for name, fam in snapshot.items():
+            target = into.setdefault(name, dict(fam, series={}))
+            if target["type"] != fam["type"] or target["buckets"] != fam["buckets"]:
+                continue
+            for key, value in fam["series"]:
+                key = tuple(key)
+                if fam["type"] == "counter":
+                    target["series"][key] = target["series"].get(key, 0) + value
+                else:
+                    prev = target["series"].get(key)
+                    target["series"][key] = value if prev is None else [a + b for a, b in zip(prev, value)]
+
+    def render(self):
+        merged = {}
+        for snap in [self.snapshot()] + self._others():
+            self._merge(merged, snap)
+        lines = []
+        for name in sorted(merged):
+            fam = merged[name]
+            lines.append(f"# HELP {name} {fam['help']}")
+            lines.append(f"# TYPE {name} {fam['type']}")
+            names = fam["labels"]
+            for key in sorted(fam["series"], key=lambda k: tuple(map(str, k))):
+                value = fam["series"][key]
+                if fam["type"] == "counter":
+                    lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+                    continue
+                cumulative = 0
+                for le, n in zip(list(fam["buckets"]) + [float("inf")], value[:-2]):
+                    cumulative += n
+                    lines.append(f"{name}_bucket{_labels(names, key, ('le', _number(le)))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(names, key)} {round(value[-2], 6)}")
+                lines.append(f"{name}_count{_labels(names, key)} {value[-1]}")
+        for name in sorted(self._gauges):
+            help, names, fn = self._gauges[name]
+            try:
+                samples = list(fn())
+            except Exception:
+                continue
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            for key, value in samples:
+                if value is not None:
+                    lines.append(f"{name}{_labels(names, key)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# -------------------
+# Request en curso
+class Trace:
+    __slots__ = ("route", "start", "status", "profile", "phases", "upstream_calls", "upstream_bytes", "upstream_s",
+                 "_open", "_lock")
+
+    def __init__(self, route):
+        self.route = route
+        self.start = time.perf_counter()
+        self.status = None
+        self.profile = None    # ident del hilo si la request se está perfilando
+        self.phases = {}
+        self.upstream_calls = 0
+        self.upstream_bytes = 0
+        self.upstream_s = 0.0
+        self._open = set()    # fases abiertas (en cualquier hilo de la request)
+        self._lock = threading.Lock()
+
+    def add_phase(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_upstream(self, nbytes, seconds):
+        with self._lock:
+            self.upstream_calls += 1
+            self.upstream_bytes += nbytes or 0
+            self.upstream_s += seconds
+
+    def server_timing(self):
+        """Header Server-Timing (lo muestran las devtools del navegador)."""
+        parts = [f'upstream;dur={self.upstream_s * 1000:.1f};desc="{self.upstream_calls} calls"']
+        parts += [f"{name};dur={s * 1000:.1f}" for name, s in self.phases.items()]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.1f}")
+        return ", ".join(parts)
+
+
+_CURRENT = contextvars.ContextVar("request_trace", default=None)
+
+
+def current():
+    return _CURRENT.get()
+
+
+def begin(route):
+    trace = Trace(route)
+    _CURRENT.set(trace)
+    return trace
+
+
+def end():
+    _CURRENT.set(None)
+
+
+@contextmanager
+def phase(name):
+    trace = _CURRENT.get()
+    if trace is None or name in trace._open:
+        yield
+        return
+    trace._open.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace._open.discard(name)
+        trace.add_phase(name, time.perf_counter() - start)
+
+
+def timed(name):
+    """Decorador: toda la llamada cuenta como la fase `name`."""
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with phase(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def submit(pool, fn, *args, **kwargs):
+    """pool.submit con el contexto de la request (las llamadas a OpenAQ del pool se le atribuyen)."""
+    return pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+# -------------------
+# Perfilado por muestreo
+class SamplingProfiler:
+    def __init__(self, directory, slow_ms=1000, interval=0.005, keep=50):
+        self.directory = directory
+        self.slow_ms = slow_ms
+        self.interval = interval
+        self.keep = keep
+        self.dumped = 0
+        self._active = {}    # ident del hilo -> Counter de pilas colapsadas
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self, ident=None):
+        """Empieza a muestrear el hilo (por defecto, el actual)."""
+        ident = ident or threading.get_ident()
+        with self._lock:
+            self._active[ident] = Counter()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        return ident
+
+    def stop(self, ident, route, duration_s):
+        """Deja de muestrear; si la request fue lenta guarda las pilas y devuelve el nombre del archivo."""
+        with self._lock:
+            stacks = self._active.pop(ident, None)
+        if not stacks or duration_s * 1000 < self.slow_ms:
+            return None
+        name = f"{int(time.time() * 1000)}-{route}-{int(duration_s * 1000)}ms.folded"
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            for stack, n in stacks.most_common():
+                f.write(f"{stack} {n}\n")
+        self.dumped += 1
+        self._prune()
+        return name
+
+    def _prune(self):
+        files = sorted(f for f in os.listdir(self.directory) if f.endswith(".folded"))
+        for f in files[:max(0, len(files) - self.keep)]:
+            try:
+                os.remove(os.path.join(self.directory, f))
+            except OSError:
+                pass
+
+    def profiles(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((f for f in os.listdir(self.directory) if f.endswith(".folded")), reverse=True)
+
+    @staticmethod
+    def _collapse(frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+            frame = frame.f_back
+        return ";".join(reversed(stack))
+
+    def _run(self):
+        while True:
+            # clear antes de mirar: un start() que llegue después vuelve a despertar el hilo
+            self._wake.clear()
+            with self._lock:
+                idents = list(self._active)
+            if not idents:
+                self._wake.wait()
+                continue
+            frames = sys._current_frames()
+            with self._lock:
+                for ident in idents:
+                    frame = frames.get(ident)
+                    stacks = self._active.get(ident)
+                    if frame is not None and stacks is not None:
+                        stacks[self._collapse(frame)] += 1
+            del frames
+            time.sleep(self.interval)
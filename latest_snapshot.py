@@ -0,0 +1,89 @@
+# latest_snapshot.py
+"""
+Snapshot en memoria de la última lectura de todas las estaciones para un parámetro
+(OpenAQ /v3/parameters/{id}/latest), para mapas y rankings.
+
+- Columnas NumPy (location_id, sensor_id, ts, value, lat, lon, datetime_utc) + spatial.GridIndex,
+  así un filtro por bbox, por conjunto de locations o por antigüedad es vectorizado.
+- Se guarda en un .npz (reemplazo atómico) que comparten todos los workers: uno lo renueva
+  y los demás lo recargan al ver que cambió el mtime.
+"""
+import os
+
+import numpy as np
+
+from spatial import GridIndex
+from timeseries_store import to_epoch
+
+
+class LatestSnapshot:
+    COLUMNS = ("location_id", "sensor_id", "ts", "value", "lat", "lon", "datetime_utc")
+
+    def __init__(self, parameter_id, columns, refreshed_at, mtime=None):
+        self.parameter_id = parameter_id
+        self.refreshed_at = refreshed_at
+        self.mtime = mtime
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        self.index = GridIndex(self.lat, self.lon)
+
+    def __len__(self):
+        return len(self.location_id)
+
+    @classmethod
+    def from_results(cls, parameter_id, results, refreshed_at):
+        """results de /parameters/{id}/latest; se descartan lecturas sin coordenadas, fecha o valor."""
+        rows = []
+        for it in results:
+            coords = it.get("coordinates") or {}
+            dt = (it.get("datetime") or {}).get("utc")
+            if coords.get("latitude") is None or coords.get("longitude") is None or not dt or it.get("value") is None:
+                continue
+            rows.append((
+                it.get("locationsId"), it.get("sensorsId"), to_epoch(dt), it["value"],
+                coords["latitude"], coords["longitude"], dt,
+            ))
+        cols = list(zip(*rows)) if rows else [()] * len(cls.COLUMNS)
+        dtypes = (np.int64, np.int64, np.int64, np.float64, np.float64, np.float64, str)
+        return cls(parameter_id, {name: np.asarray(c, dtype=t) for name, c, t in zip(cls.COLUMNS, cols, dtypes)},
+                   refreshed_at)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, parameter_id=self.parameter_id, refreshed_at=self.refreshed_at,
+                     **{name: getattr(self, name) for name in self.COLUMNS})
+        os.replace(tmp, path)
+        self.mtime = os.path.getmtime(path)
+
+    @classmethod
+    def load(cls, path):
+        mtime = os.path.getmtime(path)
+        with np.load(path) as data:
+            return cls(int(data["parameter_id"]), {name: data[name] for name in cls.COLUMNS},
+                       float(data["refreshed_at"]), mtime=mtime)
+
+    def select(self, bbox=None, location_ids=None, since=None):
+        """Índices que cumplen todos los filtros dados: bbox (oeste, sur, este, norte), ids, ts >= since."""
+        idx = self.index.query(*bbox) if bbox else np.arange(len(self))
+        if location_ids is not None:
+            idx = idx[np.isin(self.location_id[idx], np.asarray(location_ids, dtype=np.int64))]
+        if since is not None:
+            idx = idx[self.ts[idx] >= since]
+        return idx
+
+    def records(self, idx, order=None, limit=None):
+        """Registros JSON; order 'desc'/'asc' ordena por valor (ranking)."""
+        if order:
+            by_value = np.argsort(self.value[idx], kind="stable")
+            idx = idx[by_value[::-1] if order == "desc" else by_value]
+        if limit is not None:
+            idx = idx[:limit]
+        return [
+            {"location_id": loc, "sensor_id": sid, "value": v, "datetime_utc": dt, "latitude": la, "longitude": lo}
+            for loc, sid, v, dt, la, lo in zip(
+                self.location_id[idx].tolist(), self.sensor_id[idx].tolist(), self.value[idx].tolist(),
+                self.datetime_utc[idx].tolist(), self.lat[idx].tolist(), self.lon[idx].tolist(),
+            )
+        ]
@@ -0,0 +1,169 @@
+# lstm_dataset.py
+"""
+Datos de entrenamiento del LSTM (reemplaza SeaTempDataset + DataLoader del notebook).
+
+- El CSV combinado (aire_2000_2024_merged.csv) se lee una vez a un .npy float32 al lado del
+  CSV; después se abre con mmap, así varios procesos (p. ej. trials en paralelo) comparten las
+  mismas páginas en vez de tener cada uno su copia.
+- Las ventanas son una vista con strides sobre ese único array: no se copia nada por muestra.
+- Los lotes se arman con un solo indexado vectorizado (windows[idx]) en vez de una llamada
+  Python y un torch.tensor por muestra.
+"""
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from forecast import FEATURES, MinMaxScalers
+
+try:
+    import torch
+except ImportError:
+    torch = None
+
+
+def load_merged(csv_path, cache_path=None):
+    """
+    Devuelve (fechas, datos float32 (n, len(FEATURES))) del CSV combinado. Los datos salen de un
+    .npy con mmap (modo lectura) que se regenera si el CSV es más nuevo.
+    """
+    cache_path = cache_path or os.path.splitext(csv_path)[0] + ".float32.npy"
+    times_path = os.path.splitext(cache_path)[0] + ".time.npy"
+    fresh = (
+        os.path.exists(cache_path)
+        and os.path.exists(times_path)
+        and os.path.getmtime(cache_path) >= os.path.getmtime(csv_path)
+    )
+    if not fresh:
+        df = pd.read_csv(csv_path, usecols=["time", *FEATURES], dtype={c: np.float32 for c in FEATURES})
+        np.save(times_path, df["time"].to_numpy(dtype=str))
+        np.save(cache_path, np.ascontiguousarray(df[list(FEATURES)].to_numpy(dtype=np.float32)))
+        del df
+    return np.load(times_path), np.load(cache_path, mmap_mode="r")
+
+
+def epoch_seconds(times):
+    """Fechas (texto o datetime) -> array int64 de segundos epoch UTC, sea cual sea la resolución de pandas."""
+    delta = pd.to_datetime(pd.Series(times), utc=True) - pd.Timestamp(0, tz="UTC")
+    return (delta // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+
+
+class TrainingStore:
+    """
+    Filas de entrenamiento (ts epoch UTC + FEATURES) en SQLite, para ir agregando lo que llega
+    sin reescribir el dataset entero. Se siembra una vez desde el CSV combinado.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        cols = ", ".join(f"{c} REAL NOT NULL" for c in FEATURES)
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS rows (ts INTEGER PRIMARY KEY, {cols})")
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def import_csv(self, csv_path):
+        times, data = load_merged(csv_path)
+        self.append(epoch_seconds(times), data)
+
+    def last_ts(self):
+        return self.conn.execute("SELECT MAX(ts) FROM rows").fetchone()[0]
+
+    def append(self, ts, data):
+        """Inserta (o reemplaza, si ya existe el ts) filas nuevas. data: (n, len(FEATURES))."""
+        marks = ", ".join("?" * (len(FEATURES) + 1))
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO rows (ts, {', '.join(FEATURES)}) VALUES ({marks})",
+                ((int(t), *map(float, row)) for t, row in zip(ts, data)),
+            )
+
+    def tail(self, n):
+        """Las últimas n filas en orden: (ts int64, datos float32)."""
+        rows = self.conn.execute(
+            f"SELECT * FROM (SELECT ts, {', '.join(FEATURES)} FROM rows ORDER BY ts DESC LIMIT ?) ORDER BY ts", (n,)
+        ).fetchall()
+        arr = np.asarray(rows, dtype=np.float64).reshape(-1, len(FEATURES) + 1)
+        return arr[:, 0].astype(np.int64), arr[:, 1:].astype(np.float32)
+
+
+def fit_scalers(data):
+    """MinMax por columna (como los MinMaxScaler del notebook, ajustados sobre todo el dataset)."""
+    return MinMaxScalers(np.nanmin(data, axis=0), np.nanmax(data, axis=0))
+
+
+def scale(data, scalers):
+    """Una sola copia escalada en float32: es el array que comparten todas las vistas de ventanas."""
+    return np.ascontiguousarray(scalers.transform(data), dtype=np.float32)
+
+
+def split(data, train=0.7, val=0.2):
+    """Cortes train/val/test como en el notebook; son vistas, no copias."""
+    n = len(data)
+    n_train = int(n * train)
+    n_val = int(n * val)
+    return data[:n_train], data[n_train:n_train + n_val], data[n_train + n_val:]
+
+
+class WindowDataset:
+    """
+    Ventana i = data[i:i+seq_len], etiqueta i = data[i+seq_len] (igual que SeaTempDataset).
+    `windows` es una vista (len, seq_len, features) sobre `data`; cambiar seq_len no copia nada.
+    """
+
+    def __init__(self, data, seq_len):
+        self.data = data
+        self.seq_len = seq_len
+        n = max(len(data) - seq_len, 0)
+        if n == 0:
+            self.windows = np.empty((0, seq_len, data.shape[1]), dtype=data.dtype)
+        else:
+            # sliding_window_view deja la ventana en el último eje: (n+1, features, seq_len) -> (n, seq_len, features)
+            view = np.lib.stride_tricks.sliding_window_view(data, seq_len, axis=0)
+            self.windows = view[:n].transpose(0, 2, 1)
+        self.labels = data[seq_len:seq_len + n]
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, idx):
+        """idx entero o array de índices; con un array se arma el lote entero en una sola operación."""
+        return self.windows[idx], self.labels[idx]
+
+
+class WindowLoader:
+    """
+    Reemplazo de DataLoader(dataset, batch_size, shuffle) para WindowDataset: itera (seqs, labels)
+    contiguos (tensores si hay torch, arrays si no), un gather vectorizado por lote.
+    """
+
+    def __init__(self, dataset, batch_size=32, shuffle=False, seed=None):
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self):
+        return -(-len(self.dataset) // self.batch_size)
+
+    def __iter__(self):
+        n = len(self.dataset)
+        order = self.rng.permutation(n) if self.shuffle else None
+        as_batch = torch.from_numpy if torch is not None else np.asarray
+        for start in range(0, n, self.batch_size):
+            if order is None:
+                idx = slice(start, start + self.batch_size)
+            else:
+                # ordenado dentro del lote: el gather recorre la memoria hacia adelante
+                idx = np.sort(order[start:start + self.batch_size])
+            seqs, labels = self.dataset[idx]
+            yield as_batch(_contiguous(seqs)), as_batch(_contiguous(labels))
+
+
+def _contiguous(a):
+    # un lote por slice sobre un .npy con mmap de solo lectura puede no copiarse: torch lo quiere escribible
+    a = np.ascontiguousarray(a)
+    return a if a.flags.writeable else a.copy()
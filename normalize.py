@@ -0,0 +1,213 @@
+# normalize.py
+"""
+Normalización de filas de OpenAQ (mediciones y rollups) y del almacén local, por páginas.
+
+- La forma de la página se detecta una vez, con la primera fila: de dónde sale la fecha
+  (period.datetimeFrom, datetime o datetime_utc) y si `parameter` es un dict. El resto de la
+  página se lee con el extractor de esa forma; una fila que no calza pasa por el camino general
+  (prefer_datetime, format_measurement) y sale igual que antes.
+- Las fechas UTC de OpenAQ son ISO-8601 ('2024-01-01T00:00:00Z' o '+00:00'): se pasan a epoch en
+  bloque con datetime64 de NumPy, y de epoch a ISO también en bloque. Lo que no tiene esa forma
+  va por parse_datetime (fromisoformat y, si no es ISO, dateutil).
+"""
+from datetime import datetime
+
+import dateutil.parser as dparser
+import numpy as np
+
+from timeseries_store import to_epoch
+
+_UTC_SUFFIXES = ("Z", "+00:00", "")
+
+
+def prefer_datetime(it):
+    """
+    Extrae la mejor fecha UTC disponible en una medición/agg:
+    - period.datetimeFrom.utc
+    - period.datetimeTo.utc
+    - datetime.utc
+    - datetime_utc
+    - date
+    """
+    if not it:
+        return None
+    # period.datetimeFrom.utc
+    p = it.get("period") or {}
+    if isinstance(p, dict):
+        df = (p.get("datetimeFrom") or {}).get("utc")
+        if df:
+            return df
+        dt = (p.get("datetimeTo") or {}).get("utc")
+        if dt:
+            return dt
+    # datetime or date
+    d = it.get("datetime") or it.get("date") or {}
+    if isinstance(d, dict):
+        if d.get("utc"):
+            return d.get("utc")
+    # direct fields
+    return it.get("datetime_utc") or it.get("date") or None
+
+
+def parse_datetime(value):
+    """datetime de un ISO-8601 (también con 'Z' en Python 3.10); lo que no es ISO, con dateutil."""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value[:-1] + "+00:00" if value.endswith("Z") else value)
+        except ValueError:
+            pass
+    return dparser.parse(value)
+
+
+# -------------------
+# Fechas en bloque
+def epochs(values):
+    """ISO-8601 (str o datetime) -> array int64 de segundos epoch UTC, igual que to_epoch fila por fila."""
+    try:
+        heads = [v[:19] for v in values if v[19:] in _UTC_SUFFIXES]
+        if len(heads) == len(values):
+            return np.array(heads, dtype="datetime64[s]").astype(np.int64)
+    except (TypeError, ValueError):
+        pass
+    return np.fromiter((_epoch(v) for v in values), dtype=np.int64, count=len(values))
+
+
+def _epoch(value):
+    return to_epoch(parse_datetime(value) if isinstance(value, str) else value)
+
+
+def isos(ts):
+    """Segundos epoch UTC -> ['YYYY-MM-DDTHH:MM:SSZ', ...], igual que timeseries_store.to_iso."""
+    ts = np.asarray(ts, dtype=np.int64)
+    return [s + "Z" for s in np.datetime_as_string(ts.astype("datetime64[s]"), unit="s").tolist()]
+
+
+# -------------------
+# Forma de la página. Cada extractor devuelve None si la fila no es de su forma; en ese caso
+# (o si la fecha viene vacía) decide prefer_datetime, así el resultado es siempre el mismo.
+def _from_period(it):
+    p = it.get("period")
+    return p["datetimeFrom"]["utc"] if p.__class__ is dict else None
+
+
+def _from_datetime(it):
+    return None if "period" in it else it["datetime"]["utc"]
+
+
+def _from_flat(it):
+    return None if "period" in it or "datetime" in it or "date" in it else it["datetime_utc"]
+
+
+_SHAPES = (_from_period, _from_datetime, _from_flat)
+
+
+def _datetime_getter(sample):
+    for get in _SHAPES:
+        try:
+            if get(sample):
+                return get
+        except (KeyError, TypeError):
+            continue
+    return prefer_datetime
+
+
+def datetimes(rows):
+    """prefer_datetime de cada fila, con el extractor que corresponde a la primera."""
+    if not rows:
+        return []
+    get = _datetime_getter(rows[0])
+    if get is prefer_datetime:
+        return [prefer_datetime(it) for it in rows]
+    out = []
+    append = out.append
+    for it in rows:
+        try:
+            dt = get(it)
+        except (KeyError, TypeError):
+            dt = None
+        append(dt or prefer_datetime(it))
+    return out
+
+
+def _dict_parameters(rows):
+    """Los `parameter` de la página si todos son dicts no vacíos (la forma normal), si no None."""
+    params = [it.get("parameter") for it in rows]
+    return params if all(p.__class__ is dict and p for p in params) else None
+
+
+# -------------------
+# Salidas
+def format_measurement(it, sensor_units, dt=None):
+    """Fila de OpenAQ o del almacén -> {datetime_utc, value, unit, parameter} (camino general)."""
+    if dt is None:
+        dt = prefer_datetime(it)
+    # unit prefer parameter.units, luego it.unit, luego sensor_units
+    unit = None
+    if it.get("parameter") and isinstance(it.get("parameter"), dict):
+        unit = it.get("parameter", {}).get("units") or sensor_units
+    else:
+        unit = it.get("unit") or sensor_units
+    return {
+        "datetime_utc": dt,
+        "value": it.get("value"),
+        "unit": unit,
+        "parameter": (it.get("parameter") or {}).get("name")
+    }
+
+
+def format_measurements(rows, sensor_units):
+    """format_measurement de toda la página."""
+    dts = datetimes(rows)
+    params = _dict_parameters(rows)
+    if params is None:
+        return [format_measurement(it, sensor_units, dt) for it, dt in zip(rows, dts)]
+    return [
+        {"datetime_utc": dt, "value": it.get("value"), "unit": p.get("units") or sensor_units, "parameter": p.get("name")}
+        for it, dt, p in zip(rows, dts, params)
+    ]
+
+
+def format_rollups(rows):
+    """Filas de /api/aggregated: {datetime_utc, value, unit}."""
+    dts = datetimes(rows)
+    params = _dict_parameters(rows)
+    if params is None:
+        params = [it.get("parameter") or {} for it in rows]
+    return [
+        {"datetime_utc": dt, "value": it.get("value"), "unit": p.get("units") or None}
+        for it, dt, p in zip(rows, dts, params)
+    ]
+
+
+def store_rows(rows):
+    """Filas de OpenAQ -> [(ts_epoch, value, unit, parameter)] para el almacén; las que no tienen fecha se descartan."""
+    dts = datetimes(rows)
+    if not all(dts):
+        rows = [it for it, dt in zip(rows, dts) if dt]
+        dts = [dt for dt in dts if dt]
+    if not dts:
+        return []
+    ts = epochs(dts).tolist()
+    params = _dict_parameters(rows)
+    if params is not None:
+        return [(t, it.get("value"), p.get("units") or it.get("unit"), p.get("name"))
+                for t, it, p in zip(ts, rows, params)]
+    out = []
+    for t, it in zip(ts, rows):
+        param = it.get("parameter")
+        if isinstance(param, dict):
+            out.append((t, it.get("value"), param.get("units") or it.get("unit"), param.get("name")))
+        else:
+            out.append((t, it.get("value"), it.get("unit"), None))
+    return out
+
+
+def results_from_rows(rows):
+    """Filas del almacén (ts, value, unit, parameter) -> dicts con la forma de las filas de OpenAQ."""
+    if not rows:
+        return []
+    dts = isos([r[0] for r in rows])
+    return [
+        {"datetime_utc": dt, "value": value, "parameter": {"name": parameter, "units": unit}}
+        for dt, (_, value, unit, parameter) in zip(dts, rows)
+    ]
@@ -0,0 +1,108 @@
+# prefetch.py
+"""
+Precalentado de cachés para las estaciones más consultadas.
+
+- HotKeys cuenta las requests por clave (p. ej. ("sensor_latest", location, sensor)) con
+  decaimiento exponencial: la popularidad reciente pesa más que la de hace horas.
+- Prefetcher es un hilo que cada `interval` segundos toma las top_n claves y llama a
+  warm(clave), que vuelve a llenar las cachés antes de que venzan. Entre clave y clave espera
+  `pause` segundos y corta la vuelta si can_spend() dice que no queda margen en OpenAQ.
+"""
+import math
+import threading
+import time
+
+
+class HotKeys:
+    """Contadores con vida media half_life (segundos), seguros entre hilos y con tamaño acotado."""
+
+    def __init__(self, half_life=3600, maxsize=5000):
+        self.half_life = half_life
+        self.maxsize = maxsize
+        self._scores = {}    # key -> (score, t)
+        self._lock = threading.Lock()
+
+    def _decayed(self, score, t, now):
+        return score * math.pow(0.5, (now - t) / self.half_life)
+
+    def hit(self, key, weight=1.0):
+        now = time.monotonic()
+        with self._lock:
+            score, t = self._scores.get(key, (0.0, now))
+            self._scores[key] = (self._decayed(score, t, now) + weight, now)
+            if len(self._scores) > self.maxsize:
+                # se descarta el 10 % menos popular de una vez, no una clave por hit
+                ranked = sorted(self._scores, key=lambda k: self._decayed(*self._scores[k], now))
+                for k in ranked[:max(1, self.maxsize // 10)]:
+                    del self._scores[k]
+
+    def top(self, n, min_score=0.0):
+        """[(clave, puntaje actual)] de las n claves más populares con puntaje >= min_score."""
+        now = time.monotonic()
+        with self._lock:
+            scored = [(k, self._decayed(s, t, now)) for k, (s, t) in self._scores.items()]
+        scored = [x for x in scored if x[1] >= min_score]
+        scored.sort(key=lambda x: x[1], reverse=True)
+        return scored[:n]
+
+    def __len__(self):
+        return len(self._scores)
+
+
+class Prefetcher:
+    def __init__(self, hot, warm, interval=60, top_n=20, min_score=2.0, pause=0.2, can_spend=None):
+        self.hot = hot
+        self.warm = warm
+        self.interval = interval
+        self.top_n = top_n
+        self.min_score = min_score
+        self.pause = pause
+        self.can_spend = can_spend
+        self.runs = 0
+        self.warmed = 0
+        self.errors = 0
+        self.skipped = 0    # claves que quedaron afuera por falta de margen en el rate limit
+        self.last_run = None
+        self.last_duration = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="prefetch", daemon=True)
+            self._thread.start()
+
+    def run_once(self):
+        start = time.monotonic()
+        keys = [k for k, _ in self.hot.top(self.top_n, self.min_score)]
+        for i, key in enumerate(keys):
+            if self.can_spend is not None and not self.can_spend():
+                self.skipped += len(keys) - i
+                break
+            try:
+                self.warm(key)
+                self.warmed += 1
+            except Exception as e:
+                self.errors += 1
+                print(f"Error precalentando {key}:", e)
+            time.sleep(self.pause)
+        self.runs += 1
+        self.last_run = time.time()
+        self.last_duration = time.monotonic() - start
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self.run_once()
+
+    def stats(self):
+        return {
+            "interval": self.interval,
+            "top_n": self.top_n,
+            "tracked_keys": len(self.hot),
+            "runs": self.runs,
+            "warmed": self.warmed,
+            "errors": self.errors,
+            "skipped": self.skipped,
+            "last_duration_s": round(self.last_duration, 3) if self.last_duration is not None else None,
+            "top": [{"key": list(k), "score": round(s, 2)} for k, s in self.hot.top(self.top_n)],
+        }
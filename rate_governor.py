@@ -0,0 +1,240 @@
+# rate_governor.py
+"""
+Gobernador del rate limit hacia OpenAQ: un token bucket compartido por todos los hilos y,
+con `path`, por todos los workers de la máquina (dos floats en un archivo mapeado en memoria,
+protegidos con flock).
+
+Clases de prioridad, de mayor a menor: interactive (latest), metadata, bulk (paginación de
+históricos) y background (prefetch, snapshots). Cada clase solo toma un token si en el bucket
+quedan más que su reserva (una fracción del burst), así una ráfaga de históricos nunca se lleva
+lo que necesitan las llamadas baratas de latest, tampoco desde otro worker. Dentro del worker
+las requests (hilos y corutinas de asgi.py) esperan en una misma cola por (prioridad, orden de
+llegada) en vez de fallar.
+"""
+import asyncio
+import contextvars
+import fcntl
+import heapq
+import itertools
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+
+PRIORITIES = ("interactive", "metadata", "bulk", "background")
+DEFAULT_RESERVE = {"interactive": 0.0, "metadata": 0.1, "bulk": 0.3, "background": 0.5}
+_STATE = struct.Struct("dd")    # tokens, última recarga (epoch, compartida entre procesos)
+
+
+class _MemoryBucket:
+    def __init__(self):
+        self._state = (None, 0.0)
+        self._lock = threading.Lock()
+
+    def update(self, fn):
+        with self._lock:
+            self._state = fn(*self._state)
+            return self._state
+
+
+class _FileBucket:
+    """Estado en un archivo de 16 bytes con mmap; un archivo nuevo (ceros) arranca con el bucket lleno."""
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            if os.fstat(self._fd).st_size < _STATE.size:
+                os.ftruncate(self._fd, _STATE.size)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        self._mm = mmap.mmap(self._fd, _STATE.size)
+        # flock es por descripción de archivo: entre hilos del mismo worker hace falta además un lock
+        self._lock = threading.Lock()
+
+    def update(self, fn):
+        with self._lock:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                tokens, last = _STATE.unpack_from(self._mm)
+                state = fn(None if last == 0 else tokens, last)
+                _STATE.pack_into(self._mm, 0, *state)
+                return state
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class RateGovernor:
+    def __init__(self, rate, burst, path=None, reserve=None):
+        """rate: tokens por segundo (<= 0 desactiva el gobernador); burst: capacidad del bucket."""
+        self.rate = rate
+        self.burst = burst
+        self.path = path
+        reserve = dict(DEFAULT_RESERVE, **(reserve or {}))
+        self._reserve = [burst * reserve[p] for p in PRIORITIES]
+        self._bucket = _FileBucket(path) if path and rate > 0 else _MemoryBucket()
+        self._cond = threading.Condition()
+        self._waiters = []    # heap de (prioridad, turno), de hilos y de corutinas
+        self._async_waiters = {}    # turno -> (loop, asyncio.Event) de las corutinas en la cola
+        self._turns = itertools.count()
+        # contextvar y no threading.local: instrumentation.submit copia el contexto a los pools
+        self._priority = contextvars.ContextVar("governor_priority", default=None)
+        self._stats = {p: {"granted": 0, "queued": 0, "max_queued": 0, "timeouts": 0, "wait_total_s": 0.0,
+                           "wait_max_s": 0.0} for p in PRIORITIES}
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    @contextmanager
+    def priority(self, name):
+        """
+        Las requests dentro del bloque usan la prioridad `name` (p. ej. background), también las
+        que se mandan a un pool con instrumentation.submit (p. ej. las páginas de PAGE_POOL).
+        """
+        token = self._priority.set(name)
+        try:
+            yield
+        finally:
+            self._priority.reset(token)
+
+    def current_priority(self, default):
+        return self._priority.get() or default
+
+    def _take(self, level):
+        """Intenta tomar un token para la clase; devuelve 0 si lo tomó o los segundos hasta que alcance."""
+        wait = []
+
+        def refill(tokens, last):
+            now = time.time()
+            tokens = self.burst if tokens is None else min(self.burst, tokens + (now - last) * self.rate)
+            if tokens - 1 >= self._reserve[level]:
+                wait.append(0.0)
+                return tokens - 1, now
+            wait.append((self._reserve[level] + 1 - tokens) / self.rate)
+            return tokens, now
+
+        self._bucket.update(refill)
+        return wait[0]
+
+    def tokens(self):
+        if not self.enabled:
+            return None
+        tokens, _ = self._bucket.update(
+            lambda tokens, last: (self.burst if tokens is None else min(self.burst, tokens + (time.time() - last) * self.rate), time.time())
+        )
+        return tokens
+
+    def _record(self, level, waited, granted):
+        st = self._stats[PRIORITIES[level]]
+        if granted:
+            st["granted"] += 1
+            st["wait_total_s"] += waited
+            st["wait_max_s"] = max(st["wait_max_s"], waited)
+        else:
+            st["timeouts"] += 1
+
+    def acquire(self, priority="bulk", timeout=None):
+        """Bloquea en la cola hasta tener un token. False si se venció timeout (segundos) antes."""
+        if not self.enabled:
+            return True
+        level = PRIORITIES.index(priority)
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        ticket = (level, next(self._turns))
+        st = self._stats[priority]
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            st["queued"] += 1
+            st["max_queued"] = max(st["max_queued"], st["queued"])
+            try:
+                while True:
+                    # solo el primero de la cola intenta: los demás esperan su turno
+                    wait = self._take(level) if self._waiters[0] == ticket else None
+                    if wait == 0:
+                        heapq.heappop(self._waiters)
+                        self._record(level, time.monotonic() - start, True)
+                        return True
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._waiters.remove(ticket)
+                        heapq.heapify(self._waiters)
+                        self._record(level, time.monotonic() - start, False)
+                        return False
+                    # otros workers también consumen: se vuelve a mirar como mucho cada 0.5 s
+                    self._cond.wait(min(x for x in (wait, remaining, 0.5) if x is not None))
+            finally:
+                st["queued"] -= 1
+                self._notify()
+
+    def _notify(self):
+        """Despierta a toda la cola (con self._cond tomado): hilos y corutinas miran si son el primero."""
+        self._cond.notify_all()
+        for loop, event in self._async_waiters.values():
+            loop.call_soon_threadsafe(event.set)
+
+    async def acquire_async(self, priority="bulk", timeout=None):
+        """
+        Igual que acquire para el event loop de asgi.py: la corutina toma turno en la misma cola
+        que los hilos, pero espera en un asyncio.Event (que _notify activa) sin bloquear el loop.
+        """
+        if not self.enabled:
+            return True
+        level = PRIORITIES.index(priority)
+        start = time.monotonic()
+        deadline = None if timeout is None else start + timeout
+        ticket = (level, next(self._turns))
+        event = asyncio.Event()
+        st = self._stats[priority]
+        with self._cond:
+            heapq.heappush(self._waiters, ticket)
+            self._async_waiters[ticket] = (asyncio.get_running_loop(), event)
+            st["queued"] += 1
+            st["max_queued"] = max(st["max_queued"], st["queued"])
+        try:
+            while True:
+                with self._cond:
+                    wait = self._take(level) if self._waiters[0] == ticket else None
+                    if wait == 0:
+                        heapq.heappop(self._waiters)
+                        self._record(level, time.monotonic() - start, True)
+                        return True
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        self._record(level, time.monotonic() - start, False)
+                        return False
+                    event.clear()
+                try:
+                    await asyncio.wait_for(event.wait(), min(x for x in (wait, remaining, 0.5) if x is not None))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                del self._async_waiters[ticket]
+                # vencida o cancelada: deja la cola
+                if ticket in self._waiters:
+                    self._waiters.remove(ticket)
+                    heapq.heapify(self._waiters)
+                st["queued"] -= 1
+                self._notify()
+
+    def stats(self):
+        with self._cond:
+            classes = {
+                p: dict(st, wait_total_s=round(st["wait_total_s"], 3), wait_max_s=round(st["wait_max_s"], 3),
+                        wait_avg_s=round(st["wait_total_s"] / st["granted"], 4) if st["granted"] else None)
+                for p, st in self._stats.items()
+            }
+        tokens = self.tokens()
+        return {
+            "enabled": self.enabled,
+            "rate_per_min": round(self.rate * 60, 2),
+            "burst": self.burst,
+            "shared_file": self.path if self.enabled else None,
+            "tokens": round(tokens, 2) if tokens is not None else None,
+            "classes": classes,
+        }
@@ -0,0 +1,580 @@
+# satellite.py
+"""
+Productos satelitales en grilla (TEMPO, MODIS, ... ya descargados) muestreados en puntos lat/lon.
+
+Estructura en disco (SATELLITE_DIR):
+    <producto>/<YYYY-MM-DD>.tif | .tiff | .nc | .nc4     (también YYYYMMDD)
+    <producto>/product.json    opcional: {"variable", "band", "units", "scale", "offset", "nodata", "description"}
+
+- GeoTIFF little-endian sin compresión (TIFF o BigTIFF, strips o tiles, grilla lat/lon
+  norte-arriba) y NetCDF clásico CDF-1 (coordenadas 1-D) se leen con np.memmap: abrir un archivo
+  solo parsea el encabezado y muestrear N puntos toca N celdas, nunca el raster entero.
+- NetCDF4/HDF5 y las variantes de 64 bits (CDF-2/CDF-5) se leen con netCDF4 si está instalado,
+  solo la ventana que cubre los puntos; si no, convertir con `nccopy -k classic` (o `ncks -G :`
+  si tiene grupos). Un GeoTIFF comprimido o big-endian se convierte con
+  `gdal_translate -co COMPRESS=NONE` (GDAL escribe little-endian).
+- El muestreo es por vecino más cercano y vectorizado (arrays de lat/lon); fuera de la grilla,
+  _FillValue/nodata o NaN dan NaN.
+- SatelliteArchive mantiene un LRU de archivos abiertos y guarda en la caché que se pase (p. ej.
+  TTLCache de app.py) los valores de todas las estaciones del catálogo por (producto, fecha), para
+  los mapas; la serie de una sola estación lee solo su celda.
+
+netCDF4 es opcional, igual que torch en forecast.py.
+"""
+import json
+import mmap
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    import netCDF4
+except ImportError:
+    netCDF4 = None
+
+
+EXTENSIONS = {".tif": "geotiff", ".tiff": "geotiff", ".nc": "netcdf", ".nc4": "netcdf"}
+_DATE_STEM = re.compile(r"^(\d{4})-?(\d{2})-?(\d{2})$")
+
+
+# -------------------
+# Ejes de la grilla: coordenada -> índice de celda (vecino más cercano)
+class Axis:
+    """Centros de celda de un eje (lat o lon). Regular: aritmética; irregular: searchsorted."""
+
+    def __init__(self, centers):
+        centers = np.asarray(centers, dtype=np.float64)
+        if centers.ndim != 1 or len(centers) == 0:
+            raise ValueError("coordenadas de la grilla inválidas")
+        self.centers = centers
+        self.size = len(centers)
+        self.start = float(centers[0])
+        self.step = float(centers[1] - centers[0]) if self.size > 1 else 1.0
+        steps = np.diff(centers)
+        self.regular = self.size < 3 or bool(np.allclose(steps, self.step, rtol=1e-6, atol=1e-9))
+        if not self.regular:
+            if not (np.all(steps > 0) or np.all(steps < 0)):
+                raise ValueError("coordenadas de la grilla no monótonas")
+            self._order = np.argsort(centers)
+            ascending = centers[self._order]
+            self._edges = (ascending[1:] + ascending[:-1]) / 2
+            self._half = (abs(steps[0]) / 2, abs(steps[-1]) / 2)
+        # 0..360 en vez de -180..180 (longitudes)
+        self.wraps = float(centers.max()) > 180
+
+    @classmethod
+    def regular_from(cls, start, step, size):
+        return cls(start + step * np.arange(size))
+
+    def index(self, values):
+        """(índices int64, válidos bool) de las celdas que contienen cada valor."""
+        values = np.asarray(values, dtype=np.float64)
+        if self.regular:
+            idx = np.floor((values - self.start) / self.step + 0.5)
+            valid = (idx >= 0) & (idx < self.size)
+            return np.where(valid, idx, 0).astype(np.int64), valid
+        pos = np.searchsorted(self._edges, values)
+        first, last = self.start, self.start + self.step * (self.size - 1)
+        lo, hi = min(first, last) - self._half[0], max(first, last) + self._half[1]
+        valid = (values >= lo) & (values <= hi)
+        return self._order[pos], valid
+
+
+class Grid:
+    """Un raster 2-D (filas = lat, columnas = lon) de un producto en una fecha."""
+
+    def __init__(self, reader, lat_axis, lon_axis, nodata=None, scale=None, offset=None, units=None, path=None):
+        self.reader = reader
+        self.lat = lat_axis
+        self.lon = lon_axis
+        self.nodata = nodata
+        self.scale = scale
+        self.offset = offset
+        self.units = units
+        self.path = path
+
+    @property
+    def shape(self):
+        return self.lat.size, self.lon.size
+
+    def _cells(self, lats, lons):
+        lons = np.asarray(lons, dtype=np.float64)
+        if self.lon.wraps:
+            lons = np.where(lons < 0, lons + 360, lons)
+        rows, rv = self.lat.index(lats)
+        cols, cv = self.lon.index(lons)
+        return rows, cols, rv & cv
+
+    def _values(self, rows, cols):
+        raw = self.reader.read(rows, cols)
+        out = raw.astype(np.float64)
+        if self.nodata is not None:
+            out[raw == self.nodata] = np.nan
+        if self.scale is not None:
+            out *= self.scale
+        if self.offset is not None:
+            out += self.offset
+        return out
+
+    def sample(self, lats, lons):
+        """Valor de la celda de cada punto (float64; NaN fuera de la grilla o sin dato)."""
+        rows, cols, valid = self._cells(lats, lons)
+        out = np.full(len(rows), np.nan)
+        if valid.any():
+            out[valid] = self._values(rows[valid], cols[valid])
+        return out
+
+    def window(self, west, south, east, north, max_cells=1_000_000):
+        """Estadísticas de las celdas con centro dentro del bbox, submuestreando si son más de max_cells."""
+        lat = self.lat.centers
+        lon = np.where(self.lon.centers > 180, self.lon.centers - 360, self.lon.centers)
+        rows = np.nonzero((lat >= south) & (lat <= north))[0]
+        cols = np.nonzero(((lon >= west) | (lon <= east)) if west > east else ((lon >= west) & (lon <= east)))[0]
+        cells = len(rows) * len(cols)
+        stride = int(np.ceil(np.sqrt(cells / max_cells))) if cells > max_cells else 1
+        rr, cc = np.meshgrid(rows[::stride], cols[::stride], indexing="ij")
+        values = self._values(rr.ravel(), cc.ravel()) if rr.size else np.empty(0)
+        values = values[np.isfinite(values)]
+        return {
+            "cells": int(rr.size),
+            "stride": stride,
+            "count": int(len(values)),
+            "mean": float(values.mean()) if len(values) else None,
+            "min": float(values.min()) if len(values) else None,
+            "max": float(values.max()) if len(values) else None,
+        }
+
+
+# -------------------
+# GeoTIFF sin compresión por memmap
+_TIFF_TYPES = {1: "B", 2: "s", 3: "H", 4: "I", 5: "II", 6: "b", 8: "h", 9: "i", 10: "ii", 11: "f", 12: "d",
+               16: "Q", 17: "q"}
+_TIFF_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 16: 8, 17: 8}
+_SAMPLE_KIND = {1: "u", 2: "i", 3: "f"}
+
+
+def _tiff_tags(mm):
+    order = {b"II": "<", b"MM": ">"}.get(bytes(mm[:2]))
+    if order is None:
+        raise ValueError("no es un TIFF")
+    if order == ">":
+        raise ValueError("GeoTIFF big-endian; convertir con gdal_translate -co COMPRESS=NONE")
+    version = struct.unpack_from(order + "H", mm, 2)[0]
+    if version == 42:
+        ifd = struct.unpack_from(order + "I", mm, 4)[0]
+        count_fmt, entry_fmt, inline = "H", "HHI", 4
+    elif version == 43:
+        ifd = struct.unpack_from(order + "Q", mm, 8)[0]
+        count_fmt, entry_fmt, inline = "Q", "HHQ", 8
+    else:
+        raise ValueError("versión de TIFF desconocida")
+    count = struct.unpack_from(order + count_fmt, mm, ifd)[0]
+    pos = ifd + struct.calcsize(order + count_fmt)
+    entry = struct.calcsize(order + entry_fmt) + inline
+    tags = {}
+    for _ in range(count):
+        tag, typ, n = struct.unpack_from(order + entry_fmt, mm, pos)
+        value_pos = pos + struct.calcsize(order + entry_fmt)
+        pos += entry
+        if typ not in _TIFF_TYPES:
+            continue
+        size = _TIFF_SIZES[typ] * n
+        if size > inline:
+            value_pos = struct.unpack_from(order + ("I" if inline == 4 else "Q"), mm, value_pos)[0]
+        if typ == 2:
+            tags[tag] = bytes(mm[value_pos:value_pos + n]).rstrip(b"\0").decode("ascii", "replace")
+        else:
+            tags[tag] = struct.unpack_from(order + _TIFF_TYPES[typ] * n, mm, value_pos)
+    return order, tags
+
+
+class _TiffReader:
+    """Lee celdas sueltas: offset en bytes de cada (fila, col) según strips o tiles, y un gather."""
+
+    def __init__(self, mm, order, tags, band=1):
+        self._bytes = np.frombuffer(mm, dtype=np.uint8)
+        self.width, self.height = tags[256][0], tags[257][0]
+        bits = tags.get(258, (1,))
+        spp = tags.get(277, (1,))[0]
+        if not 1 <= band <= spp:
+            raise ValueError(f"el GeoTIFF tiene {spp} banda(s)")
+        if len(set(bits)) != 1 or bits[0] % 8:
+            raise ValueError("bits por muestra no soportados")
+        kind = _SAMPLE_KIND.get(tags.get(339, (1,))[0])
+        if kind is None:
+            raise ValueError("SampleFormat no soportado")
+        self.dtype = np.dtype(f"{order}{kind}{bits[0] // 8}")
+        planar = tags.get(284, (1,))[0]
+        item = self.dtype.itemsize
+        # chunky: las bandas van intercaladas por píxel; planar: un bloque de strips/tiles por banda
+        self._pixel = item * (spp if planar == 1 else 1)
+        self._band_offset = item * (band - 1) if planar == 1 else 0
+        self.tiled = 322 in tags
+        if self.tiled:
+            self._tw, self._th = tags[322][0], tags[323][0]
+            self._across = -(-self.width // self._tw)
+            offsets = tags[324]
+            per_band = self._across * -(-self.height // self._th)
+        else:
+            self._rps = min(tags.get(278, (self.height,))[0], self.height)
+            offsets = tags[273]
+            per_band = -(-self.height // self._rps)
+        first = per_band * (band - 1) if planar == 2 else 0
+        self._offsets = np.asarray(offsets[first:first + per_band], dtype=np.int64)
+
+    def read(self, rows, cols):
+        rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+        if self.tiled:
+            block = (rows // self._th) * self._across + cols // self._tw
+            inner = (rows % self._th) * self._tw + cols % self._tw
+        else:
+            block = rows // self._rps
+            inner = (rows % self._rps) * self.width + cols
+        start = self._offsets[block] + inner * self._pixel + self._band_offset
+        raw = self._bytes[start[:, None] + np.arange(self.dtype.itemsize)]
+        return raw.view(self.dtype).ravel()
+
+
+def _geotiff_axes(tags, width, height):
+    geokeys = tags.get(34735, ())
+    keys = {geokeys[i]: geokeys[i + 3] for i in range(4, len(geokeys) - 3, 4)}
+    if keys.get(1024, 2) != 2:    # GTModelTypeGeoKey: 2 = geográfico (grados)
+        raise ValueError("solo GeoTIFF en lat/lon (EPSG:4326); reproyectar con gdalwarp -t_srs EPSG:4326")
+    pixel_is_point = keys.get(1025) == 2    # GTRasterTypeGeoKey
+    if 33550 in tags and 33922 in tags:
+        sx, sy = tags[33550][:2]
+        i, j, _, x, y, _ = tags[33922][:6]
+        x0, y0, dx, dy = x - i * sx, y + j * sy, sx, -sy
+    elif 34264 in tags:
+        m = tags[34264]
+        if m[1] or m[4]:
+            raise ValueError("GeoTIFF rotado no soportado")
+        x0, dx, y0, dy = m[3], m[0], m[7], m[5]
+    else:
+        raise ValueError("GeoTIFF sin georreferencia")
+    half = 0.0 if pixel_is_point else 0.5
+    return Axis.regular_from(y0 + half * dy, dy, height), Axis.regular_from(x0 + half * dx, dx, width)
+
+
+def open_geotiff(path, band=1):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    order, tags = _tiff_tags(mm)
+    if tags.get(259, (1,))[0] != 1:
+        raise ValueError(f"{os.path.basename(path)}: GeoTIFF comprimido; convertir con gdal_translate -co COMPRESS=NONE")
+    reader = _TiffReader(mm, order, tags, band=band)
+    lat, lon = _geotiff_axes(tags, reader.width, reader.height)
+    nodata = tags.get(42113)
+    nodata = float(nodata) if nodata not in (None, "", "nan") else None
+    return Grid(reader, lat, lon, nodata=nodata, path=path)
+
+
+# -------------------
+# NetCDF clásico (CDF-1) por memmap
+_NC_TYPES = {1: "i1", 2: "S1", 3: ">i2", 4: ">i4", 5: ">f4", 6: ">f8"}
+
+
+class _NcHeader:
+    def __init__(self, mm):
+        if bytes(mm[:4]) != b"CDF\x01":
+            raise ValueError("no es un NetCDF clásico (CDF-1)")
+        self.mm = mm
+        self.pos = 4
+        self.numrecs = self._read(">I")
+        self.dims = [(name, size) for name, size in self._list(0x0A, lambda: (self._name(), self._read(">I")))]
+        self.attrs = dict(self._list(0x0C, self._attr))
+        self.vars = dict(self._list(0x0B, self._var))
+
+    def _read(self, fmt):
+        value = struct.unpack_from(fmt, self.mm, self.pos)[0]
+        self.pos += struct.calcsize(fmt)
+        return value
+
+    def _list(self, tag, item):
+        kind, n = self._read(">I"), self._read(">I")
+        if kind == 0:
+            return []
+        if kind != tag:
+            raise ValueError("encabezado NetCDF inválido")
+        return [item() for _ in range(n)]
+
+    def _name(self):
+        n = self._read(">I")
+        name = bytes(self.mm[self.pos:self.pos + n]).decode("utf-8")
+        self.pos += n + (-n % 4)
+        return name
+
+    def _attr(self):
+        name, typ, n = self._name(), self._read(">I"), self._read(">I")
+        dtype = np.dtype(_NC_TYPES[typ])
+        raw = bytes(self.mm[self.pos:self.pos + n * dtype.itemsize])
+        self.pos += n * dtype.itemsize + (-(n * dtype.itemsize) % 4)
+        if typ == 2:
+            return name, raw.decode("utf-8", "replace")
+        values = np.frombuffer(raw, dtype=dtype)
+        return name, values[0].item() if n == 1 else values.tolist()
+
+    def _var(self):
+        name = self._name()
+        dimids = [self._read(">I") for _ in range(self._read(">I"))]
+        attrs = dict(self._list(0x0C, self._attr))
+        typ, vsize, begin = self._read(">I"), self._read(">I"), self._read(">I")
+        return name, {"dims": dimids, "attrs": attrs, "dtype": np.dtype(_NC_TYPES[typ]), "vsize": vsize, "begin": begin}
+
+    def array(self, name):
+        """La variable como ndarray sobre el memmap (sin copiar). Las variables de registro con stride."""
+        var = self.vars[name]
+        shape = [self.dims[d][1] for d in var["dims"]]
+        record = bool(var["dims"]) and self.dims[var["dims"][0]][1] == 0
+        dtype = var["dtype"]
+        strides = list(np.cumprod([dtype.itemsize] + shape[:0:-1])[::-1]) if shape else []
+        if record:
+            shape[0] = self.numrecs
+            rec_vars = [v for v in self.vars.values() if v["dims"] and self.dims[v["dims"][0]][1] == 0]
+            # con una sola variable de registro no hay relleno entre registros
+            strides[0] = int(np.prod(shape[1:], dtype=np.int64)) * dtype.itemsize if len(rec_vars) == 1 else sum(v["vsize"] for v in rec_vars)
+        return np.ndarray(tuple(shape), dtype=dtype, buffer=self.mm, offset=var["begin"], strides=tuple(int(s) for s in strides))
+
+
+class _ArrayReader:
+    """Variable 2-D (o N-D tomando el índice 0 de las dimensiones de adelante) ya mapeada."""
+
+    def __init__(self, array):
+        self.array = array[(0,) * (array.ndim - 2)] if array.ndim > 2 else array
+
+    def read(self, rows, cols):
+        return self.array[rows, cols]
+
+
+class _NetCDF4Reader:
+    """Variable de un NetCDF4/HDF5 (netCDF4): lee solo la ventana que cubre los puntos pedidos."""
+
+    def __init__(self, dataset, var):
+        self._dataset = dataset
+        self._var = var
+        self._lead = (0,) * (len(var.dimensions) - 2)
+        self._lock = threading.Lock()    # la librería HDF5 no es segura entre hilos
+
+    def read(self, rows, cols):
+        if len(rows) == 0:
+            return np.empty(0, dtype=self._var.dtype)
+        r0, r1, c0, c1 = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+        with self._lock:
+            block = np.asarray(self._var[self._lead + (slice(r0, r1), slice(c0, c1))])
+        return block[rows - r0, cols - c0]
+
+
+def _grid_variable(names, dims_of, has_coord, variable):
+    """La variable pedida, o la primera con >= 2 dimensiones cuyas 2 últimas tienen coordenadas."""
+    if variable:
+        if variable not in names:
+            raise ValueError(f"variable {variable} no encontrada")
+        return variable
+    for name in names:
+        dims = dims_of(name)
+        if len(dims) >= 2 and not has_coord(name) and all(has_coord(d) for d in dims[-2:]):
+            return name
+    raise ValueError("no hay variables en grilla lat/lon")
+
+
+def _nc_grid(reader, lat, lon, attrs, nodata, path):
+    fill = attrs.get("_FillValue", attrs.get("missing_value"))
+    return Grid(
+        reader, Axis(lat), Axis(lon),
+        nodata=nodata if nodata is not None else fill,
+        scale=attrs.get("scale_factor"), offset=attrs.get("add_offset"),
+        units=attrs.get("units"), path=path,
+    )
+
+
+def open_netcdf(path, variable=None, nodata=None):
+    with open(path, "rb") as f:
+        magic = f.read(4)
+    # HDF5 y CDF-2/CDF-5 (offsets de 64 bits): con netCDF4
+    if magic.startswith(b"\x89HDF") or magic in (b"CDF\x02", b"CDF\x05"):
+        return _open_netcdf4(path, variable, nodata)
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    header = _NcHeader(mm)
+    dim_names = [name for name, _ in header.dims]
+
+    def dims_of(name):
+        return [dim_names[d] for d in header.vars[name]["dims"]]
+
+    name = _grid_variable(list(header.vars), dims_of, lambda d: d in header.vars and dims_of(d) == [d], variable)
+    lat_name, lon_name = dims_of(name)[-2:]
+    var = header.vars[name]
+    return _nc_grid(_ArrayReader(header.array(name)), header.array(lat_name), header.array(lon_name),
+                    var["attrs"], nodata, path)
+
+
+def _open_netcdf4(path, variable, nodata):
+    if netCDF4 is None:
+        raise ValueError(f"{os.path.basename(path)}: NetCDF4/HDF5 o de 64 bits requiere netCDF4 (o convertir con nccopy -k classic)")
+    ds = netCDF4.Dataset(path, "r")
+    # variable puede venir con ruta de grupo: "product/vertical_column_troposphere"
+    var = ds[variable] if variable else ds.variables[_grid_variable(
+        list(ds.variables), lambda n: list(ds.variables[n].dimensions),
+        lambda d: d in ds.variables and list(ds.variables[d].dimensions) == [d], None,
+    )]
+    var.set_auto_maskandscale(False)
+    coords = {**ds.variables, **var.group().variables}
+    lat_name, lon_name = var.dimensions[-2:]
+    lat, lon = np.asarray(coords[lat_name][:]), np.asarray(coords[lon_name][:])
+    attrs = {k: var.getncattr(k) for k in var.ncattrs()}
+    attrs = {k: (v.item() if isinstance(v, np.ndarray) and v.size == 1 else v) for k, v in attrs.items()}
+    return _nc_grid(_NetCDF4Reader(ds, var), lat, lon, attrs, nodata, path)
+
+
+def open_grid(path, config=None):
+    """Abre un archivo de producto según su extensión; config es el product.json del producto."""
+    config = config or {}
+    kind = EXTENSIONS.get(os.path.splitext(path)[1].lower())
+    if kind == "geotiff":
+        grid = open_geotiff(path, band=int(config.get("band", 1)))
+        if config.get("nodata") is not None:
+            grid.nodata = config["nodata"]
+    elif kind == "netcdf":
+        grid = open_netcdf(path, variable=config.get("variable"), nodata=config.get("nodata"))
+    else:
+        raise ValueError(f"formato no soportado: {path}")
+    # product.json manda sobre los atributos del archivo
+    for key in ("scale", "offset", "units"):
+        if config.get(key) is not None:
+            setattr(grid, key, config[key])
+    return grid
+
+
+# -------------------
+# Archivo de productos
+class SatelliteArchive:
+    def __init__(self, root, cache=None, max_open=32):
+        self.root = root
+        self.cache = cache
+        self.max_open = max_open
+        self._open = OrderedDict()    # (path, mtime) -> Grid
+        self._products = {}           # nombre -> (mtime del directorio, {fecha: ruta}, config)
+        self._lock = threading.Lock()
+        self.opened = 0
+
+    def _scan(self, name):
+        """{fecha: ruta} y config de un producto; se vuelve a listar solo si cambió el directorio."""
+        directory = os.path.join(self.root, name)
+        mtime = os.path.getmtime(directory)
+        cached = self._products.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1], cached[2]
+        files = {}
+        for entry in sorted(os.listdir(directory)):
+            stem, ext = os.path.splitext(entry)
+            m = _DATE_STEM.match(stem)
+            if m and ext.lower() in EXTENSIONS:
+                files.setdefault("-".join(m.groups()), os.path.join(directory, entry))
+        config = {}
+        config_path = os.path.join(directory, "product.json")
+        if os.path.exists(config_path):
+            with open(config_path) as f:
+                config = json.load(f)
+        self._products[name] = (mtime, files, config)
+        return files, config
+
+    def products(self):
+        """{producto: {"dates": [...], "units", "description"}} de los directorios de root."""
+        if not os.path.isdir(self.root):
+            return {}
+        out = {}
+        for name in sorted(os.listdir(self.root)):
+            if not name.startswith(".") and os.path.isdir(os.path.join(self.root, name)):
+                files, config = self._scan(name)
+                if files:
+                    out[name] = {"dates": sorted(files), "units": config.get("units"),
+                                 "description": config.get("description")}
+        return out
+
+    def dates(self, product, date_from=None, date_to=None):
+        """Fechas (YYYY-MM-DD) con archivo del producto, opcionalmente dentro de [date_from, date_to]."""
+        files, _ = self._product(product)
+        return [d for d in sorted(files) if (not date_from or d >= date_from) and (not date_to or d <= date_to)]
+
+    def _product(self, product):
+        # sin "." ni ".." ni rutas: el producto es siempre un directorio directo de root
+        directory = os.path.realpath(os.path.join(self.root, product or ""))
+        if (not re.fullmatch(r"\w[\w.-]*", product or "") or os.path.dirname(directory) != os.path.realpath(self.root)
+                or not os.path.isdir(directory)):
+            raise KeyError(f"producto {product} no encontrado")
+        return self._scan(product)
+
+    def units(self, product):
+        """Unidades del producto: las de product.json o, si no, las del archivo más reciente."""
+        files, config = self._product(product)
+        if config.get("units") or not files:
+            return config.get("units")
+        return self.grid(product, max(files)).units
+
+    def _file(self, product, date):
+        """(ruta, mtime) del archivo del producto en la fecha: un archivo reemplazado es otra clave."""
+        files, _ = self._product(product)
+        path = files.get(date)
+        if path is None:
+            raise KeyError(f"{product} no tiene datos del {date}")
+        return path, os.path.getmtime(path)
+
+    def grid(self, product, date):
+        """Grid del producto en la fecha (LRU de archivos abiertos). KeyError si no hay archivo."""
+        key = self._file(product, date)
+        path = key[0]
+        with self._lock:
+            grid = self._open.get(key)
+            if grid is not None:
+                self._open.move_to_end(key)
+                return grid
+        grid = open_grid(path, self._product(product)[1])
+        with self._lock:
+            self._open[key] = grid
+            self.opened += 1
+            while len(self._open) > self.max_open:
+                self._open.popitem(last=False)
+        return grid
+
+    def sample(self, product, date, lats, lons):
+        return self.grid(product, date).sample(lats, lons)
+
+    def sample_catalog(self, product, date, catalog):
+        """Valores (alineados con el catálogo) de todas las estaciones; cacheado por producto/fecha."""
+        key = ("satellite",) + self._file(product, date) + (catalog.refreshed_at, len(catalog))
+        if self.cache is not None:
+            found, values = self.cache.get(key)
+            if found:
+                return values
+        values = self.grid(product, date).sample(catalog.lat, catalog.lon)
+        if self.cache is not None:
+            self.cache.set(key, values)
+        return values
+
+    def series(self, product, lat, lon, dates):
+        """[(fecha, valor | None)] de un punto: solo la celda del punto en el archivo de cada fecha."""
+        out = []
+        for date in dates:
+            value = float(self.sample(product, date, [lat], [lon])[0])
+            out.append((date, None if np.isnan(value) else value))
+        return out
+
+    def window(self, product, date, bbox, max_cells=1_000_000):
+        key = ("satellite_window",) + self._file(product, date) + (tuple(round(x, 4) for x in bbox), max_cells)
+        if self.cache is not None:
+            found, stats = self.cache.get(key)
+            if found:
+                return stats
+        stats = self.grid(product, date).window(*bbox, max_cells=max_cells)
+        if self.cache is not None:
+            self.cache.set(key, stats)
+        return stats
+
+    def stats(self):
+        with self._lock:
+            return {"root": self.root, "open_files": len(self._open), "max_open": self.max_open,
+                    "opened_total": self.opened, "netcdf4": netCDF4 is not None}
@@ -0,0 +1,63 @@
+# spatial.py
+"""
+Índice espacial en grilla (NumPy) para puntos lat/lon: estaciones, últimas lecturas, etc.
+
+Cada punto cae en una celda de `cell` grados; los puntos se guardan ordenados por celda
+(fila de latitud * columnas + columna de longitud), así las celdas de una fila que toca un
+bbox son un tramo contiguo. Una consulta hace un searchsorted por fila (vectorizado) y un
+filtro exacto solo sobre los candidatos, sin recorrer todos los puntos.
+"""
+import numpy as np
+
+
+def parse_bbox(raw):
+    """'oeste,sur,este,norte' (grados) -> tupla de floats. ValueError si no es válido."""
+    try:
+        west, south, east, north = (float(x) for x in raw.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("bbox debe ser 'oeste,sur,este,norte'")
+    if not (-90 <= south <= north <= 90 and -180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError("bbox fuera de rango")
+    return west, south, east, north
+
+
+class GridIndex:
+    """Índice inmutable sobre arrays lat/lon; query devuelve índices de los puntos originales."""
+
+    def __init__(self, lats, lons, cell=1.0):
+        self.cell = float(cell)
+        self.cols = int(np.ceil(360 / self.cell))
+        self.rows = int(np.ceil(180 / self.cell))
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        keys = self._row(self.lats) * self.cols + self._col(self.lons)
+        self.order = np.argsort(keys, kind="stable")
+        self.keys = keys[self.order]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _row(self, lat):
+        return np.clip(((np.asarray(lat) + 90) // self.cell).astype(np.int64), 0, self.rows - 1)
+
+    def _col(self, lon):
+        return np.clip(((np.asarray(lon) + 180) // self.cell).astype(np.int64), 0, self.cols - 1)
+
+    def _candidates(self, west, south, east, north):
+        rows = np.arange(self._row(south), self._row(north) + 1)
+        lo = np.searchsorted(self.keys, rows * self.cols + self._col(west), side="left")
+        hi = np.searchsorted(self.keys, rows * self.cols + self._col(east), side="right")
+        spans = [self.order[a:b] for a, b in zip(lo, hi) if b > a]
+        return np.concatenate(spans) if spans else np.empty(0, dtype=np.int64)
+
+    def query(self, west, south, east, north):
+        """Índices (ordenados) de los puntos dentro del bbox. west > east cruza el antimeridiano."""
+        if west > east:
+            parts = [self._candidates(west, south, 180.0, north), self._candidates(-180.0, south, east, north)]
+            idx = np.concatenate(parts)
+        else:
+            idx = self._candidates(west, south, east, north)
+        lat, lon = self.lats[idx], self.lons[idx]
+        inside = (lat >= south) & (lat <= north)
+        inside &= ((lon >= west) | (lon <= east)) if west > east else ((lon >= west) & (lon <= east))
+        return np.sort(idx[inside])
@@ -0,0 +1,166 @@
+# station_catalog.py
+"""
+Catálogo de estaciones (OpenAQ /v3/locations, todas las páginas) en memoria, para mapas.
+
+- Columnas NumPy (id, name, locality, country, lat, lon) + spatial.GridIndex.
+- viewport: estaciones dentro de un bbox (opcionalmente de un país).
+- nearest: las k estaciones más cercanas a un punto (haversine sobre los candidatos de la grilla).
+- cluster: agrupamiento por celdas cuyo tamaño depende del zoom del mapa (celdas de ~cell_px
+  píxeles en Web Mercator), así el navegador dibuja un marcador por grupo y no miles.
+Se guarda en un .npz compartido por los workers, igual que latest_snapshot.LatestSnapshot.
+"""
+import os
+
+import numpy as np
+
+from spatial import GridIndex
+
+EARTH_KM = 6371.0088
+KM_PER_DEG = np.pi * EARTH_KM / 180
+
+
+def haversine_km(lat, lon, lats, lons):
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class StationCatalog:
+    COLUMNS = ("id", "name", "locality", "country", "lat", "lon")
+
+    def __init__(self, columns, refreshed_at, mtime=None):
+        self.refreshed_at = refreshed_at
+        self.mtime = mtime
+        for name in self.COLUMNS:
+            setattr(self, name, columns[name])
+        self.index = GridIndex(self.lat, self.lon)
+
+    def __len__(self):
+        return len(self.id)
+
+    @classmethod
+    def from_results(cls, results, refreshed_at):
+        """results de /locations; las locations sin coordenadas no se pueden ubicar y se descartan."""
+        rows = []
+        for loc in results:
+            coords = loc.get("coordinates") or {}
+            if coords.get("latitude") is None or coords.get("longitude") is None:
+                continue
+            rows.append((
+                loc["id"], loc.get("name") or "", loc.get("locality") or "",
+                ((loc.get("country") or {}).get("code") or "").upper(),
+                coords["latitude"], coords["longitude"],
+            ))
+        rows.sort()
+        cols = list(zip(*rows)) if rows else [()] * len(cls.COLUMNS)
+        dtypes = (np.int64, str, str, str, np.float64, np.float64)
+        return cls({name: np.asarray(c, dtype=t) for name, c, t in zip(cls.COLUMNS, cols, dtypes)}, refreshed_at)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, refreshed_at=self.refreshed_at, **{name: getattr(self, name) for name in self.COLUMNS})
+        os.replace(tmp, path)
+        self.mtime = os.path.getmtime(path)
+
+    @classmethod
+    def load(cls, path):
+        mtime = os.path.getmtime(path)
+        with np.load(path) as data:
+            return cls({name: data[name] for name in cls.COLUMNS}, float(data["refreshed_at"]), mtime=mtime)
+
+    def find(self, location_id):
+        """Índice de la estación con ese id (los ids están ordenados), o None si no está."""
+        i = int(np.searchsorted(self.id, location_id))
+        return i if i < len(self) and self.id[i] == location_id else None
+
+    def select(self, bbox=None, country=None):
+        """Índices (ordenados por id) dentro del bbox (oeste, sur, este, norte) y/o del país (ISO)."""
+        idx = self.index.query(*bbox) if bbox else np.arange(len(self))
+        if country:
+            idx = idx[self.country[idx] == country.upper()]
+        return idx
+
+    def nearest(self, lat, lon, k=5, max_km=None, country=None):
+        """(índices, distancias en km) de las k estaciones más cercanas, de la más cercana a la más lejana."""
+        if len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        # se agranda la caja hasta tener k candidatos; después se busca de nuevo con el radio del
+        # k-ésimo, porque en la caja inicial puede faltar alguno más cercano en diagonal
+        radius = self.index.cell
+        while True:
+            idx = self._around(lat, lon, radius, country)
+            if len(idx) >= k or radius >= 180:
+                break
+            radius *= 2
+        if len(idx):
+            dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+            reach = np.partition(dist, min(k, len(dist)) - 1)[min(k, len(dist)) - 1]
+            if max_km is not None:
+                reach = min(reach, max_km) if len(idx) >= k else max_km
+            idx = self._around(lat, lon, reach / KM_PER_DEG, country)
+        dist = haversine_km(lat, lon, self.lat[idx], self.lon[idx])
+        order = np.argsort(dist, kind="stable")[:k]
+        idx, dist = idx[order], dist[order]
+        if max_km is not None:
+            keep = dist <= max_km
+            idx, dist = idx[keep], dist[keep]
+        return idx, dist
+
+    def _around(self, lat, lon, radius_deg, country):
+        """Candidatos en la caja que contiene el círculo de radius_deg grados (de latitud) alrededor del punto."""
+        south, north = max(lat - radius_deg, -90.0), min(lat + radius_deg, 90.0)
+        cos = np.cos(np.radians(max(abs(south), abs(north))))
+        dlon = radius_deg / cos if cos > 1e-6 else 180.0
+        if dlon >= 180:
+            return self.select((-180.0, south, 180.0, north), country)
+        west, east = (lon - dlon + 180) % 360 - 180, (lon + dlon + 180) % 360 - 180
+        return self.select((west, south, east, north), country)
+
+    def records(self, idx, distances=None):
+        out = [
+            {"id": i, "name": n, "locality": loc, "country": c, "coordinates": {"latitude": la, "longitude": lo}}
+            for i, n, loc, c, la, lo in zip(
+                self.id[idx].tolist(), self.name[idx].tolist(), self.locality[idx].tolist(),
+                self.country[idx].tolist(), self.lat[idx].tolist(), self.lon[idx].tolist(),
+            )
+        ]
+        if distances is not None:
+            for rec, d in zip(out, distances.tolist()):
+                rec["distance_km"] = round(d, 3)
+        return out
+
+    def cluster(self, idx, zoom, cell_px=60, min_count=2):
+        """
+        Agrupa idx en celdas de cell_px píxeles al zoom dado (256 px por tile). Devuelve
+        (clusters, índices sueltos): cada cluster con centroide, cantidad y bbox de sus estaciones;
+        las celdas con menos de min_count estaciones se devuelven como estaciones sueltas.
+        """
+        if len(idx) == 0:
+            return [], idx
+        cell = 360.0 / (256 * 2 ** zoom) * cell_px
+        lat, lon = self.lat[idx], self.lon[idx]
+        cols = int(np.ceil(360 / cell))
+        keys = ((lat + 90) // cell).astype(np.int64) * cols + ((lon + 180) // cell).astype(np.int64)
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        grouped = counts[inverse] >= min_count
+        singles = idx[~grouped]
+
+        ids, cnt = np.unique(inverse[grouped], return_counts=True)
+        if len(ids) == 0:
+            return [], singles
+        order = np.argsort(inverse[grouped], kind="stable")
+        g_lat, g_lon = lat[grouped][order], lon[grouped][order]
+        starts = np.r_[0, np.cumsum(cnt)[:-1]]
+        mean_lat = np.add.reduceat(g_lat, starts) / cnt
+        mean_lon = np.add.reduceat(g_lon, starts) / cnt
+        bounds = zip(
+            np.minimum.reduceat(g_lon, starts).tolist(), np.minimum.reduceat(g_lat, starts).tolist(),
+            np.maximum.reduceat(g_lon, starts).tolist(), np.maximum.reduceat(g_lat, starts).tolist(),
+        )
+        clusters = [
+            {"latitude": la, "longitude": lo, "count": n, "bounds": list(b)}
+            for la, lo, n, b in zip(mean_lat.tolist(), mean_lon.tolist(), cnt.tolist(), bounds)
+        ]
+        return clusters, singles
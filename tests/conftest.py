@@ -0,0 +1,37 @@
+import importlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+BENCH = os.path.join(ROOT, "bench")
+
+
+@pytest.fixture
+def repo(monkeypatch):
+    """Módulos del repo (y de bench/) importables solo durante el test."""
+    monkeypatch.syspath_prepend(ROOT)
+    monkeypatch.syspath_prepend(BENCH)
+
+
+@pytest.fixture(scope="module")
+def app_module():
+    """app.py apuntando a un stub de OpenAQ local, sin hilos de fondo ni rate limit."""
+    with pytest.MonkeyPatch.context() as mp, tempfile.TemporaryDirectory() as tmp:
+        mp.syspath_prepend(ROOT)
+        mp.syspath_prepend(BENCH)
+        from stub_openaq import StubOpenAQ
+        with StubOpenAQ(total_rows=1000, latency=0) as stub:
+            env = dict(OPENAQ_BASE_V3=stub.base_url, DATA_DIR=tmp, UPSTREAM_RATE_PER_MIN="0",
+                       PARAMETERS_REFRESH="0", LATEST_REFRESH="0", STATIONS_REFRESH="0",
+                       PREFETCH_INTERVAL="0", METRICS_FLUSH="0", BACKGROUND_JOBS="0")
+            for key, value in env.items():
+                mp.setenv(key, value)
+            # cada módulo de tests importa su propio app.py, contra su propio stub
+            sys.modules.pop("app", None)
+            try:
+                yield importlib.import_module("app")
+            finally:
+                sys.modules.pop("app", None)
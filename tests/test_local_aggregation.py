@@ -0,0 +1,38 @@
+"""
+Rollups calculados en app.py desde las mediciones crudas (AGG_ENGINE local/fallback): solo con
+ventana acotada, y sin dar por completos los periodos que max_pages dejó a medias.
+
+    python -m pytest -q tests
+"""
+import pytest
+
+
+def test_local_engine_needs_a_window(app_module):
+    app = app_module
+    assert app._agg_candidates("days", "fallback") == (["days", "measurements/daily"], False)
+    assert app._agg_candidates("days", "fallback", "2020-01-01") == (["days"], True)
+    with pytest.raises(ValueError, match="last_days"):
+        app._agg_candidates("days", "local")
+    sensor = {"sensor_id": 7, "units": "µg/m³", "datetime_last": None}
+    payload, status = app.measurements_payload(1, 2, agg="days", engine="local", sensor=sensor)
+    assert status == 400 and not payload["success"]
+
+
+@pytest.mark.parametrize("store", [True, False])
+def test_truncated_measurements_drop_cut_periods(app_module, monkeypatch, tmp_path, store):
+    app = app_module
+    monkeypatch.setattr(app, "TS_STORE", app.TimeSeriesStore(str(tmp_path / "ts.sqlite")) if store else None)
+    # el stub tiene 1000 filas, una por hora desde 2020-01-01: con una página llena no se sabe si hay más
+    date_from, date_to = "2020-01-01T00:00:00Z", "2020-03-01T00:00:00Z"
+    cut = app.aggregate_sensor_series(11, "days", date_from, date_to, max_pages=1)
+    assert not cut["complete"]
+    assert {row["coverage"]["observedCount"] for row in cut["results"]} <= {24}    # ningún día a medias
+    if not store:
+        assert len(cut["results"]) == 41
+        assert cut["results"][-1]["period"]["datetimeFrom"]["utc"] == "2020-02-10T00:00:00Z"
+    else:
+        assert cut["results"] == []    # el tramo cortado no queda como sincronizado
+
+    full = app.aggregate_sensor_series(11, "days", date_from, date_to, max_pages=40)
+    assert full["complete"] and len(full["results"]) == 42
+    assert full["results"][-1]["coverage"]["observedCount"] == 16    # el último día sí está entero en OpenAQ
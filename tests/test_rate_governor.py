@@ -0,0 +1,116 @@
+"""
+Gobernador del rate limit (rate_governor.py) y su uso desde UpstreamClient:
+- la prioridad del bloque GOVERNOR.priority llega a las páginas que se piden en PAGE_POOL;
+- bulk espera en la cola (sin gastar el presupuesto HTTP) mientras se atiende a interactive;
+- las corutinas de asgi.py toman turno en la misma cola que los hilos (y no se cuelan).
+
+    python -m pytest -q tests
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+
+@pytest.fixture
+def governor_cls(repo):
+    from rate_governor import RateGovernor
+    return RateGovernor
+
+
+def test_priority_follows_submit_into_pool(governor_cls):
+    import instrumentation
+    governor = governor_cls(rate=0, burst=1)
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        with governor.priority("background"):
+            inside = instrumentation.submit(pool, governor.current_priority, "bulk").result()
+        outside = instrumentation.submit(pool, governor.current_priority, "bulk").result()
+    assert inside == "background"
+    assert outside == "bulk"
+
+
+def test_pooled_page_fetch_keeps_priority(app_module, monkeypatch):
+    app = app_module
+    seen = []
+    priority_of = app.upstream.priority_of
+
+    def record(endpoint):
+        priority = priority_of(endpoint)
+        seen.append((threading.current_thread().name, priority))
+        return priority
+
+    monkeypatch.setattr(app.upstream, "priority_of", record)
+    with app.GOVERNOR.priority("background"):
+        info = app.call_sensor_endpoint(7, "measurements", {"limit": 100}, max_pages=5, parallel=True)
+
+    assert info["ok"] and len(info["results"]) == 500
+    pooled = [priority for name, priority in seen if name.startswith("openaq-page")]
+    assert len(pooled) == 4
+    assert set(pooled) == {"background"}
+
+
+def test_bulk_keeps_waiting_while_interactive_is_served(app_module, governor_cls):
+    app = app_module
+    # reserva de bulk: 0.6 tokens; mientras interactive pida sin parar, bulk no alcanza
+    governor = governor_cls(rate=4, burst=2)
+    client = app.UpstreamClient(app.HEADERS, governor=governor, default_budget=0.3,
+                                budgets={"/locations/{id}/latest": 5},
+                                priorities={"/locations/{id}/latest": "interactive"}, queue_timeout=10)
+    interactive = []
+    stop = time.monotonic() + 1.2
+
+    def serve_interactive():
+        while time.monotonic() < stop:
+            interactive.append(client.get(f"{app.BASE_V3}/locations/7/latest").status_code)
+
+    worker = threading.Thread(target=serve_interactive)
+    worker.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    bulk = client.get(f"{app.BASE_V3}/sensors/7/measurements", params={"limit": 10})
+    waited = time.monotonic() - start
+    worker.join()
+
+    assert bulk.status_code == 200
+    assert waited > 1.0    # mucho más que el presupuesto de 0.3 s
+    assert len(interactive) >= 3 and set(interactive) == {200}
+    classes = governor.stats()["classes"]
+    assert classes["bulk"]["granted"] == 1 and classes["bulk"]["timeouts"] == 0
+
+
+def test_async_waiter_keeps_its_place_in_the_queue(governor_cls):
+    # bucket casi sin recarga: los turnos salen de tokens que "deja otro worker" a mano
+    governor = governor_cls(rate=0.01, burst=1)
+    assert governor.acquire("interactive")
+    order = []
+    queued = threading.Event()
+
+    def sync_waiter():
+        queued.set()
+        governor.acquire("interactive", timeout=3)
+        order.append("sync")
+
+    async def async_waiter():
+        await asyncio.sleep(0.25)
+        # otro worker devuelve un token mientras el primero de la cola (el hilo) duerme
+        governor._bucket.update(lambda tokens, last: (1.0, time.time()))
+        granted = await governor.acquire_async("interactive", timeout=1.0)
+        order.append("async" if granted else "async timeout")
+
+    thread = threading.Thread(target=sync_waiter)
+    thread.start()
+    queued.wait()
+    asyncio.run(async_waiter())
+    thread.join()
+    # el hilo llegó antes: el token es suyo y la corutina no se cuela
+    assert order == ["sync", "async timeout"]
+
+
+def test_async_waiter_leaves_queue_on_timeout(governor_cls):
+    governor = governor_cls(rate=0.5, burst=1)
+    assert governor.acquire("interactive")
+    assert asyncio.run(governor.acquire_async("interactive", timeout=0.1)) is False
+    assert governor.acquire("interactive", timeout=3)
+    assert governor.stats()["classes"]["interactive"]["queued"] == 0
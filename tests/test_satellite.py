@@ -0,0 +1,121 @@
+"""
+Lectores de grilla de satellite.py sobre archivos sintéticos (bench/grid_files.py): valores
+muestreados, nodata -> NaN, puntos fuera de la grilla, estadísticas de bbox y formatos rechazados.
+
+    python -m pytest -q tests
+"""
+import numpy as np
+import pytest
+
+ROWS, COLS, CELL = 90, 180, 2.0    # grilla global norte-arriba desde (-180, 90)
+NODATA = -9999.0
+LAYOUTS = {
+    "2024-06-01.tif": {"kind": "geotiff"},
+    "2024-06-02.tif": {"kind": "geotiff", "tile": 32},
+    "2024-06-03.tif": {"kind": "geotiff", "bigtiff": True},
+    "2024-06-04.nc": {"kind": "netcdf"},
+}
+
+
+@pytest.fixture
+def modules(repo):
+    import grid_files
+    import satellite
+    return satellite, grid_files
+
+
+@pytest.fixture
+def data():
+    values = np.random.default_rng(0).random((ROWS, COLS), dtype=np.float32) * 100
+    values[:3] = NODATA    # sin dato en el polo norte
+    return values
+
+
+@pytest.fixture
+def archive(modules, data, tmp_path):
+    satellite, grid_files = modules
+    product = tmp_path / "no2"
+    product.mkdir()
+    for name, layout in LAYOUTS.items():
+        path = str(product / name)
+        if layout["kind"] == "geotiff":
+            grid_files.write_geotiff(path, data, -180.0, 90.0, CELL, tile=layout.get("tile"), nodata=NODATA,
+                                     bigtiff=layout.get("bigtiff", False))
+        else:
+            lats = 90 - CELL * (np.arange(ROWS) + 0.5)
+            lons = -180 + CELL * (np.arange(COLS) + 0.5)
+            grid_files.write_netcdf(path, data[None], lats, lons, NODATA)
+    return satellite.SatelliteArchive(str(tmp_path))
+
+
+def _expected(data, lats, lons):
+    rows = np.floor((90 - np.asarray(lats)) / CELL).astype(int)
+    cols = np.floor((np.asarray(lons) + 180) / CELL).astype(int)
+    out = data[rows, cols].astype(np.float64)
+    out[out == NODATA] = np.nan
+    return out
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_sample_matches_cells(archive, data, name):
+    date = name.split(".")[0]
+    rng = np.random.default_rng(1)
+    lats, lons = rng.uniform(-89.9, 83.9, 500), rng.uniform(-179.9, 179.9, 500)
+    got = archive.sample("no2", date, lats, lons)
+    np.testing.assert_array_equal(got, _expected(data, lats, lons))
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_nodata_and_out_of_bounds_are_nan(archive, data, name):
+    date = name.split(".")[0]
+    lats = np.array([89.0, 80.0, 95.0, -91.0, 10.0])
+    lons = np.array([0.0, 0.0, 0.0, 0.0, 181.0])
+    got = archive.sample("no2", date, lats, lons)
+    assert np.isnan(got[0])    # fila de nodata
+    assert got[1] == pytest.approx(_expected(data, lats[1:2], lons[1:2])[0])
+    assert np.isnan(got[2:]).all()    # fuera de la grilla
+
+
+@pytest.mark.parametrize("name", list(LAYOUTS))
+def test_window_stats(archive, data, name):
+    date = name.split(".")[0]
+    west, south, east, north = -10.0, -20.0, 30.0, 88.0
+    lat = 90 - CELL * (np.arange(ROWS) + 0.5)
+    lon = -180 + CELL * (np.arange(COLS) + 0.5)
+    block = data[np.ix_((lat >= south) & (lat <= north), (lon >= west) & (lon <= east))].astype(np.float64)
+    valid = block[block != NODATA]
+    stats = archive.window("no2", date, (west, south, east, north))
+    assert stats["cells"] == block.size
+    assert stats["count"] == valid.size < block.size
+    assert stats["mean"] == pytest.approx(valid.mean())
+    assert stats["min"] == pytest.approx(valid.min())
+    assert stats["max"] == pytest.approx(valid.max())
+
+
+@pytest.mark.parametrize("options, message", [
+    ({"compression": 5}, "comprimido"),
+    ({"order": ">"}, "big-endian"),
+])
+def test_rejects_unsupported_geotiff(modules, data, tmp_path, options, message):
+    satellite, grid_files = modules
+    path = str(tmp_path / "grid.tif")
+    grid_files.write_geotiff(path, data, -180.0, 90.0, CELL, **options)
+    with pytest.raises(ValueError, match=message):
+        satellite.open_grid(path)
+
+
+def test_rejects_64bit_netcdf_without_netcdf4(modules, data, tmp_path, monkeypatch):
+    satellite, grid_files = modules
+    monkeypatch.setattr(satellite, "netCDF4", None)
+    path = str(tmp_path / "grid.nc")
+    lats = 90 - CELL * (np.arange(ROWS) + 0.5)
+    lons = -180 + CELL * (np.arange(COLS) + 0.5)
+    grid_files.write_netcdf(path, data[None], lats, lons, NODATA, version=2)
+    with pytest.raises(ValueError, match="netCDF4"):
+        satellite.open_grid(path)
+
+
+@pytest.mark.parametrize("product", [".", "..", "../no2", "no2/.."])
+def test_product_names_stay_inside_root(archive, product):
+    with pytest.raises(KeyError):
+        archive.sample(product, "2024-06-01", [0.0], [0.0])
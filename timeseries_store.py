@@ -0,0 +1,159 @@
+# timeseries_store.py
+"""
+Almacén local (SQLite) del histórico de mediciones por sensor.
+
+Cada serie se identifica por (sensor_id, kind), donde kind es el sufijo del endpoint
+de OpenAQ (measurements, hours, days, days/monthly, ...). Por serie guardamos:
+  - las filas (ts epoch UTC, value, unit, parameter) en una tabla WITHOUT ROWID
+    ordenada por (sensor_id, kind, ts), así un rango es un scan contiguo del índice;
+  - la cobertura sincronizada: uno o más intervalos [covered_from, covered_to] disjuntos,
+    para saber qué parte del rango pedido ya se consultó en OpenAQ (aunque no haya devuelto
+    datos). Una ventana lejos de lo ya cubierto agrega su propio intervalo, sin rellenar el hueco.
+Las mediciones pasadas no cambian, así que solo hace falta pedir lo que falta.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    sensor_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    value REAL,
+    unit TEXT,
+    parameter TEXT,
+    PRIMARY KEY (sensor_id, kind, ts)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS coverage_ranges (
+    sensor_id INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    covered_from INTEGER NOT NULL,
+    covered_to INTEGER NOT NULL,
+    synced_at INTEGER NOT NULL,
+    PRIMARY KEY (sensor_id, kind, covered_from)
+) WITHOUT ROWID;
+"""
+
+
+def to_epoch(value):
+    """ISO-8601 (con o sin 'Z') o datetime -> segundos epoch UTC (int)."""
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def to_iso(ts):
+    """Segundos epoch UTC -> 'YYYY-MM-DDTHH:MM:SSZ'."""
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class TimeSeriesStore:
+    """
+    Una conexión SQLite por hilo (modo WAL), así varios hilos y varios workers
+    de gunicorn pueden leer a la vez sobre el mismo archivo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._local = threading.local()
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def coverage(self, sensor_id, kind):
+        """Intervalos sincronizados [(covered_from, covered_to, synced_at), ...] en orden, disjuntos."""
+        return self._conn().execute(
+            "SELECT covered_from, covered_to, synced_at FROM coverage_ranges WHERE sensor_id = ? AND kind = ? ORDER BY covered_from",
+            (sensor_id, kind),
+        ).fetchall()
+
+    def upsert(self, sensor_id, kind, rows):
+        """rows: iterable de (ts_epoch, value, unit, parameter). Devuelve cuántas filas se escribieron."""
+        conn = self._conn()
+        with conn:
+            cur = conn.executemany(
+                "INSERT OR REPLACE INTO series (sensor_id, kind, ts, value, unit, parameter) VALUES (?, ?, ?, ?, ?, ?)",
+                ((sensor_id, kind, ts, value, unit, parameter) for ts, value, unit, parameter in rows),
+            )
+        return cur.rowcount
+
+    def extend_coverage(self, sensor_id, kind, covered_from, covered_to):
+        """Agrega [covered_from, covered_to] a la cobertura, uniéndolo con los intervalos que toca."""
+        conn = self._conn()
+        now = int(time.time())
+        with conn:
+            touching = conn.execute(
+                """
+                SELECT covered_from, covered_to, synced_at FROM coverage_ranges
+                WHERE sensor_id = ? AND kind = ? AND covered_from <= ? AND covered_to >= ?
+                """,
+                (sensor_id, kind, covered_to, covered_from),
+            ).fetchall()
+            new_from = min([covered_from] + [r[0] for r in touching])
+            new_to = max([covered_to] + [r[1] for r in touching])
+            # synced_at es de cuándo se sincronizó el final del intervalo
+            synced_at = now if covered_to >= new_to else max(r[2] for r in touching if r[1] == new_to)
+            conn.executemany(
+                "DELETE FROM coverage_ranges WHERE sensor_id = ? AND kind = ? AND covered_from = ?",
+                ((sensor_id, kind, r[0]) for r in touching),
+            )
+            conn.execute(
+                "INSERT INTO coverage_ranges (sensor_id, kind, covered_from, covered_to, synced_at) VALUES (?, ?, ?, ?, ?)",
+                (sensor_id, kind, new_from, new_to, synced_at),
+            )
+
+    def covers(self, sensor_id, kind, ts_from, ts_to):
+        """True si [ts_from, ts_to] está entero dentro de un intervalo sincronizado."""
+        return self._conn().execute(
+            "SELECT 1 FROM coverage_ranges WHERE sensor_id = ? AND kind = ? AND covered_from <= ? AND covered_to >= ?",
+            (sensor_id, kind, ts_from, ts_to),
+        ).fetchone() is not None
+
+    def query(self, sensor_id, kind, ts_from, ts_to):
+        """Filas [(ts, value, unit, parameter), ...] en orden ascendente dentro de [ts_from, ts_to]."""
+        return self._conn().execute(
+            "SELECT ts, value, unit, parameter FROM series WHERE sensor_id = ? AND kind = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+            (sensor_id, kind, ts_from, ts_to),
+        ).fetchall()
+
+    def iter_query(self, sensor_id, kind, ts_from, ts_to, batch=1000):
+        """Como query(), pero leyendo del cursor por lotes de `batch` filas (memoria constante)."""
+        cur = self._conn().execute(
+            "SELECT ts, value, unit, parameter FROM series WHERE sensor_id = ? AND kind = ? AND ts BETWEEN ? AND ? ORDER BY ts",
+            (sensor_id, kind, ts_from, ts_to),
+        )
+        try:
+            while True:
+                rows = cur.fetchmany(batch)
+                if not rows:
+                    return
+                yield rows
+        finally:
+            cur.close()
+
+    def stats(self):
+        conn = self._conn()
+        rows = conn.execute("SELECT COUNT(*) FROM series").fetchone()[0]
+        series = conn.execute("SELECT COUNT(*) FROM (SELECT DISTINCT sensor_id, kind FROM coverage_ranges)").fetchone()[0]
+        return {"path": self.path, "rows": rows, "series": series}
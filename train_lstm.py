@@ -0,0 +1,129 @@
+# train_lstm.py
+"""
+Entrenamiento del LSTM fuera del notebook, sobre lstm_dataset (ventanas sin copias, lotes vectorizados).
+
+Guarda un checkpoint que forecast.py carga directamente: state_dict + config + scalers MinMax.
+Por época imprime la pérdida, el MSE de validación, el tiempo y el pico de memoria (RSS).
+
+Uso:
+    python train_lstm.py --csv aire_2000_2024_merged.csv --epochs 100 --out LSTM_PREDICTIONS.pth
+"""
+import argparse
+import random
+import resource
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torch.optim as optim
+
+import lstm_dataset
+from forecast import FEATURES, SEQ_LEN, Net
+
+
+def set_seed(seed):
+    torch.manual_seed(seed)
+    np.random.seed(seed)
+    random.seed(seed)
+
+
+def peak_rss_mb():
+    # Linux: ru_maxrss en KiB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def evaluate(net, loader, criterion):
+    net.eval()
+    total = 0.0
+    n = 0
+    with torch.inference_mode():
+        for seqs, labels in loader:
+            total += criterion(net(seqs), labels).item() * len(labels)
+            n += len(labels)
+    return total / n if n else float("nan")
+
+
+def train(net, train_loader, val_loader, lr, epochs, on_epoch=None):
+    """Bucle de entrenamiento del notebook. on_epoch(epoch, val_mse) puede cortar devolviendo True."""
+    criterion = nn.MSELoss()
+    optimizer = optim.Adam(net.parameters(), lr=lr)
+    best = float("inf")
+    best_state = None
+    for epoch in range(epochs):
+        t0 = time.perf_counter()
+        net.train()
+        total_loss = 0.0
+        for seqs, labels in train_loader:
+            optimizer.zero_grad()
+            loss = criterion(net(seqs), labels)
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item()
+        val_mse = evaluate(net, val_loader, criterion)
+        if val_mse < best:
+            best = val_mse
+            best_state = {k: v.detach().clone() for k, v in net.state_dict().items()}
+        print(f"Epoch {epoch + 1}/{epochs}, Train avg Loss: {total_loss / max(len(train_loader), 1):.4f}, "
+              f"Val MSE: {val_mse:.4f}, {time.perf_counter() - t0:.1f}s, RSS pico {peak_rss_mb():.0f} MB", flush=True)
+        if on_epoch is not None and on_epoch(epoch, val_mse):
+            break
+    return best, best_state
+
+
+def make_checkpoint(state_dict, scalers, seq_len, **config):
+    """
+    Checkpoint en el formato que entienden forecast.load_checkpoint y forecast.publish_checkpoint.
+    Solo tensores y tipos planos (dict, list, str, int, float): se carga con weights_only=True.
+    """
+    config = {k: v.item() if isinstance(v, (np.generic, torch.Tensor)) else v for k, v in config.items()}
+    return {
+        "state_dict": state_dict,
+        "config": dict(config, seq_len=int(seq_len), features=list(FEATURES)),
+        "scalers": scalers.to_dict(),
+        "version": time.strftime("%Y%m%d%H%M%S", time.gmtime()),
+    }
+
+
+def save_checkpoint(path, state_dict, scalers, seq_len, **config):
+    torch.save(make_checkpoint(state_dict, scalers, seq_len, **config), path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True, help="CSV combinado con time + " + ",".join(FEATURES))
+    parser.add_argument("--out", default="LSTM_PREDICTIONS.pth")
+    parser.add_argument("--epochs", type=int, default=100)
+    parser.add_argument("--seq-len", type=int, default=SEQ_LEN)
+    parser.add_argument("--hidden-size", type=int, default=96)
+    parser.add_argument("--num-layers", type=int, default=1)
+    parser.add_argument("--lr", type=float, default=0.003334160704792259)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=None, help="hilos de torch (por defecto los de torch)")
+    parser.add_argument("--seed", type=int, default=23)
+    args = parser.parse_args()
+
+    set_seed(args.seed)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    _, raw = lstm_dataset.load_merged(args.csv)
+    scalers = lstm_dataset.fit_scalers(raw)
+    data = lstm_dataset.scale(raw, scalers)
+    data_train, data_val, _ = lstm_dataset.split(data)
+    print(f"{len(data)} filas, RSS pico tras cargar {peak_rss_mb():.0f} MB")
+
+    train_loader = lstm_dataset.WindowLoader(
+        lstm_dataset.WindowDataset(data_train, args.seq_len), args.batch_size, shuffle=True, seed=args.seed
+    )
+    val_loader = lstm_dataset.WindowLoader(lstm_dataset.WindowDataset(data_val, args.seq_len), args.batch_size)
+
+    net = Net(hidden_size=args.hidden_size, num_layers=args.num_layers)
+    best, state = train(net, train_loader, val_loader, args.lr, args.epochs)
+    save_checkpoint(args.out, state, scalers, args.seq_len, hidden_size=args.hidden_size, num_layers=args.num_layers,
+                    val_mse=best)
+    print(f"Modelo guardado en {args.out} con MSE de validación {best:.4f}")
+
+
+if __name__ == "__main__":
+    main()
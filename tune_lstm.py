@@ -0,0 +1,153 @@
+# tune_lstm.py
+"""
+Búsqueda de hiperparámetros del LSTM con Optuna (la celda "TUNEAR" del notebook), en paralelo.
+
+- Estudio persistente en SQLite (por defecto data/optuna.sqlite): si el proceso muere, se
+  vuelve a lanzar el mismo comando y sigue donde quedó (load_if_exists). --trials es el total
+  del estudio, contando los trials que ya terminaron (completos o podados): solo se lanzan los
+  que faltan, repartidos entre los workers, y si no falta ninguno no se entrena nada.
+- Cada trial en curso late cada --heartbeat segundos; uno que quedó RUNNING porque su proceso
+  murió pasa a FAIL en la corrida siguiente y se vuelve a encolar (RetryFailedTrialCallback).
+- Los trials corren en un pool de procesos; cada proceso fija sus hilos de torch/OpenMP
+  (--threads-per-trial) para que workers x hilos no supere los núcleos.
+- Los datos escalados se escriben una vez a un .npy y cada proceso lo abre con mmap: todos los
+  trials comparten la misma memoria y cambiar seq_len solo crea otra vista (ver lstm_dataset).
+
+Uso:
+    python tune_lstm.py --csv aire_2000_2024_merged.csv --trials 30 --workers 4 --threads-per-trial 2
+"""
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import optuna
+
+import lstm_dataset
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+THREAD_ENV = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS")
+COUNTED = (optuna.trial.TrialState.COMPLETE, optuna.trial.TrialState.PRUNED)
+
+
+def _storage(url, heartbeat):
+    return optuna.storages.RDBStorage(
+        url,
+        heartbeat_interval=heartbeat,
+        failed_trial_callback=optuna.storages.RetryFailedTrialCallback(max_retry=2),
+    )
+
+
+def _prepare_data(csv_path, out_path):
+    """Escala con los MinMax de todo el dataset (como el notebook) y guarda el array para los workers."""
+    _, raw = lstm_dataset.load_merged(csv_path)
+    scalers = lstm_dataset.fit_scalers(raw)
+    np.save(out_path, lstm_dataset.scale(raw, scalers))
+
+
+def objective_factory(data, epochs, batch_size):
+    import torch
+
+    from forecast import Net
+    from train_lstm import train
+
+    data_train, data_val, _ = lstm_dataset.split(data)
+
+    def objective(trial):
+        hidden_size = trial.suggest_int("hidden_size", 32, 128, step=32)
+        num_layers = trial.suggest_int("num_layers", 1, 4)
+        lr = trial.suggest_float("lr", 1e-4, 1e-2, log=True)
+        seq_len = trial.suggest_int("seq_len", 100, 400, step=50)
+
+        torch.manual_seed(trial.number)
+        train_loader = lstm_dataset.WindowLoader(
+            lstm_dataset.WindowDataset(data_train, seq_len), batch_size, shuffle=True, seed=trial.number
+        )
+        val_loader = lstm_dataset.WindowLoader(lstm_dataset.WindowDataset(data_val, seq_len), batch_size)
+
+        def on_epoch(epoch, val_mse):
+            trial.report(val_mse, epoch)
+            # ---- Poda temprana ----
+            if trial.should_prune():
+                raise optuna.TrialPruned()
+
+        best, _ = train(Net(hidden_size=hidden_size, num_layers=num_layers), train_loader, val_loader, lr, epochs, on_epoch)
+        return best
+
+    return objective
+
+
+def _worker(storage_url, heartbeat, study_name, data_path, n_trials, epochs, batch_size, threads):
+    import torch
+
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+    study = optuna.load_study(study_name=study_name, storage=_storage(storage_url, heartbeat))
+    objective = objective_factory(np.load(data_path, mmap_mode="r"), epochs, batch_size)
+    # n_trials es la parte de este worker de lo que falta: entre todos no pasan de --trials
+    study.optimize(objective, n_trials=n_trials)
+
+
+def main():
+    cpus = os.cpu_count() or 1
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--csv", required=True, help="CSV combinado (ver lstm_dataset.load_merged)")
+    parser.add_argument("--storage", default="sqlite:///" + os.path.join(ROOT, "data", "optuna.sqlite"))
+    parser.add_argument("--study-name", default="lstm_8_parametros")
+    parser.add_argument("--trials", type=int, default=30, help="total de trials del estudio")
+    parser.add_argument("--epochs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads-per-trial", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=None, help="por defecto núcleos / hilos por trial")
+    parser.add_argument("--heartbeat", type=int, default=60, help="segundos entre latidos de un trial en curso")
+    args = parser.parse_args()
+
+    workers = args.workers or max(1, cpus // args.threads_per_trial)
+    if workers * args.threads_per_trial > cpus:
+        print(f"Aviso: {workers} workers x {args.threads_per_trial} hilos > {cpus} núcleos")
+
+    os.makedirs(os.path.join(ROOT, "data"), exist_ok=True)
+    study = optuna.create_study(
+        study_name=args.study_name,
+        storage=_storage(args.storage, args.heartbeat),
+        direction="minimize",
+        load_if_exists=True,
+    )
+    # trials RUNNING de una corrida que murió: a FAIL (y de nuevo a la cola) antes de contar
+    optuna.storages.fail_stale_trials(study)
+    finished = sum(t.state in COUNTED for t in study.trials)
+    remaining = args.trials - finished
+    if remaining <= 0:
+        print(f"Estudio {args.study_name}: {finished} trials terminados, objetivo {args.trials} ya cumplido")
+        if any(t.state == optuna.trial.TrialState.COMPLETE for t in study.trials):
+            print(study.best_params, "val MSE", study.best_value)
+        return
+    workers = min(workers, remaining)
+    print(f"Estudio {args.study_name}: {finished} trials previos, objetivo {args.trials}, "
+          f"{workers} workers x {args.threads_per_trial} hilos")
+
+    data_path = os.path.join(ROOT, "data", "lstm_scaled.float32.npy")
+    _prepare_data(args.csv, data_path)
+
+    # spawn: cada worker arranca limpio y hereda estas variables, que OpenMP/MKL leen al cargar torch
+    for var in THREAD_ENV:
+        os.environ[var] = str(args.threads_per_trial)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        futures = [
+            pool.submit(_worker, args.storage, args.heartbeat, args.study_name, data_path,
+                        remaining // workers + (i < remaining % workers), args.epochs, args.batch_size,
+                        args.threads_per_trial)
+            for i in range(workers)
+        ]
+        for fut in futures:
+            fut.result()
+
+    study = optuna.load_study(study_name=args.study_name, storage=_storage(args.storage, args.heartbeat))
+    print("Mejores hiperparámetros encontrados:")
+    print(study.best_params, "val MSE", study.best_value)
+
+
+if __name__ == "__main__":
+    main()
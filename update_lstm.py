@@ -0,0 +1,159 @@
+# update_lstm.py
+"""
+Actualización incremental del LSTM a medida que llegan mediciones nuevas (para cron / timer).
+
+1. Trae de OpenAQ, con los mismos helpers de la API (get_location_sensors + call_sensor_endpoint),
+   los rollups de pm25/no2/o3/co de la estación posteriores a la última fila del TrainingStore.
+2. Completa las variables meteorológicas (T2M, U2M, V2M, PS) desde --meteo-csv si se pasa
+   (p. ej. una exportación de NASA POWER con columnas time + esas variables); si no hay dato
+   para un periodo se repite el último conocido.
+3. Agrega las filas al TrainingStore y amplía solo los min/max de MinMax que cambiaron.
+4. Hace fine-tuning desde el checkpoint actual sobre una ventana deslizante con las últimas filas
+   y, si no empeora el MSE de validación, publica una versión nueva (forecast.publish_checkpoint).
+   Los workers que sirven /api/forecast la toman en caliente a través de current.json.
+
+Uso:
+    python update_lstm.py --location-id 2178 --csv aire_2000_2024_merged.csv --meteo-csv power.csv
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+import torch
+import torch.nn as nn
+
+import lstm_dataset
+from forecast import FEATURES, load_checkpoint, publish_checkpoint, read_current
+from train_lstm import evaluate, make_checkpoint, train
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# columna de entrenamiento -> código del parámetro en OpenAQ
+POLLUTANTS = {"pm25_avg": "pm25", "no2_avg": "no2", "o3_avg": "o3", "co_avg": "co"}
+METEO = [c for c in FEATURES if c not in POLLUTANTS]
+SUFFIXES = ("days", "hours")
+
+
+def fetch_pollutants(location_id, suffix, since_ts):
+    """{ts: {columna: valor}} con los rollups de OpenAQ desde since_ts (exclusivo)."""
+    # solo los helpers de la API: sin los hilos de refresco/prefetch de un worker
+    os.environ.setdefault("BACKGROUND_JOBS", "0")
+    import app as backend
+    import normalize
+    from timeseries_store import to_iso
+
+    sensors = backend.get_location_sensors(location_id)
+    if not sensors:
+        raise RuntimeError(f"la estación {location_id} no tiene sensores")
+    rows = {}
+    for column, code in POLLUTANTS.items():
+        candidates = [s for s in sensors if s["code"] == code]
+        if not candidates:
+            raise RuntimeError(f"la estación {location_id} no mide {code}")
+        sensor = backend._best_sensor(candidates, candidates[0]["parameter_id"])
+        params = {"date_from": to_iso(since_ts + 1)} if since_ts is not None else {}
+        info = backend.call_sensor_endpoint(sensor["sensor_id"], suffix, params=params, max_pages=40)
+        if not info.get("ok"):
+            raise RuntimeError(f"{code}: {info.get('status')} {info.get('text')}")
+        for ts, value, _, _ in normalize.store_rows(info["results"]):
+            if value is not None and (since_ts is None or ts > since_ts):
+                rows.setdefault(ts, {})[column] = value
+    return rows
+
+
+def load_meteo(path):
+    if not path:
+        return {}
+    df = pd.read_csv(path, usecols=["time", *METEO])
+    ts = lstm_dataset.epoch_seconds(df["time"])
+    return {int(t): row for t, row in zip(ts, df[METEO].to_numpy(dtype=np.float32))}
+
+
+def build_rows(pollutants, meteo, last_meteo):
+    """Filas completas (ts, FEATURES) ordenadas; las que no tienen los 4 contaminantes se descartan."""
+    ts_out, data = [], []
+    for ts in sorted(pollutants):
+        values = pollutants[ts]
+        if len(values) < len(POLLUTANTS):
+            continue
+        if ts in meteo:
+            last_meteo = meteo[ts]
+        row = dict(zip(METEO, last_meteo))
+        row.update(values)
+        ts_out.append(ts)
+        data.append([row[c] for c in FEATURES])
+    return np.asarray(ts_out, dtype=np.int64), np.asarray(data, dtype=np.float32).reshape(-1, len(FEATURES))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--location-id", type=int, required=True)
+    parser.add_argument("--suffix", default="days", choices=SUFFIXES, help="rollup de OpenAQ")
+    parser.add_argument("--store", default=os.path.join(ROOT, "data", "lstm_train.sqlite"))
+    parser.add_argument("--csv", help="CSV combinado para sembrar el store la primera vez")
+    parser.add_argument("--meteo-csv", help="CSV con time + " + ",".join(METEO))
+    parser.add_argument("--models-dir", default=os.path.join(ROOT, "data", "models"))
+    parser.add_argument("--base", default=os.path.join(ROOT, "LSTM_PREDICTIONS.pth"),
+                        help="checkpoint inicial si todavía no hay versiones publicadas")
+    parser.add_argument("--scalers", default=os.path.join(ROOT, "LSTM_SCALERS.json"))
+    parser.add_argument("--window", type=int, default=730, help="filas recientes para el fine-tuning")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--lr", type=float, default=3e-4)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--keep", type=int, default=5, help="versiones que se conservan")
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    store = lstm_dataset.TrainingStore(args.store)
+    if len(store) == 0 and args.csv:
+        store.import_csv(args.csv)
+        print(f"Store sembrado con {len(store)} filas de {args.csv}")
+
+    last_ts = store.last_ts()
+    _, tail = store.tail(1)
+    last_meteo = tail[-1][[FEATURES.index(c) for c in METEO]] if len(tail) else np.full(len(METEO), np.nan)
+    ts, new = build_rows(fetch_pollutants(args.location_id, args.suffix, last_ts), load_meteo(args.meteo_csv), last_meteo)
+    if len(new) == 0:
+        print("Sin filas nuevas completas; no hay nada que actualizar")
+        return
+    if np.isnan(new).any():
+        raise SystemExit("Faltan variables meteorológicas y no hay valores previos: pasar --meteo-csv")
+    store.append(ts, new)
+    print(f"{len(new)} filas nuevas ({pd.to_datetime(ts[0], unit='s')} .. {pd.to_datetime(ts[-1], unit='s')})")
+
+    base = read_current(os.path.join(args.models_dir, "current.json")) or args.base
+    net, scalers, seq_len, version = load_checkpoint(base, args.scalers)
+    scalers, changed = scalers.updated(new)
+    if changed:
+        print("Rango MinMax actualizado en:", ", ".join(changed))
+
+    _, recent = store.tail(args.window + seq_len)
+    data = lstm_dataset.scale(recent, scalers)
+    # validación = el tramo más reciente (10 %), con sus seq_len filas de contexto
+    n_val = max(len(data) // 10, 1)
+    train_loader = lstm_dataset.WindowLoader(
+        lstm_dataset.WindowDataset(data[:-n_val], seq_len), args.batch_size, shuffle=True
+    )
+    val_loader = lstm_dataset.WindowLoader(lstm_dataset.WindowDataset(data[-(n_val + seq_len):], seq_len), args.batch_size)
+    if len(train_loader.dataset) == 0 or len(val_loader.dataset) == 0:
+        raise SystemExit(f"Hacen falta más de {seq_len + n_val} filas en el store para hacer fine-tuning")
+
+    before = evaluate(net, val_loader, nn.MSELoss())
+    best, state = train(net, train_loader, val_loader, args.lr, args.epochs)
+    print(f"Val MSE: {before:.5f} ({version}) -> {best:.5f}")
+    if best > before:
+        print("El fine-tuning no mejora la validación; se mantiene", version)
+        return
+
+    checkpoint = make_checkpoint(
+        state, scalers, seq_len,
+        hidden_size=net.hidden_size, num_layers=net.num_layers, val_mse=best, parent=version,
+    )
+    path = publish_checkpoint(args.models_dir, checkpoint, keep=args.keep)
+    print(f"Versión {checkpoint['version']} publicada en {path}")
+
+
+if __name__ == "__main__":
+    main()